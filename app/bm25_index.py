@@ -0,0 +1,294 @@
+"""In-process BM25 keyword search over nec_codes sections and nec_chunks"""
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.config import settings
+
+
+POSTINGS_FILE = "nec_bm25.npz"
+META_FILE = "nec_bm25.json"
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant (from the original RRF paper)
+RRF_K = 60
+
+# A query keeps at most this many of its terms, the rarest in the corpus (a
+# ~2k-character diagram description is mostly common words)
+MAX_QUERY_TERMS = 32
+
+# Section numbers ("240.4", "250.30"), relay numbers ("50/51") and plain words
+_TOKEN = re.compile(r"[a-z0-9]+(?:[./][a-z0-9]+)*")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or shall that the this "
+    "to was were which with not no any all other such than be been being into".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased terms; section references like 240.4 and 50/51 stay single terms"""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index with precomputed BM25 impacts.
+
+    Each posting stores its term's full BM25 contribution (idf and length
+    normalization included), so a query is one concatenation of the query
+    terms' postings and one `np.bincount`. Documents are grouped by
+    `nec_version` at build time, so a version filter is a contiguous slice.
+
+    `docs` holds ids and headings only (section or chunk_id, article, title,
+    nec_version); result text is looked up by the caller.
+    """
+
+    def __init__(
+        self,
+        vocabulary: dict[str, int],
+        indptr: np.ndarray,
+        doc_ids: np.ndarray,
+        impacts: np.ndarray,
+        docs: list[dict],
+        version_ranges: dict[str, tuple[int, int]]
+    ):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.docs = docs
+        self.version_ranges = version_ranges
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @classmethod
+    def build(cls, docs: list[dict], texts: list[str]) -> "BM25Index":
+        """
+        Index documents (already grouped by nec_version)
+
+        Args:
+            docs: Document metadata returned with results (no text)
+            texts: Text to index, one per document
+        """
+        vocabulary: dict[str, int] = {}
+        term_ids: list[np.ndarray] = []
+        lengths = np.zeros(len(docs), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[i] = len(tokens)
+            term_ids.append(np.array([vocabulary.setdefault(token, len(vocabulary)) for token in tokens], dtype=np.int32))
+
+        # One (term, doc, tf) triple per distinct term in each document
+        terms, postings_docs, tfs = [], [], []
+        for doc_id, ids in enumerate(term_ids):
+            unique, counts = np.unique(ids, return_counts=True)
+            terms.append(unique)
+            postings_docs.append(np.full(len(unique), doc_id, dtype=np.int32))
+            tfs.append(counts.astype(np.float32))
+
+        terms = np.concatenate(terms) if terms else np.zeros(0, dtype=np.int32)
+        postings_docs = np.concatenate(postings_docs) if postings_docs else np.zeros(0, dtype=np.int32)
+        tfs = np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.float32)
+
+        order = np.argsort(terms, kind="stable")
+        terms, postings_docs, tfs = terms[order], postings_docs[order], tfs[order]
+
+        counts = np.bincount(terms, minlength=len(vocabulary))
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        df = counts.astype(np.float32)
+
+        n = max(len(docs), 1)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        average_length = float(lengths.mean()) if len(docs) else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[postings_docs] / max(average_length, 1.0))
+        impacts = (idf[terms] * tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32)
+
+        version_ranges: dict[str, tuple[int, int]] = {}
+        for i, doc in enumerate(docs):
+            start, _ = version_ranges.get(doc.get("nec_version") or "", (i, i))
+            version_ranges[doc.get("nec_version") or ""] = (start, i + 1)
+
+        return cls(vocabulary, indptr, postings_docs, impacts, docs, version_ranges)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "BM25Index":
+        """Load an index written by save()"""
+        directory = Path(index_dir)
+        meta = json.loads((directory / META_FILE).read_text())
+        with np.load(directory / POSTINGS_FILE) as arrays:
+            indptr, doc_ids, impacts = arrays["indptr"], arrays["doc_ids"], arrays["impacts"]
+        version_ranges = {version: tuple(bounds) for version, bounds in meta["version_ranges"].items()}
+        return cls(meta["vocabulary"], indptr, doc_ids, impacts, meta["docs"], version_ranges)
+
+    def save(self, index_dir: str):
+        """Write the index (to temporary names, then renamed into place)"""
+        directory = Path(index_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        postings_tmp = directory / (POSTINGS_FILE + ".tmp")
+        with postings_tmp.open("wb") as f:
+            np.savez(f, indptr=self.indptr, doc_ids=self.doc_ids, impacts=self.impacts)
+
+        meta_tmp = directory / (META_FILE + ".tmp")
+        meta_tmp.write_text(json.dumps({
+            "count": len(self.docs),
+            "terms": len(self.vocabulary),
+            "postings": len(self.doc_ids),
+            "built_at": datetime.utcnow().isoformat() + "Z",
+            "version_ranges": self.version_ranges,
+            "vocabulary": self.vocabulary,
+            "docs": self.docs,
+        }))
+        os.replace(postings_tmp, directory / POSTINGS_FILE)
+        os.replace(meta_tmp, directory / META_FILE)
+
+    def _query_terms(self, query: str) -> list[int]:
+        """Ids of the query's indexed terms, at most MAX_QUERY_TERMS of the rarest"""
+        term_ids = np.array(
+            [self.vocabulary[term] for term in set(tokenize(query)) if term in self.vocabulary], dtype=np.int64
+        )
+        if len(term_ids) > MAX_QUERY_TERMS:
+            df = self.indptr[term_ids + 1] - self.indptr[term_ids]
+            term_ids = term_ids[np.argsort(df, kind="stable")[:MAX_QUERY_TERMS]]
+        return term_ids.tolist()
+
+    def search(self, query: str, limit: int = 10, nec_version: str | None = None) -> list[dict]:
+        """
+        Top-k BM25 search
+
+        Long queries are cut to their MAX_QUERY_TERMS most selective terms.
+
+        Args:
+            query: Free text (a diagram description, a section number, ...)
+            limit: Number of results to return
+            nec_version: Only search documents of this NEC version
+
+        Returns:
+            Matching documents (metadata without text) with a `bm25` score, best first
+        """
+        start, end = 0, len(self.docs)
+        if nec_version is not None:
+            if nec_version not in self.version_ranges:
+                return []
+            start, end = self.version_ranges[nec_version]
+
+        term_ids = self._query_terms(query)
+        if not term_ids or end <= start:
+            return []
+
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        ids = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.impacts[s] for s in slices])
+        scores = np.bincount(ids, weights=weights, minlength=len(self.docs))[start:end]
+
+        k = min(limit, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{**self.docs[start + row], "bm25": float(scores[row])} for row in top]
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], limit: int, k: int = RRF_K) -> list[dict]:
+    """
+    Fuse ranked result lists with RRF: score(d) = sum over lists of 1 / (k + rank)
+
+    Documents are matched across lists by `doc_key` (chunk_id or section).
+    The returned `score` is scaled to 0-1 by the best possible fused score.
+
+    Args:
+        rankings: Result lists, each best first
+        limit: Number of fused results to return
+        k: RRF constant
+
+    Returns:
+        Fused results, best first
+    """
+    fused: dict[str, float] = {}
+    docs: dict[str, dict] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc_key(doc)
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+
+    best = len(rankings) / (k + 1)
+    ordered = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [{**docs[key], "score": fused[key] / best} for key in ordered]
+
+
+def doc_key(doc: dict) -> str:
+    """Identity of a chunk or section across result lists"""
+    if doc.get("chunk_id"):
+        return f"chunk:{doc['chunk_id']}"
+    return f"section:{doc.get('nec_version')}:{doc.get('section')}"
+
+
+async def build_bm25_index(db, index_dir: str | None = None) -> BM25Index:
+    """
+    Index nec_codes sections and nec_chunks text and write it to disk
+
+    Args:
+        db: Database handle
+        index_dir: Output directory (settings default if None)
+
+    Returns:
+        The built index
+    """
+    rows: list[tuple[str, int, str, dict, str]] = []
+
+    # Only ids and headings are kept in `docs`; text is indexed, not stored
+    async for doc in db.nec_codes.find(
+        {}, {"_id": 0, "section": 1, "title": 1, "full_text": 1, "article": 1, "nec_version": 1}
+    ):
+        text = doc.pop("full_text", "") or ""
+        rows.append((doc.get("nec_version") or "", doc.get("article") or 0, f"s:{doc.get('section')}", doc,
+                     f"{doc.get('section', '')} {doc.get('title', '')} {text}"))
+
+    async for doc in db.nec_chunks.find(
+        {}, {"_id": 0, "chunk_id": 1, "article": 1, "article_title": 1, "text": 1, "nec_version": 1}
+    ):
+        text = doc.pop("text", "") or ""
+        rows.append((doc.get("nec_version") or "", doc.get("article") or 0, f"c:{doc.get('chunk_id')}", doc,
+                     f"{doc.get('article_title', '')} {text}"))
+
+    # Group by version so each version is a contiguous slice
+    rows.sort(key=lambda row: row[:3])
+    index = BM25Index.build([row[3] for row in rows], [row[4] for row in rows])
+    index.save(index_dir or settings.bm25_index_dir)
+    return index
+
+
+# Global index instance
+_bm25_index: BM25Index | None = None
+
+
+def load_bm25_index(index_dir: str | None = None) -> BM25Index | None:
+    """Load (or reload) the BM25 index; returns None if it has not been built"""
+    global _bm25_index
+
+    directory = index_dir or settings.bm25_index_dir
+    try:
+        _bm25_index = BM25Index.load(directory)
+        print(f"Loaded BM25 index: {len(_bm25_index)} documents, "
+              f"{len(_bm25_index.vocabulary)} terms from {directory}")
+    except FileNotFoundError:
+        print(f"BM25 index not found in {directory} (run scripts/ingest_nec.py)")
+        _bm25_index = None
+
+    return _bm25_index
+
+
+def get_bm25_index() -> BM25Index | None:
+    """Get the loaded BM25 index, if any"""
+    return _bm25_index
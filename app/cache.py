@@ -0,0 +1,175 @@
+"""Content-addressed cache for completed analysis results"""
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, IndexModel
+
+from app.config import settings
+from app.database import get_database
+
+
+# Bump when the shape of cached payloads or the analysis pipeline changes
+CACHE_SCHEMA_VERSION = "1"
+
+
+def make_cache_key(image_bytes: bytes, nec_version: str, corpus_version: int) -> str:
+    """
+    Build a cache key from the decoded image and everything that affects the result
+
+    Args:
+        image_bytes: Decoded image bytes (not the base64 text)
+        nec_version: NEC version the analysis runs against
+        corpus_version: NEC corpus version stamp (a re-ingest changes every key,
+            so processes that did not run the ingest stop serving stale results)
+
+    Returns:
+        Hex SHA-256 digest identifying this (image, corpus, models) combination
+    """
+    digest = hashlib.sha256()
+    digest.update(image_bytes)
+    for part in (
+        CACHE_SCHEMA_VERSION,
+        nec_version,
+        str(corpus_version),
+        settings.fireworks_vision_model,
+        settings.fireworks_text_model,
+        settings.fireworks_embedding_model,
+        settings.analysis_mode,
+    ):
+        digest.update(b"\x00")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of analysis payloads.
+
+    Tier 1 is an in-process LRU, tier 2 is the shared `analysis_cache`
+    collection whose documents expire through a TTL index on `created_at`.
+    """
+
+    COLLECTION = "analysis_cache"
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str, dict]] = OrderedDict()
+        self._indexes_ready = False
+        self.hits = 0
+        self.misses = 0
+
+    async def _ensure_indexes(self, db):
+        if self._indexes_ready:
+            return
+        await db[self.COLLECTION].create_indexes([
+            IndexModel([("created_at", ASCENDING)], expireAfterSeconds=self.ttl_seconds),
+            IndexModel([("nec_version", ASCENDING)]),
+        ])
+        self._indexes_ready = True
+
+    def _remember(self, key: str, nec_version: str, payload: dict):
+        self._entries[key] = (time.monotonic(), nec_version, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> dict | None:
+        """
+        Look up a cached payload, checking the local tier before Mongo
+
+        Returns:
+            A copy of the cached payload, or None on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, _, payload = entry
+            if time.monotonic() - stored_at < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(payload)
+            del self._entries[key]
+
+        db = get_database()
+        doc = await db[self.COLLECTION].find_one({"_id": key})
+        # The TTL monitor only runs once a minute, so check expiry ourselves
+        if doc and doc["created_at"] > datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            self._remember(key, doc["nec_version"], doc["payload"])
+            self.hits += 1
+            return copy.deepcopy(doc["payload"])
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, nec_version: str, payload: dict):
+        """Store a payload in both tiers"""
+        self._remember(key, nec_version, copy.deepcopy(payload))
+
+        db = get_database()
+        await self._ensure_indexes(db)
+        await db[self.COLLECTION].replace_one(
+            {"_id": key},
+            {
+                "_id": key,
+                "nec_version": nec_version,
+                "payload": payload,
+                "created_at": datetime.utcnow(),
+            },
+            upsert=True
+        )
+
+    async def invalidate(self, nec_version: str | None = None) -> int:
+        """
+        Drop cached results, e.g. after the NEC corpus is re-ingested
+
+        Args:
+            nec_version: Only drop results for this NEC version (all if None)
+
+        Returns:
+            Number of shared-tier entries removed
+        """
+        if nec_version is None:
+            self._entries.clear()
+        else:
+            for key in [k for k, (_, v, _) in self._entries.items() if v == nec_version]:
+                del self._entries[key]
+
+        query = {} if nec_version is None else {"nec_version": nec_version}
+        db = get_database()
+        result = await db[self.COLLECTION].delete_many(query)
+        return result.deleted_count
+
+    def stats(self) -> dict:
+        """Hit/miss counters and local tier size"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "local_entries": len(self._entries),
+        }
+
+
+# Global cache instance
+_result_cache: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache:
+    """Get or create the result cache instance"""
+    global _result_cache
+
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            max_entries=settings.result_cache_max_entries,
+            ttl_seconds=settings.result_cache_ttl_seconds
+        )
+
+    return _result_cache
+
+
+async def invalidate_result_cache(nec_version: str | None = None) -> int:
+    """Invalidate cached analysis results after the NEC corpus changes"""
+    removed = await get_result_cache().invalidate(nec_version)
+    print(f"Invalidated result cache ({removed} shared entries removed)")
+    return removed
@@ -0,0 +1,198 @@
+"""Process-wide in-memory copy of the NEC category corpus (nec_codes + nec_full_text)"""
+import asyncio
+import time
+
+from app.bm25_index import load_bm25_index
+from app.config import settings
+from app.database import get_corpus_version, get_database
+from app.hnsw_index import load_hnsw_index
+from app.vector_index import load_vector_index
+
+
+# Only the fields the compliance prompt uses; embedding fields are never pulled
+SECTION_PROJECTION = {
+    "_id": 0, "section": 1, "title": 1, "full_text": 1, "article": 1,
+    "chapter": 1, "categories": 1, "nec_version": 1
+}
+ARTICLE_PROJECTION = {
+    "_id": 0, "article": 1, "article_title": 1, "full_content": 1,
+    "chapter": 1, "categories": 1, "nec_version": 1
+}
+
+
+class NECCatalog:
+    """
+    Sections and full articles indexed by (nec_version, article).
+
+    Documents keep their collection order, so a lookup returns the same
+    ordering the equivalent `find({"article": {"$in": ...}})` would.
+    """
+
+    def __init__(self, sections: list[dict], articles: list[dict], version: int):
+        self.version = version
+        self.loaded_at = time.time()
+        self._sections = self._index(sections)
+        self._articles = self._index(articles)
+        self._by_section = {(doc.get("nec_version"), doc.get("section")): doc for doc in sections}
+        self.section_count = len(sections)
+        self.article_count = len(articles)
+
+    @staticmethod
+    def _index(docs: list[dict]) -> dict[tuple[str | None, int | None], list[tuple[int, dict]]]:
+        index: dict[tuple[str | None, int | None], list[tuple[int, dict]]] = {}
+        for position, doc in enumerate(docs):
+            index.setdefault((doc.get("nec_version"), doc.get("article")), []).append((position, doc))
+        return index
+
+    @classmethod
+    async def load(cls, db) -> "NECCatalog":
+        """Read both collections (version stamp first, so a concurrent ingest is seen next refresh)"""
+        version = await get_corpus_version(db)
+        sections, articles = await asyncio.gather(
+            db.nec_codes.find({}, SECTION_PROJECTION).to_list(length=None),
+            db.nec_full_text.find({}, ARTICLE_PROJECTION).to_list(length=None),
+        )
+        return cls(sections, articles, version)
+
+    @staticmethod
+    def _lookup(index, articles: list[int], nec_version: str | None, limit: int) -> list[dict]:
+        versions = {version for version, _ in index} if nec_version is None else (nec_version,)
+        matches = [
+            entry
+            for version in versions
+            for article in set(articles)
+            for entry in index.get((version, article), ())
+        ]
+        matches.sort(key=lambda entry: entry[0])
+        return [doc for _, doc in matches[:limit]]
+
+    def sections(self, articles: list[int], nec_version: str | None = None, limit: int = 200) -> list[dict]:
+        """Code sections belonging to any of `articles` (all versions if nec_version is None)"""
+        return self._lookup(self._sections, articles, nec_version, limit)
+
+    def full_articles(self, articles: list[int], nec_version: str | None = None, limit: int = 20) -> list[dict]:
+        """Full article texts for `articles` (all versions if nec_version is None)"""
+        return self._lookup(self._articles, articles, nec_version, limit)
+
+    def section(self, nec_version: str | None, section: str) -> dict | None:
+        """One code section by number, if loaded"""
+        return self._by_section.get((nec_version, section))
+
+    def stats(self) -> dict:
+        """Size and freshness of the loaded catalog"""
+        return {
+            "corpus_version": self.version,
+            "sections": self.section_count,
+            "articles": self.article_count,
+            "age_seconds": round(time.time() - self.loaded_at, 1),
+        }
+
+
+# Global catalog instance
+_catalog: NECCatalog | None = None
+_refresh_task: asyncio.Task | None = None
+# Corpus version stamp the loaded retrieval indexes were read at
+_indexes_version: int | None = None
+
+
+async def load_catalog() -> NECCatalog | None:
+    """Load (or reload) the catalog; keeps the previous copy if loading fails"""
+    global _catalog
+
+    try:
+        _catalog = await NECCatalog.load(get_database())
+        print(f"Loaded NEC catalog v{_catalog.version}: "
+              f"{_catalog.section_count} sections, {_catalog.article_count} articles")
+    except Exception as e:
+        print(f"NEC catalog load failed (category lookup will query MongoDB): {e}")
+
+    return _catalog
+
+
+def get_catalog() -> NECCatalog | None:
+    """Get the loaded NEC catalog, if any"""
+    return _catalog
+
+
+def _load_index_files():
+    if settings.rag_backend == "local":
+        load_vector_index()
+    elif settings.rag_backend == "hnsw":
+        load_hnsw_index()
+    if settings.retrieval_mode == "hybrid":
+        load_bm25_index()
+
+
+async def load_retrieval_indexes():
+    """
+    Load (or reload) the on-disk indexes the configured retrieval backends search
+
+    Ingestion writes the index files before bumping the corpus version
+    stamp, so indexes read after the stamp are at least that new. Files are
+    read in a worker thread; searches in flight keep the previous index.
+    """
+    global _indexes_version
+
+    try:
+        version = await get_corpus_version()
+    except Exception as e:
+        print(f"Corpus version check failed (indexes will be reloaded on the next check): {e}")
+        version = None
+
+    await asyncio.to_thread(_load_index_files)
+    _indexes_version = version
+
+
+async def current_corpus_version() -> int:
+    """
+    Corpus version stamp the in-process corpus copies correspond to
+
+    While the catalog is refreshed in the background its stamp is used (no
+    round trip); otherwise the stamp is read from MongoDB.
+    """
+    if _catalog is not None and _refresh_task is not None:
+        return _catalog.version
+    return await get_corpus_version()
+
+
+async def refresh_catalog_if_stale() -> bool:
+    """
+    Reload the catalog and retrieval indexes if ingestion has bumped the corpus version stamp
+
+    Returns:
+        True if the catalog was reloaded
+    """
+    version = await get_corpus_version()
+    if _indexes_version != version:
+        await load_retrieval_indexes()
+    if _catalog is not None and _catalog.version == version:
+        return False
+    await load_catalog()
+    return True
+
+
+async def _refresh_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_catalog_if_stale()
+        except Exception as e:
+            print(f"NEC catalog refresh check failed: {e}")
+
+
+def start_catalog_refresh():
+    """Poll the corpus version stamp in the background (call from inside the running event loop)"""
+    global _refresh_task
+
+    if _refresh_task is None and settings.catalog_refresh_seconds > 0:
+        _refresh_task = asyncio.create_task(_refresh_loop(settings.catalog_refresh_seconds))
+
+
+async def stop_catalog_refresh():
+    """Cancel the background refresh task"""
+    global _refresh_task
+
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
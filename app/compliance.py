@@ -1,9 +1,22 @@
 """Compliance checking logic - Hybrid approach with category-based lookup + RAG + LLM knowledge"""
+import asyncio
 import json
 import re
-from typing import Any
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator
+from app.bm25_index import doc_key, get_bm25_index, reciprocal_rank_fusion
+from app.cache import get_result_cache, make_cache_key
+from app.catalog import ARTICLE_PROJECTION, SECTION_PROJECTION, current_corpus_version, get_catalog
+from app.config import settings
+from app.context_budget import ContextBudget, count_tokens
 from app.fireworks_client import FireworksClient
+from app.drawings import rasterize_pdf
+from app.image_prep import PreparedImage, prepare_image
 from app.database import get_database, rag_search
+from app.phash_index import get_phash_index
+from app.pipeline import StageGraph
+from app.streaming import FindingStreamParser
 
 
 # Map system types to relevant NEC articles
@@ -92,18 +105,107 @@ CRITICAL - DIVERSE CODE CITATIONS:
 10. If multiple aspects fall under one code, pick the MOST important one and find other codes for other findings."""
 
 
+# Every article any system type maps to, for the single-pass prompt (first-seen order)
+ALL_CATEGORY_ARTICLES = list(dict.fromkeys(
+    article for articles in SYSTEM_TO_ARTICLES.values() for article in articles
+))
+
+
+SINGLE_PASS_SYSTEM_PROMPT = """You are an expert electrical engineer and NEC (National Electrical Code) inspector analyzing single-line diagrams.
+
+In ONE response:
+1. Describe the diagram in plain English: system overview, main components, voltage levels, protection devices, grounding, concerns
+2. Pick the primary system type: generator|solar|motor|panel|transformer|residential|commercial|industrial|ev_charging|battery_storage
+3. Check compliance against the NEC codes listed for that system type (provided below), plus any others you know apply
+
+STATUS VALUES: "pass" (complies), "warning" (unclear/needs verification), "fail" (clear violation), "not_applicable"
+
+Output ONLY a JSON object:
+{
+  "description": "Plain English description of the diagram...",
+  "system_type": "generator",
+  "findings": [
+    {
+      "id": "rc1",
+      "name": "Generator Overcurrent Protection",
+      "status": "pass",
+      "standard": "NEC 445.12",
+      "message": "Protective relays (50/51) properly installed",
+      "description": "NEC 445.12 requires generators to be protected against overcurrent",
+      "location": {"sheet": 1, "region": "Generator"}
+    }
+  ]
+}
+
+RULES:
+- Unique finding ids (rc1, rc2, ...); 8-15 findings covering major compliance areas
+- Each finding cites a DIFFERENT, specific NEC section (250.x grounding, 240.x overcurrent, 445.x generators, 700.x/702.x emergency/standby, 705.x interconnection, 310.x conductors, 230.x services, 450.x transformers)
+- Prefer the provided codes; for codes from your own knowledge add "(from NEC knowledge)" to the description"""
+
+
+# Rendered single-pass code context, by (catalog corpus version, NEC version)
+_compact_codes_cache: dict[tuple[int | None, str | None], str] = {}
+
+
+# Severity order used when the same standard is reported on several sheets
+STATUS_SEVERITY = {"not_applicable": 0, "pass": 1, "warning": 2, "fail": 3}
+
+
+def summary_statuses(findings: list) -> list[str]:
+    """
+    One status per distinct NEC standard, keeping the most severe
+
+    Findings without a usable standard reference are counted individually.
+    """
+    by_standard: dict[str, str] = {}
+    statuses = []
+    for finding in findings:
+        status = finding.get("status")
+        standard = " ".join(str(finding.get("standard") or "").upper().split())
+        if not standard or standard == "N/A":
+            statuses.append(status)
+            continue
+        current = by_standard.get(standard)
+        if current is None or STATUS_SEVERITY.get(status, 0) > STATUS_SEVERITY.get(current, 0):
+            by_standard[standard] = status
+    return statuses + list(by_standard.values())
+
+
+# Pending off-critical-path writes (strong references so tasks aren't collected)
+_background_writes: set[asyncio.Task] = set()
+
+
+def _run_in_background(coro):
+    """Schedule a write without awaiting it; failures are logged"""
+    async def _guarded():
+        try:
+            await coro
+        except Exception as e:
+            print(f"Background write failed: {e}")
+
+    task = asyncio.create_task(_guarded())
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+
+
+async def drain_background_writes():
+    """Wait for pending background writes (call before closing the database)"""
+    if _background_writes:
+        await asyncio.gather(*list(_background_writes), return_exceptions=True)
+
+
 class ComplianceChecker:
     """Main compliance checking service - Hybrid approach"""
 
     def __init__(self, fireworks: FireworksClient):
         self.fireworks = fireworks
 
-    async def analyze_diagram(self, image_base64: str) -> tuple[str, str]:
+    async def analyze_diagram(self, image: PreparedImage) -> tuple[str, str]:
         """
         Use vision model to get description AND identify system type
 
         Args:
-            image_base64: Base64-encoded PNG image
+            image: Normalized diagram image
 
         Returns:
             Tuple of (description, system_type)
@@ -111,7 +213,7 @@ class ComplianceChecker:
         prompt = "Analyze this single-line electrical diagram and describe what you see. Remember to specify the SYSTEM_TYPE at the end."
 
         response = await self.fireworks.analyze_image(
-            image_base64=image_base64,
+            image=image,
             prompt=prompt,
             system_prompt=VISION_SYSTEM_PROMPT,
             max_tokens=2000
@@ -124,6 +226,54 @@ class ComplianceChecker:
 
         return content, system_type
 
+    async def reuse_description(self, image: PreparedImage, analysis_id: str) -> tuple[str, str] | None:
+        """
+        Description and system type of a prior analysis of a near-identical drawing
+
+        Looks the image's dHash up in the perceptual hash index; matches within
+        `settings.phash_max_distance` bits are tried nearest first.
+
+        Args:
+            image: Normalized diagram image
+            analysis_id: Analysis ID (used as the log prefix)
+
+        Returns:
+            Tuple of (description, system_type), or None if no prior analysis matches
+        """
+        index = get_phash_index()
+        if index is None or image.phash is None or len(image.phash) != index.hash_bytes:
+            return None
+
+        db = get_database()
+        for distance, prior_id in index.search(image.phash, settings.phash_max_distance)[:3]:
+            prior = await db.analyses.find_one(
+                {"analysis_id": prior_id, "status": "completed"},
+                {"_id": 0, "diagram_description": 1, "system_type": 1}
+            )
+            if prior and prior.get("diagram_description") and prior.get("system_type"):
+                print(f"[{analysis_id}] Near-duplicate of {prior_id} (dHash distance {distance}); reusing its description")
+                return prior["diagram_description"], prior["system_type"]
+
+        return None
+
+    async def describe_diagram(
+        self,
+        image: PreparedImage,
+        analysis_id: str,
+        allow_reuse: bool = True
+    ) -> tuple[str, str]:
+        """
+        Reuse a near-duplicate's description if enabled, else ask the vision model
+
+        Drawing-set sheets pass `allow_reuse=False`: they are never indexed,
+        so a match would only be another single-image analysis.
+        """
+        if allow_reuse and settings.phash_reuse_enabled:
+            reused = await self.reuse_description(image, analysis_id)
+            if reused is not None:
+                return reused
+        return await self.analyze_diagram(image)
+
     def _extract_system_type(self, description: str) -> str:
         """Extract system type from vision model response"""
         # Look for SYSTEM_TYPE: xxx pattern
@@ -154,43 +304,28 @@ class ComplianceChecker:
         # Default to commercial
         return "commercial"
 
-    async def find_relevant_codes(self, system_type: str, diagram_description: str = "") -> dict:
+    async def find_relevant_codes(
+        self,
+        system_type: str,
+        diagram_description: str = "",
+        nec_version: str | None = None
+    ) -> dict:
         """
         Load NEC codes using hybrid approach: category-based lookup + RAG search
 
         Args:
             system_type: Type of electrical system
             diagram_description: Description of the diagram for RAG search
+            nec_version: Restrict RAG chunks to this NEC version
 
         Returns:
             Dictionary with 'sections', 'full_context', and 'rag_chunks' lists
         """
-        articles = SYSTEM_TO_ARTICLES.get(system_type, [240, 250])
-
-        db = get_database()
-
-        # 1. Category-based: Get individual code sections for these articles
-        sections = await db.nec_codes.find({
-            "article": {"$in": articles}
-        }).to_list(length=200)
-
-        # 2. Category-based: Get full article context (if available)
-        full_context = await db.nec_full_text.find({
-            "article": {"$in": articles}
-        }).to_list(length=20)
-
-        # 3. RAG: Semantic search for relevant chunks (if description provided)
-        rag_chunks = []
-        if diagram_description:
-            try:
-                # Generate embedding for the diagram description
-                query_embedding = await self.fireworks.generate_embedding(
-                    diagram_description[:1500]  # Limit to avoid token overflow
-                )
-                rag_chunks = await rag_search(query_embedding, limit=10)
-                print(f"RAG found {len(rag_chunks)} relevant chunks")
-            except Exception as e:
-                print(f"RAG search failed (continuing without): {e}")
+        # Category lookup and embedding + vector search are independent
+        (sections, full_context), rag_chunks = await asyncio.gather(
+            self.load_category_codes(system_type, nec_version),
+            self.search_rag_chunks(diagram_description, nec_version)
+        )
 
         print(f"Loaded {len(sections)} sections, {len(full_context)} full articles, {len(rag_chunks)} RAG chunks for {system_type}")
 
@@ -200,38 +335,269 @@ class ComplianceChecker:
             "rag_chunks": rag_chunks
         }
 
+    async def load_category_codes(
+        self,
+        system_type: str,
+        nec_version: str | None = None
+    ) -> tuple[list[dict], list[dict]]:
+        """
+        Category-based lookup of code sections and full articles for a system type
+
+        Args:
+            system_type: Type of electrical system
+            nec_version: Only load codes of this NEC version (all versions if None)
+
+        Returns:
+            Tuple of (sections, full_context)
+        """
+        articles = SYSTEM_TO_ARTICLES.get(system_type, [240, 250])
+
+        catalog = get_catalog()
+        if catalog is not None:
+            # Preloaded in-memory catalog: no round trip
+            return catalog.sections(articles, nec_version), catalog.full_articles(articles, nec_version)
+
+        query: dict[str, Any] = {"article": {"$in": articles}}
+        if nec_version is not None:
+            query["nec_version"] = nec_version
+
+        db = get_database()
+        sections, full_context = await asyncio.gather(
+            # Individual code sections for these articles
+            db.nec_codes.find(query, SECTION_PROJECTION).to_list(length=200),
+            # Full article context (if available)
+            db.nec_full_text.find(query, ARTICLE_PROJECTION).to_list(length=20)
+        )
+        return sections, full_context
+
+    async def load_compact_codes(self, nec_version: str | None = None) -> str:
+        """
+        Category codes for every candidate system type, condensed for the single-pass prompt
+
+        Lists which articles apply to each system type, then a short excerpt
+        of each section of those articles (interleaved across articles so
+        every article is represented) within `settings.single_pass_context_tokens`.
+        Rendered once per catalog corpus version and NEC version.
+
+        Args:
+            nec_version: Only include codes of this NEC version (all versions if None)
+
+        Returns:
+            Prompt text
+        """
+        catalog = get_catalog()
+        cache_key = (catalog.version if catalog is not None else None, nec_version)
+        if catalog is not None and cache_key in _compact_codes_cache:
+            return _compact_codes_cache[cache_key]
+
+        if catalog is not None:
+            sections = catalog.sections(ALL_CATEGORY_ARTICLES, nec_version, limit=10_000)
+        else:
+            query: dict[str, Any] = {"article": {"$in": ALL_CATEGORY_ARTICLES}}
+            if nec_version is not None:
+                query["nec_version"] = nec_version
+            sections = await get_database().nec_codes.find(query, SECTION_PROJECTION).to_list(length=None)
+
+        by_article: dict[Any, list[dict]] = {}
+        for code in sections:
+            by_article.setdefault(code.get("article"), []).append(code)
+
+        budget = ContextBudget(
+            settings.single_pass_context_tokens,
+            settings.single_pass_item_tokens,
+            settings.single_pass_item_tokens
+        )
+        # Round-robin: first section of every article, then the second, ...
+        for rank in range(max((len(codes) for codes in by_article.values()), default=0)):
+            for article in ALL_CATEGORY_ARTICLES:
+                codes = by_article.get(article, [])
+                if rank < len(codes):
+                    code = codes[rank]
+                    budget.add(
+                        f"Article {article}",
+                        f"- NEC {code.get('section', 'Unknown')}: {code.get('title', 'Unknown')}",
+                        code.get("full_text", "")
+                    )
+
+        system_lines = "\n".join(
+            f"- {system_type}: " + ", ".join(str(article) for article in articles)
+            for system_type, articles in SYSTEM_TO_ARTICLES.items()
+        )
+        text = "# NEC Articles by System Type\n" + system_lines + budget.render()
+        print(f"Single-pass code context: {count_tokens(text)} tokens, {budget.stats()['items_included']} sections")
+
+        if catalog is not None:
+            # Entries rendered from an older corpus version are never read again
+            for key in [key for key in _compact_codes_cache if key[0] != catalog.version]:
+                del _compact_codes_cache[key]
+            _compact_codes_cache[cache_key] = text
+        return text
+
+    async def search_rag_chunks(self, diagram_description: str, nec_version: str | None = None) -> list[dict]:
+        """
+        RAG: Semantic search for chunks relevant to the diagram description
+
+        With `settings.retrieval_mode` "hybrid", the vector ranking is fused
+        with a local BM25 ranking of sections and chunks (reciprocal rank
+        fusion), so exact terms and section numbers are not missed.
+
+        Returns:
+            Matching chunks (empty if there is no description or the search fails)
+        """
+        if not diagram_description:
+            return []
+
+        limit = 10
+        bm25 = get_bm25_index() if settings.retrieval_mode == "hybrid" else None
+        candidates = settings.hybrid_candidates if bm25 is not None else limit
+
+        try:
+            # Generate embedding for the diagram description
+            query_embedding = await self.fireworks.generate_embedding(
+                diagram_description[:1500]  # Limit to avoid token overflow
+            )
+            rag_chunks = await rag_search(query_embedding, limit=candidates, nec_version=nec_version)
+        except Exception as e:
+            print(f"RAG search failed (continuing without): {e}")
+            rag_chunks = []
+
+        if bm25 is None:
+            print(f"RAG found {len(rag_chunks)} relevant chunks")
+            return rag_chunks
+
+        lexical = bm25.search(diagram_description, limit=candidates, nec_version=nec_version)
+        fused = await self._with_text(reciprocal_rank_fusion([rag_chunks, lexical], limit=limit))
+        print(f"Hybrid retrieval: {len(rag_chunks)} vector + {len(lexical)} BM25 candidates -> {len(fused)} fused")
+        return fused
+
+    @staticmethod
+    async def _with_text(docs: list[dict]) -> list[dict]:
+        """
+        Fill in the text of BM25-only results (the BM25 index stores ids, not text)
+
+        Sections come from the catalog, chunks (and sections it lacks) from
+        MongoDB. Results whose text cannot be found are dropped.
+        """
+        missing = [doc for doc in docs if "text" not in doc]
+        if not missing:
+            return docs
+
+        texts: dict[str, str] = {}
+        catalog = get_catalog()
+        chunk_ids, sections = [], []
+        for doc in missing:
+            if doc.get("chunk_id"):
+                chunk_ids.append(doc["chunk_id"])
+                continue
+            section = catalog.section(doc.get("nec_version"), doc.get("section")) if catalog is not None else None
+            if section is not None:
+                texts[doc_key(doc)] = section.get("full_text", "")
+            else:
+                sections.append({"nec_version": doc.get("nec_version"), "section": doc.get("section")})
+
+        try:
+            db = get_database()
+            if chunk_ids:
+                async for chunk in db.nec_chunks.find(
+                    {"chunk_id": {"$in": chunk_ids}}, {"_id": 0, "chunk_id": 1, "text": 1}
+                ):
+                    texts[doc_key(chunk)] = chunk.get("text", "")
+            if sections:
+                async for section in db.nec_codes.find(
+                    {"$or": sections}, {"_id": 0, "section": 1, "nec_version": 1, "full_text": 1}
+                ):
+                    texts[doc_key(section)] = section.get("full_text", "")
+        except Exception as e:
+            print(f"BM25 result text lookup failed (keeping vector results only): {e}")
+
+        return [
+            doc if "text" in doc else {**doc, "text": texts[doc_key(doc)]}
+            for doc in docs
+            if "text" in doc or doc_key(doc) in texts
+        ]
+
     async def check_compliance(
         self,
-        image_base64: str,
+        image: PreparedImage,
         description: str,
-        relevant_codes: dict
+        relevant_codes: dict,
+        analysis_id: str | None = None
     ) -> list:
         """
         Use vision model to compare diagram against NEC codes
 
         Args:
-            image_base64: Original diagram image
+            image: Normalized diagram image
             description: Plain text description of the diagram
             relevant_codes: Dict with 'sections' and 'full_context'
+            analysis_id: Analysis ID for the prompt size log line
 
         Returns:
             List of finding dictionaries
         """
         # Build context with codes
-        context = self._build_compliance_context(description, relevant_codes)
+        context, prompt_stats = await asyncio.to_thread(self._build_compliance_context, description, relevant_codes)
+        self._log_prompt(analysis_id, prompt_stats)
 
         # Use vision model so it can see the actual diagram
         response = await self.fireworks.analyze_image(
-            image_base64=image_base64,
+            image=image,
             prompt=context,
             system_prompt=COMPLIANCE_SYSTEM_PROMPT,
             max_tokens=4000
         )
 
-        # Parse the response
-        try:
-            content = response["content"]
+        return self._parse_findings(response["content"])
+
+    async def stream_compliance(
+        self,
+        image: PreparedImage,
+        description: str,
+        relevant_codes: dict,
+        analysis_id: str | None = None
+    ) -> AsyncIterator[dict]:
+        """
+        Streaming variant of check_compliance: yield each finding as soon as it is generated
 
+        Args:
+            image: Normalized diagram image
+            description: Plain text description of the diagram
+            relevant_codes: Dict with 'sections' and 'full_context'
+            analysis_id: Analysis ID for the prompt size log line
+
+        Yields:
+            Finding dictionaries
+        """
+        context, prompt_stats = await asyncio.to_thread(self._build_compliance_context, description, relevant_codes)
+        self._log_prompt(analysis_id, prompt_stats)
+        parser = FindingStreamParser()
+
+        async for delta in self.fireworks.stream_image(
+            image=image,
+            prompt=context,
+            system_prompt=COMPLIANCE_SYSTEM_PROMPT,
+            max_tokens=4000
+        ):
+            for finding in parser.feed(delta):
+                yield finding
+
+        # Output the incremental parser could not follow: parse it as a whole
+        if parser.emitted == 0:
+            for finding in self._parse_findings(parser.text):
+                yield finding
+
+    @staticmethod
+    def _log_prompt(analysis_id: str | None, stats: dict):
+        prefix = f"[{analysis_id}] " if analysis_id else ""
+        print(f"{prefix}Compliance prompt: {stats['prompt_tokens']} tokens "
+              f"(NEC context {stats['context_tokens']}/{stats['budget']}, "
+              f"{stats['items_included']} items, {stats['items_truncated']} truncated, "
+              f"{stats['items_dropped']} dropped, "
+              f"{stats['duplicate_tokens_removed']} duplicate tokens removed)")
+
+    def _parse_findings(self, content: str) -> list:
+        """Extract the findings array from a compliance check response"""
+        try:
             # Remove thinking tags if present
             if "<think>" in content and "</think>" in content:
                 parts = content.split("</think>")
@@ -263,7 +629,7 @@ class ComplianceChecker:
 
         except (json.JSONDecodeError, KeyError) as e:
             print(f"Error parsing compliance findings: {e}")
-            print(f"Response: {response['content'][:500]}")
+            print(f"Response: {content[:500]}")
             return [{
                 "id": "error",
                 "name": "Parse Error",
@@ -274,105 +640,501 @@ class ComplianceChecker:
                 "location": {"sheet": 1, "region": "Unknown"}
             }]
 
-    def _build_compliance_context(self, description: str, relevant_codes: dict) -> str:
-        """Build context string for LLM with category codes + RAG chunks"""
-        context_parts = ["# Electrical Diagram Description\n"]
-        context_parts.append(description)
-
-        sections = relevant_codes.get("sections", [])
-        full_context = relevant_codes.get("full_context", [])
-        rag_chunks = relevant_codes.get("rag_chunks", [])
-
-        # Add RAG chunks first (most semantically relevant)
-        if rag_chunks:
-            context_parts.append("\n\n# Most Relevant NEC Passages (Semantic Search)\n")
-            for chunk in rag_chunks:
-                article = chunk.get('article', 'Unknown')
-                title = chunk.get('article_title', 'Unknown')
-                text = chunk.get('text', '')
-                score = chunk.get('score', 0)
-
-                context_parts.append(f"\n## Article {article}: {title} (relevance: {score:.2f})")
-                context_parts.append(f"\n{text}")
-
-        # Add individual sections from category lookup
-        if sections:
-            context_parts.append("\n\n# NEC Code Sections (Category-Based)\n")
-            for code in sections[:25]:  # Limit to prevent token overflow
-                section = code.get('section', 'Unknown')
-                title = code.get('title', 'Unknown')
-                full_text = code.get('full_text', '')
-
-                # Truncate long sections
-                if len(full_text) > 600:
-                    full_text = full_text[:600] + "..."
-
-                context_parts.append(f"\n## NEC {section}: {title}")
-                context_parts.append(f"\n{full_text}")
-
-        # Add full article context if available
-        if full_context:
-            context_parts.append("\n\n# Full Article Context\n")
-            for article in full_context[:3]:  # Limit to prevent token overflow
-                article_num = article.get('article', 'Unknown')
-                title = article.get('article_title', 'Unknown')
-                content = article.get('full_content', '')
-
-                # Summarize very long articles
-                if len(content) > 1500:
-                    content = content[:1500] + "...[truncated]"
-
-                context_parts.append(f"\n## Article {article_num}: {title}")
-                context_parts.append(f"\n{content}")
-
-        context_parts.append(
+    def _build_compliance_context(self, description: str, relevant_codes: dict) -> tuple[str, dict]:
+        """
+        Build the compliance prompt: diagram description, NEC context and task
+
+        NEC context is filled to `settings.compliance_context_tokens` in
+        relevance order (RAG chunks by score, then category sections, then
+        full articles). Every item first gets a short share, then the most
+        relevant are extended; text an earlier item contributed is not repeated.
+
+        Returns:
+            Tuple of (prompt, token stats)
+        """
+        header = "# Electrical Diagram Description\n\n" + description
+        task = (
             "\n\n# Task\n"
             "Evaluate the diagram against the NEC codes above. "
             "Also use your built-in NEC knowledge to identify any additional applicable codes. "
             "Output findings as a JSON array with pass/warning/fail/not_applicable status."
         )
+        budget = ContextBudget(
+            settings.compliance_context_tokens,
+            settings.compliance_item_min_tokens,
+            settings.compliance_item_max_tokens
+        )
 
-        return "\n".join(context_parts)
+        # RAG chunks first (most semantically relevant)
+        for chunk in sorted(relevant_codes.get("rag_chunks", []), key=lambda c: c.get("score", 0), reverse=True):
+            # Hybrid retrieval also returns whole sections
+            if chunk.get("section"):
+                heading = f"## NEC {chunk['section']}: {chunk.get('title', 'Unknown')}"
+            else:
+                heading = f"## Article {chunk.get('article', 'Unknown')}: {chunk.get('article_title', 'Unknown')}"
+            budget.add(
+                "Most Relevant NEC Passages (Semantic Search)",
+                f"{heading} (relevance: {chunk.get('score', 0):.2f})",
+                chunk.get("text", "")
+            )
+
+        # Individual sections from category lookup
+        for code in relevant_codes.get("sections", []):
+            budget.add(
+                "NEC Code Sections (Category-Based)",
+                f"## NEC {code.get('section', 'Unknown')}: {code.get('title', 'Unknown')}",
+                code.get("full_text", "")
+            )
+
+        # Full article context: whatever the passages and sections did not already cover
+        for article in relevant_codes.get("full_context", []):
+            budget.add(
+                "Full Article Context",
+                f"## Article {article.get('article', 'Unknown')}: {article.get('article_title', 'Unknown')}",
+                article.get("full_content", "")
+            )
+
+        prompt = header + budget.render() + task
+        stats = {"prompt_tokens": count_tokens(prompt), **budget.stats()}
+        return prompt, stats
 
     async def analyze_and_check(
         self,
         analysis_id: str,
-        image_base64: str,
-        nec_version: str = "2023"
+        image_bytes: bytes,
+        nec_version: str = "2023",
+        persist_in_background: bool = True
     ) -> dict:
         """
         Complete analysis pipeline: describe diagram, load codes by category, check compliance
 
         Args:
             analysis_id: Unique analysis ID
-            image_base64: Base64-encoded PNG image
+            image_bytes: Raw image bytes (PNG, JPEG, ...)
             nec_version: NEC version to check against
+            persist_in_background: Return before the analysis record is written
+                (pending writes are flushed by drain_background_writes())
 
         Returns:
             Complete analysis result with findings
         """
-        # Step 1: Get diagram description AND system type
-        print(f"[{analysis_id}] Analyzing diagram...")
-        description, system_type = await self.analyze_diagram(image_base64)
-        print(f"[{analysis_id}] Got description: {len(description)} chars, system type: {system_type}")
+        # Step 0: Serve identical drawings from the result cache
+        cache_key = None
+        if settings.result_cache_enabled:
+            cache_key = make_cache_key(image_bytes, nec_version, await current_corpus_version())
+            cached = await get_result_cache().get(cache_key)
+            if cached is not None:
+                print(f"[{analysis_id}] Result cache hit")
+                return await self._store_cached_result(analysis_id, cached, persist_in_background)
+
+        # Steps 1-3
+        sheet = await self._analyze_sheet(analysis_id, image_bytes, nec_version)
+        description, system_type, findings = sheet["description"], sheet["system_type"], sheet["findings"]
+        timings, image_stats = sheet["timings"], sheet["image"]
+
+        result, created_at = self._build_result(analysis_id, nec_version, system_type, description, findings)
+
+        # Step 4: Store in database (and the result cache)
+        persist = self._persist_result(analysis_id, result, created_at, timings, cache_key, image_stats)
+        if persist_in_background:
+            # The caller already has the result; don't hold the response on the writes
+            _run_in_background(persist)
+        else:
+            await persist
 
-        # Step 2: Load relevant codes (category-based + RAG)
-        print(f"[{analysis_id}] Loading NEC codes for system type: {system_type}...")
-        relevant_codes = await self.find_relevant_codes(system_type, description)
-        sections_count = len(relevant_codes.get("sections", []))
-        articles_count = len(relevant_codes.get("full_context", []))
-        rag_count = len(relevant_codes.get("rag_chunks", []))
-        print(f"[{analysis_id}] Loaded {sections_count} sections, {articles_count} full articles, {rag_count} RAG chunks")
+        return result
 
-        # Step 3: Check compliance (with image for visual verification)
-        print(f"[{analysis_id}] Checking compliance...")
-        findings = await self.check_compliance(image_base64, description, relevant_codes)
+    async def analyze_drawing_set(
+        self,
+        analysis_id: str,
+        pdf_bytes: bytes,
+        nec_version: str = "2023",
+        persist_in_background: bool = True
+    ) -> dict:
+        """
+        Analyze every sheet of a PDF drawing set and merge the results
+
+        Sheets are rasterized in a process pool and analyzed concurrently
+        (at most `settings.sheet_concurrency` at a time), so a set takes
+        roughly as long as its slowest sheet. If one sheet fails, the sheets
+        still running are cancelled and its error is raised.
+
+        Args:
+            analysis_id: Unique analysis ID
+            pdf_bytes: PDF file contents
+            nec_version: NEC version to check against
+            persist_in_background: Return before the analysis record is written
+
+        Returns:
+            One combined analysis result; each finding's location.sheet is its page number
+        """
+        cache_key = None
+        if settings.result_cache_enabled:
+            cache_key = make_cache_key(pdf_bytes, nec_version, await current_corpus_version())
+            cached = await get_result_cache().get(cache_key)
+            if cached is not None:
+                print(f"[{analysis_id}] Result cache hit")
+                return await self._store_cached_result(analysis_id, cached, persist_in_background)
+
+        started = time.perf_counter()
+        sheets = await rasterize_pdf(pdf_bytes)
+        render_ms = round((time.perf_counter() - started) * 1000, 1)
+        print(f"[{analysis_id}] Rasterized {len(sheets)} sheets in {render_ms} ms")
+
+        semaphore = asyncio.Semaphore(settings.sheet_concurrency)
+
+        async def _sheet(number: int, image_bytes: bytes) -> dict:
+            async with semaphore:
+                return await self._analyze_sheet(
+                    f"{analysis_id}/sheet {number}", image_bytes, nec_version, allow_reuse=False
+                )
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [
+                    group.create_task(_sheet(number, image_bytes))
+                    for number, image_bytes in enumerate(sheets, start=1)
+                ]
+        except ExceptionGroup as e:
+            # The other sheets were cancelled; surface the error that caused it
+            raise e.exceptions[0]
+        results = [task.result() for task in tasks]
+
+        findings = []
+        descriptions = []
+        for number, sheet in enumerate(results, start=1):
+            descriptions.append(f"## Sheet {number} ({sheet['system_type']})\n{sheet['description']}")
+            for finding in sheet["findings"]:
+                location = finding.get("location")
+                finding = {
+                    **finding,
+                    "location": {**(location if isinstance(location, dict) else {}), "sheet": number}
+                }
+                if len(results) > 1:
+                    # Models number findings per call (rc1, rc2, ...); keep ids unique across sheets
+                    finding["id"] = f"s{number}-{finding.get('id', len(findings) + 1)}"
+                findings.append(finding)
+
+        # The set's system type is the one most sheets show (first sheet wins ties)
+        system_types = [sheet["system_type"] for sheet in results]
+        system_type = max(system_types, key=system_types.count)
+        description = descriptions[0].split("\n", 1)[1] if len(results) == 1 else "\n\n".join(descriptions)
+
+        timings = {
+            "render_ms": render_ms,
+            "sheets": [sheet["timings"] for sheet in results],
+            "total_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        print(f"[{analysis_id}] {len(results)} sheets analyzed in {timings['total_ms']} ms "
+              f"(slowest sheet {max(sheet['timings']['total_ms'] for sheet in results)} ms)")
+
+        result, created_at = self._build_result(
+            analysis_id, nec_version, system_type, description, findings, dedupe_standards=True
+        )
+        persist = self._persist_result(
+            analysis_id, result, created_at, timings, cache_key, [sheet["image"] for sheet in results]
+        )
+        if persist_in_background:
+            _run_in_background(persist)
+        else:
+            await persist
+
+        return result
+
+    async def _analyze_sheet(
+        self,
+        analysis_id: str,
+        image_bytes: bytes,
+        nec_version: str,
+        allow_reuse: bool = True
+    ) -> dict:
+        """
+        Analyze one drawing sheet in the configured `settings.analysis_mode`
+
+        `allow_reuse` is passed on to describe_diagram (False for drawing-set sheets).
+
+        Returns:
+            Dict with 'description', 'system_type', 'findings', 'timings' and 'image' (normalization stats)
+        """
+        if settings.analysis_mode == "single_pass":
+            return await self._analyze_sheet_single_pass(analysis_id, image_bytes, nec_version, allow_reuse)
+        return await self._analyze_sheet_two_pass(analysis_id, image_bytes, nec_version, allow_reuse)
+
+    async def _analyze_sheet_two_pass(
+        self,
+        analysis_id: str,
+        image_bytes: bytes,
+        nec_version: str,
+        allow_reuse: bool = True
+    ) -> dict:
+        """
+        Describe one drawing sheet, load its codes and check compliance
+
+        Args:
+            analysis_id: Analysis ID (used as the log prefix)
+            image_bytes: Decoded image bytes
+            nec_version: NEC version to check against
+            allow_reuse: Whether a near-duplicate's description may be reused
+
+        Returns:
+            Dict with 'description', 'system_type', 'findings', 'timings' and 'image' (normalization stats)
+        """
+        # Steps 1-3 as a stage graph: category lookup and embedding + vector
+        # search both only need the description, so they run concurrently.
+        # The image is normalized once and reused by both vision calls.
+        async def prepare():
+            return await prepare_image(image_bytes)
+
+        async def describe(prepare):
+            print(f"[{analysis_id}] Analyzing diagram...")
+            description, system_type = await self.describe_diagram(prepare, analysis_id, allow_reuse)
+            print(f"[{analysis_id}] Got description: {len(description)} chars, system type: {system_type}")
+            return description, system_type
+
+        async def category_codes(describe):
+            return await self.load_category_codes(describe[1], nec_version)
+
+        async def rag_chunks(describe):
+            return await self.search_rag_chunks(describe[0], nec_version)
+
+        async def compliance(prepare, describe, category_codes, rag_chunks):
+            sections, full_context = category_codes
+            relevant_codes = {"sections": sections, "full_context": full_context, "rag_chunks": rag_chunks}
+            print(f"[{analysis_id}] Loaded {len(sections)} sections, {len(full_context)} full articles, "
+                  f"{len(rag_chunks)} RAG chunks; checking compliance...")
+            return await self.check_compliance(prepare, describe[0], relevant_codes, analysis_id)
+
+        graph = StageGraph()
+        graph.add("prepare", prepare)
+        graph.add("describe", describe, after=["prepare"])
+        graph.add("category_codes", category_codes, after=["describe"])
+        graph.add("rag_chunks", rag_chunks, after=["describe"])
+        graph.add("compliance", compliance, after=["prepare", "describe", "category_codes", "rag_chunks"])
+        stages = await graph.run()
+
+        image_stats = stages["prepare"].stats()
+        print(f"[{analysis_id}] Image normalized: {image_stats['original_bytes']} -> {image_stats['bytes']} bytes, "
+              f"~{image_stats['estimated_tokens_saved']} vision tokens saved per call")
+        description, system_type = stages["describe"]
+        findings = stages["compliance"]
+        timings = graph.report()
+        print(f"[{analysis_id}] Stage timings (ms): "
+              + ", ".join(f"{name}={t['duration_ms']}" for name, t in timings["stages"].items())
+              + f", total={timings['total_ms']}")
+
+        return {
+            "description": description,
+            "system_type": system_type,
+            "findings": findings,
+            "timings": timings,
+            "image": image_stats
+        }
+
+    async def _analyze_sheet_single_pass(
+        self,
+        analysis_id: str,
+        image_bytes: bytes,
+        nec_version: str,
+        allow_reuse: bool = True
+    ) -> dict:
+        """
+        Single vision call returning description, system type and findings together
+
+        The prompt carries the category codes of every candidate system type
+        (see load_compact_codes), so nothing waits on a description first.
+        RAG passages are not used in this mode. Falls back to the two-pass
+        pipeline if the response cannot be parsed.
+
+        Returns:
+            Same dict as _analyze_sheet
+        """
+        async def prepare():
+            return await prepare_image(image_bytes)
+
+        async def codes():
+            return await self.load_compact_codes(nec_version)
+
+        async def single_pass(prepare, codes):
+            print(f"[{analysis_id}] Analyzing diagram and checking compliance (single pass)...")
+            response = await self.fireworks.analyze_image(
+                image=prepare,
+                prompt=codes + "\n\n# Task\nDescribe this diagram, pick its system type and "
+                               "evaluate it against the NEC codes above. Output only the JSON object.",
+                system_prompt=SINGLE_PASS_SYSTEM_PROMPT,
+                max_tokens=5000
+            )
+            return self._parse_single_pass(response["content"])
+
+        graph = StageGraph()
+        graph.add("prepare", prepare)
+        graph.add("codes", codes)
+        graph.add("single_pass", single_pass, after=["prepare", "codes"])
+        stages = await graph.run()
+
+        parsed = stages["single_pass"]
+        if parsed is None:
+            print(f"[{analysis_id}] Single-pass response unparseable, falling back to two passes")
+            return await self._analyze_sheet_two_pass(analysis_id, image_bytes, nec_version, allow_reuse)
+
+        description, system_type, findings = parsed
+        image_stats = stages["prepare"].stats()
+        timings = graph.report()
+        print(f"[{analysis_id}] Got description: {len(description)} chars, system type: {system_type}, "
+              f"{len(findings)} findings")
+        print(f"[{analysis_id}] Stage timings (ms): "
+              + ", ".join(f"{name}={t['duration_ms']}" for name, t in timings["stages"].items())
+              + f", total={timings['total_ms']}")
+
+        return {
+            "description": description,
+            "system_type": system_type,
+            "findings": findings,
+            "timings": timings,
+            "image": image_stats
+        }
+
+    def _parse_single_pass(self, content: str) -> tuple[str, str, list] | None:
+        """
+        Extract (description, system_type, findings) from a single-pass response
+
+        Returns:
+            The parsed triple, or None if the response has no usable JSON object
+        """
+        if "</think>" in content:
+            content = content.split("</think>")[-1]
+        if "```" in content:
+            content = content.split("```json")[-1] if "```json" in content else content.split("```")[1]
+            content = content.split("```")[0]
+
+        start, end = content.find("{"), content.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        try:
+            data = json.loads(content[start:end + 1])
+        except json.JSONDecodeError as e:
+            print(f"Error parsing single-pass response: {e}")
+            return None
+
+        findings = data.get("findings") if isinstance(data, dict) else None
+        if not isinstance(findings, list):
+            return None
+
+        description = str(data.get("description") or "")
+        system_type = str(data.get("system_type") or "").lower()
+        if system_type not in SYSTEM_TO_ARTICLES:
+            system_type = self._extract_system_type(description)
+        return description, system_type, findings
+
+    async def analyze_and_check_stream(
+        self,
+        analysis_id: str,
+        image_bytes: bytes,
+        nec_version: str = "2023"
+    ) -> AsyncIterator[tuple[str, dict]]:
+        """
+        Streaming variant of analyze_and_check that reports each stage as it completes
+
+        Args:
+            analysis_id: Unique analysis ID
+            image_bytes: Raw image bytes (PNG, JPEG, ...)
+            nec_version: NEC version to check against
+
+        Yields:
+            (event, data) pairs: 'description', 'system_type', 'codes_loaded',
+            one 'finding' per finding, then 'complete' with the full result
+        """
+        cache_key = None
+        if settings.result_cache_enabled:
+            cache_key = make_cache_key(image_bytes, nec_version, await current_corpus_version())
+            cached = await get_result_cache().get(cache_key)
+            if cached is not None:
+                print(f"[{analysis_id}] Result cache hit")
+                result = await self._store_cached_result(analysis_id, cached, persist_in_background=True)
+                yield "description", {"analysis_id": analysis_id, "diagram_description": result["diagram_description"]}
+                yield "system_type", {"system_type": result["system_type"]}
+                for finding in result["findings"]:
+                    yield "finding", finding
+                yield "complete", result
+                return
+
+        started = time.perf_counter()
+        stages: dict[str, dict[str, float]] = {}
+
+        def _timed(name: str, stage_started: float):
+            stages[name] = {
+                "start_ms": round((stage_started - started) * 1000, 1),
+                "duration_ms": round((time.perf_counter() - stage_started) * 1000, 1),
+            }
+
+        stage_started = time.perf_counter()
+        image = await prepare_image(image_bytes)
+        image_stats = image.stats()
+        _timed("prepare", stage_started)
+
+        stage_started = time.perf_counter()
+        description, system_type = await self.describe_diagram(image, analysis_id)
+        _timed("describe", stage_started)
+        yield "description", {"analysis_id": analysis_id, "diagram_description": description}
+        yield "system_type", {"system_type": system_type}
+
+        stage_started = time.perf_counter()
+        (sections, full_context), rag_chunks = await asyncio.gather(
+            self.load_category_codes(system_type, nec_version),
+            self.search_rag_chunks(description, nec_version)
+        )
+        _timed("codes", stage_started)
+        yield "codes_loaded", {
+            "articles": SYSTEM_TO_ARTICLES.get(system_type, [240, 250]),
+            "sections": len(sections),
+            "full_articles": len(full_context),
+            "rag_chunks": len(rag_chunks)
+        }
+
+        stage_started = time.perf_counter()
+        first_finding_ms = None
+        findings = []
+        relevant_codes = {"sections": sections, "full_context": full_context, "rag_chunks": rag_chunks}
+        async for finding in self.stream_compliance(image, description, relevant_codes, analysis_id):
+            if first_finding_ms is None:
+                first_finding_ms = round((time.perf_counter() - started) * 1000, 1)
+            findings.append(finding)
+            yield "finding", finding
+        _timed("compliance", stage_started)
+
+        timings = {
+            "stages": stages,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "first_finding_ms": first_finding_ms
+        }
+        print(f"[{analysis_id}] Streamed {len(findings)} findings, first after {first_finding_ms} ms, "
+              f"total {timings['total_ms']} ms")
+
+        result, created_at = self._build_result(analysis_id, nec_version, system_type, description, findings)
+        _run_in_background(self._persist_result(analysis_id, result, created_at, timings, cache_key, image_stats))
+        yield "complete", result
+
+    def _build_result(
+        self,
+        analysis_id: str,
+        nec_version: str,
+        system_type: str,
+        description: str,
+        findings: list,
+        dedupe_standards: bool = False
+    ) -> tuple[dict, datetime]:
+        """
+        Score the findings and assemble the response payload
+
+        With `dedupe_standards` (multi-sheet sets) the summary counts each NEC
+        standard once at its worst status; `findings` keeps every sheet's entry.
+        """
+        statuses = summary_statuses(findings) if dedupe_standards else [f.get("status") for f in findings]
 
         # Count by status
-        passing_count = sum(1 for f in findings if f.get("status") == "pass")
-        warning_count = sum(1 for f in findings if f.get("status") == "warning")
-        failing_count = sum(1 for f in findings if f.get("status") == "fail")
-        not_applicable_count = sum(1 for f in findings if f.get("status") == "not_applicable")
+        passing_count = statuses.count("pass")
+        warning_count = statuses.count("warning")
+        failing_count = statuses.count("fail")
+        not_applicable_count = statuses.count("not_applicable")
 
         print(f"[{analysis_id}] Generated findings: {passing_count} pass, "
               f"{warning_count} warning, {failing_count} fail, {not_applicable_count} not_applicable")
@@ -386,7 +1148,6 @@ class ComplianceChecker:
         else:
             score = 0.0
 
-        from datetime import datetime
         created_at = datetime.utcnow()
 
         # Build structured result matching frontend contract
@@ -407,20 +1168,78 @@ class ComplianceChecker:
                 "compliance_score": round(score, 1)
             }
         }
+        return result, created_at
 
-        # Step 4: Store in database
-        db = get_database()
-        await db.analyses.insert_one({
+    async def _persist_result(
+        self,
+        analysis_id: str,
+        result: dict,
+        created_at: datetime,
+        timings: dict,
+        cache_key: str | None,
+        image_stats: dict | list[dict] | None = None
+    ):
+        """Store a completed analysis and populate the result cache"""
+        # (upsert: async jobs already have a 'queued' record under this ID)
+        fields = {
             "analysis_id": analysis_id,
             "status": "completed",
-            "system_type": system_type,
-            "diagram_description": description,
-            "findings": findings,
+            "system_type": result["system_type"],
+            "diagram_description": result["diagram_description"],
+            "findings": result["findings"],
             "summary": result["summary"],
             "created_at": created_at,
-            "nec_version": nec_version
-        })
+            "nec_version": result["nec_version"],
+            "timings": timings,
+            "image": image_stats
+        }
+        # Single-image analyses are indexed for near-duplicate reuse (drawing sets are not)
+        phash = image_stats.get("phash") if isinstance(image_stats, dict) else None
+        if phash:
+            fields["phash"] = phash
+            fields["phash_size"] = settings.phash_size
+
+        db = get_database()
+        await db.analyses.update_one({"analysis_id": analysis_id}, {"$set": fields}, upsert=True)
 
         print(f"[{analysis_id}] Analysis complete and stored")
 
+        if cache_key is not None:
+            await get_result_cache().put(cache_key, result["nec_version"], result)
+
+        index = get_phash_index()
+        if phash and index is not None and len(phash) == index.hash_bytes * 2:
+            if index.add(bytes.fromhex(phash), analysis_id):
+                await index.merge()
+
+    async def _store_cached_result(self, analysis_id: str, cached: dict, persist_in_background: bool = False) -> dict:
+        """Re-issue a cached payload under a new analysis ID and store it"""
+        created_at = datetime.utcnow()
+        result = {
+            **cached,
+            "analysis_id": analysis_id,
+            "created_at": created_at.isoformat() + "Z",
+        }
+
+        db = get_database()
+        write = db.analyses.update_one(
+            {"analysis_id": analysis_id},
+            {"$set": {
+                "analysis_id": analysis_id,
+                "status": "completed",
+                "system_type": result["system_type"],
+                "diagram_description": result["diagram_description"],
+                "findings": result["findings"],
+                "summary": result["summary"],
+                "created_at": created_at,
+                "nec_version": result["nec_version"],
+                "cached": True
+            }},
+            upsert=True
+        )
+        if persist_in_background:
+            _run_in_background(write)
+        else:
+            await write
+
         return result
@@ -14,6 +14,106 @@ class Settings(BaseSettings):
     fireworks_text_model: str = "accounts/fireworks/models/llama-v3p1-70b-instruct"
     fireworks_embedding_model: str = "nomic-ai/nomic-embed-text-v1.5"
 
+    # Fireworks HTTP transport (shared keep-alive pool)
+    fireworks_base_url: str = "https://api.fireworks.ai/inference/v1"
+    fireworks_http2: bool = True
+    fireworks_max_connections: int = 100
+    fireworks_max_keepalive_connections: int = 20
+    fireworks_keepalive_expiry: float = 30.0
+    fireworks_connect_timeout: float = 10.0
+    fireworks_timeout: float = 60.0
+    fireworks_vision_timeout: float = 180.0
+    fireworks_embedding_timeout: float = 30.0
+    fireworks_embedding_batch_size: int = 128
+    fireworks_embedding_batch_chars: int = 200_000
+    fireworks_embedding_concurrency: int = 4
+
+    # Client-side rate limiting shared by every Fireworks call (0 disables a bucket)
+    fireworks_rpm_limit: int = 600
+    fireworks_tpm_limit: int = 0
+    fireworks_initial_concurrency: int = 8
+    fireworks_min_concurrency: int = 1
+    fireworks_max_concurrency: int = 64
+    fireworks_latency_spike_factor: float = 3.0
+    fireworks_max_retries: int = 4
+    fireworks_retry_base_delay: float = 0.5
+    fireworks_retry_max_delay: float = 30.0
+
+    # Hedged vision calls: duplicate a call still running at this latency percentile
+    vision_hedge_enabled: bool = False
+    vision_hedge_percentile: float = 95.0
+    vision_hedge_budget: float = 0.05
+    vision_hedge_min_samples: int = 20
+    vision_hedge_min_delay: float = 1.0
+
+    # Analysis mode: "two_pass" (describe, then check) or "single_pass" (one vision call)
+    analysis_mode: str = "two_pass"
+    single_pass_context_tokens: int = 6000
+    single_pass_item_tokens: int = 60
+
+    # Near-duplicate drawings: reuse the description of a prior analysis within this dHash distance
+    phash_reuse_enabled: bool = False
+    phash_size: int = 16  # hash is size*size bits; must be a multiple of 4
+    phash_max_distance: int = 12
+
+    # Compliance prompt: NEC context budget in tokens (counted with tiktoken when installed)
+    compliance_context_tokens: int = 6000
+    compliance_item_min_tokens: int = 120
+    compliance_item_max_tokens: int = 600
+    context_tokenizer: str = "cl100k_base"
+
+    # Largest accepted upload (decoded image or PDF bytes)
+    max_upload_bytes: int = 25 * 1024 * 1024
+
+    # Image normalization before vision calls
+    image_normalize_enabled: bool = True
+    image_max_edge: int = 2048
+    image_grayscale_tolerance: int = 8
+
+    # Multi-sheet PDF drawing sets
+    pdf_render_dpi: int = 150
+    pdf_render_workers: int = 4
+    pdf_max_sheets: int = 50
+    sheet_concurrency: int = 8
+
+    # Result cache (analysis payloads keyed by image hash + NEC version + models)
+    result_cache_enabled: bool = True
+    result_cache_max_entries: int = 256
+    result_cache_ttl_seconds: int = 7 * 24 * 3600
+
+    # Embedding cache (keyed by embedding model + normalized text hash)
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_entries: int = 20_000
+
+    # RAG retrieval backend: "atlas" ($vectorSearch), "local" (exact in-process
+    # index) or "hnsw" (approximate in-process graph index)
+    rag_backend: str = "atlas"
+    vector_index_dir: str = "data/vector_index"
+    hnsw_index_dir: str = "data/hnsw_index"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+
+    # Retrieval: "vector" (rag_backend only) or "hybrid" (vector + local BM25, fused by RRF)
+    retrieval_mode: str = "vector"
+    bm25_index_dir: str = "data/bm25_index"
+    hybrid_candidates: int = 30
+
+    # Stored embedding format: "float" (BSON doubles, required by Atlas),
+    # "int8" or "binary" (float32 blob; the local index ranks candidates on compact codes)
+    embedding_storage: str = "float"
+    vector_rescore_factor: int = 4
+
+    # In-memory NEC catalog and retrieval indexes: seconds between corpus version stamp checks
+    catalog_refresh_seconds: float = 30.0
+
+    # Async analysis jobs
+    analysis_workers: int = 4
+    analysis_queue_size: int = 100
+
+    # NEC PDF parsing
+    pdf_parse_workers: int = 4
+
     # Application
     debug: bool = False
     host: str = "0.0.0.0"
@@ -0,0 +1,245 @@
+"""Token-budgeted assembly of NEC context for the compliance prompt"""
+import importlib.util
+import re
+from functools import lru_cache
+from typing import Iterator
+
+from app.config import settings
+
+
+# Spans are lines, or sentences within a line (NEC text runs list items "(1) ..." together)
+_SPAN_BREAK = re.compile(r"\s*\n\s*|(?<=[.;:])\s+(?=[A-Z(])")
+
+# Shown where spans already included elsewhere in the prompt were cut out
+GAP_MARKER = "…"
+
+# Spans shorter than this (headings like "General.", list markers) are never
+# treated as duplicates: the same short text in another section is not shared content
+DEDUPE_MIN_TOKENS = 8
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    """tiktoken encoding, or None to estimate (tiktoken missing or its BPE file unavailable)"""
+    if importlib.util.find_spec("tiktoken") is None:
+        return None
+
+    import tiktoken
+    try:
+        return tiktoken.get_encoding(settings.context_tokenizer)
+    except Exception as e:
+        print(f"Tokenizer {settings.context_tokenizer} unavailable, estimating 4 chars/token: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens in `text` (local tokenizer, or ~4 characters per token without one)"""
+    encoder = _encoder()
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def _raw_spans(text: str) -> Iterator[tuple[str, str]]:
+    """Split text into (separator before, span) pairs at _SPAN_BREAK, lazily"""
+    position, separator = 0, ""
+    for match in _SPAN_BREAK.finditer(text):
+        span = text[position:match.start()].strip()
+        if span:
+            yield separator, span
+            separator = ""
+        # A line break anywhere in the gap wins over a space
+        if "\n" in match.group() or separator == "\n":
+            separator = "\n"
+        else:
+            separator = " "
+        position = match.end()
+
+    tail = text[position:].strip()
+    if tail:
+        yield separator, tail
+
+
+def _spans(text: str) -> Iterator[tuple[str, str]]:
+    """
+    Split text into (separator before, span) pairs, lazily
+
+    A label ending in ":" ("Exception:", "Exception No. 2:") stays attached
+    to the text it introduces, so it is never kept or cut on its own.
+    """
+    label = None
+    for separator, span in _raw_spans(text):
+        if label is not None:
+            separator, span = label[0], label[1] + separator + span
+            label = None
+        if span.endswith(":"):
+            label = (separator, span)
+            continue
+        yield separator, span
+
+    if label is not None:
+        yield label
+
+
+def _span_key(span: str) -> str:
+    """Normalized span text, so whitespace and punctuation differences still match"""
+    return " ".join(re.sub(r"[^\w().]+", " ", span.lower()).split())
+
+
+class _Item:
+    """
+    One candidate item and how much of it has been taken
+
+    Spans are split, normalized and counted only when the fill reaches them,
+    so the unused tail of a long article is never tokenized.
+    """
+
+    def __init__(self, group: str, heading: str, text: str):
+        self.group = group
+        self.heading = heading
+        self._heading_tokens: int | None = None
+        self._pending = _spans(text)
+        self.spans: list[tuple[str, str, str, int | None]] = []
+        self.exhausted = False
+        self.taken: set[int] = set()
+        self.cursor = 0
+        self.tokens = 0
+
+    @property
+    def heading_tokens(self) -> int:
+        if self._heading_tokens is None:
+            self._heading_tokens = count_tokens(self.heading) + 1
+        return self._heading_tokens
+
+    def span(self, index: int) -> tuple[str, str, str, int | None] | None:
+        """Span `index` (split and normalized on first access), or None past the end"""
+        while len(self.spans) <= index and not self.exhausted:
+            try:
+                separator, span = next(self._pending)
+            except StopIteration:
+                self.exhausted = True
+                break
+            self.spans.append((separator, span, _span_key(span), None))
+        return self.spans[index] if index < len(self.spans) else None
+
+    def span_tokens(self, index: int) -> int:
+        """Token cost of span `index` (counted on first use)"""
+        separator, span, key, tokens = self.spans[index]
+        if tokens is None:
+            tokens = count_tokens(span) + 1
+            self.spans[index] = (separator, span, key, tokens)
+        return tokens
+
+    @property
+    def truncated(self) -> bool:
+        return not self.exhausted or len(self.taken) < len(self.spans)
+
+    def render(self) -> str:
+        parts = []
+        for index, (separator, span, _, _) in enumerate(self.spans):
+            if index in self.taken:
+                parts.append(separator + span)
+            elif parts and parts[-1] != " " + GAP_MARKER:
+                parts.append(" " + GAP_MARKER)
+        if not self.exhausted and parts and parts[-1] != " " + GAP_MARKER:
+            parts.append(" " + GAP_MARKER)
+        return f"\n{self.heading}\n" + "".join(parts).strip()
+
+
+class ContextBudget:
+    """
+    Fill a token budget with context items, most relevant first
+
+    RAG chunks, category sections and full articles are all cut from the
+    same articles, so a span (line or sentence) of at least
+    DEDUPE_MIN_TOKENS tokens is only included once: by the first item to
+    claim it. Items are added in relevance order and the
+    budget is filled in two passes: first every item gets up to
+    `item_min_tokens` (so each distinct code is represented), then items
+    are extended to `item_max_tokens` in relevance order while budget lasts.
+    """
+
+    def __init__(self, budget: int, item_min_tokens: int, item_max_tokens: int):
+        self.budget = budget
+        self.item_min_tokens = item_min_tokens
+        self.item_max_tokens = item_max_tokens
+        self.used = 0
+        self._items: list[_Item] = []
+        self._seen: set[str] = set()
+
+    def add(self, group: str, heading: str, text: str):
+        """
+        Queue an item (call in relevance order)
+
+        Args:
+            group: Prompt section the item belongs under
+            heading: Item heading line (kept with any part of the item)
+            text: Item body
+        """
+        self._items.append(_Item(group, heading, text))
+
+    def _extend(self, item: _Item, limit: int):
+        """Take the item's next unclaimed spans until it reaches `limit` tokens or the budget runs out"""
+        while self.used < self.budget:
+            entry = item.span(item.cursor)
+            if entry is None:
+                return
+            tokens = item.span_tokens(item.cursor)
+            dedupe = tokens >= DEDUPE_MIN_TOKENS
+            if dedupe and entry[2] in self._seen:
+                item.cursor += 1
+                continue
+
+            cost = tokens + (0 if item.taken else item.heading_tokens)
+            # The first span of an item may exceed the per-pass limit, but not the item cap
+            over_limit = item.tokens + cost > (limit if item.taken else self.item_max_tokens)
+            if over_limit or self.used + cost > self.budget:
+                return
+
+            if dedupe:
+                self._seen.add(entry[2])
+            item.taken.add(item.cursor)
+            item.tokens += cost
+            self.used += cost
+            item.cursor += 1
+
+    def render(self) -> str:
+        """
+        Fill the budget and render included items under their group headings
+
+        Groups appear in the order they were first added; items keep their
+        relative order, with cut spans marked by GAP_MARKER.
+        """
+        for item in self._items:
+            self._extend(item, self.item_min_tokens)
+        for item in self._items:
+            self._extend(item, self.item_max_tokens)
+
+        groups: dict[str, list[str]] = {}
+        for item in self._items:
+            if item.taken:
+                groups.setdefault(item.group, []).append(item.render())
+
+        parts = []
+        for group, items in groups.items():
+            parts.append(f"\n\n# {group}\n")
+            parts.extend(items)
+        return "\n".join(parts)
+
+    def stats(self) -> dict:
+        """What was kept and cut (after `render`), for logging"""
+        included = [item for item in self._items if item.taken]
+        # Over the spans the fill reached (the rest were never tokenized)
+        claimed_elsewhere = sum(
+            item.span_tokens(index) for item in self._items
+            for index, (_, _, key, _) in enumerate(item.spans)
+            if index not in item.taken and key in self._seen and item.span_tokens(index) >= DEDUPE_MIN_TOKENS
+        )
+        return {
+            "budget": self.budget,
+            "context_tokens": self.used,
+            "items_included": len(included),
+            "items_truncated": sum(1 for item in included if item.truncated),
+            "items_dropped": len(self._items) - len(included),
+            "duplicate_tokens_removed": claimed_elsewhere,
+        }
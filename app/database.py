@@ -1,7 +1,11 @@
 """MongoDB database connection and utilities"""
+from datetime import datetime
+
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from pymongo import IndexModel, ASCENDING
+from pymongo import IndexModel, ASCENDING, ReturnDocument
 from app.config import settings
+from app.hnsw_index import get_hnsw_index
+from app.vector_index import get_vector_index
 
 # Global database client
 _client: AsyncIOMotorClient | None = None
@@ -37,6 +41,33 @@ def get_database() -> AsyncIOMotorDatabase:
     return _db
 
 
+async def get_corpus_version(db: AsyncIOMotorDatabase | None = None) -> int:
+    """
+    Current NEC corpus version stamp
+
+    The stamp is bumped by ingestion whenever nec_codes / nec_full_text change,
+    so in-process copies of the corpus can tell when they are stale.
+
+    Returns:
+        Version counter (0 if the corpus has never been stamped)
+    """
+    db = db if db is not None else get_database()
+    doc = await db.corpus_meta.find_one({"_id": "nec"}, {"version": 1})
+    return doc.get("version", 0) if doc else 0
+
+
+async def bump_corpus_version(db: AsyncIOMotorDatabase | None = None) -> int:
+    """Mark the NEC corpus as changed; returns the new version stamp"""
+    db = db if db is not None else get_database()
+    doc = await db.corpus_meta.find_one_and_update(
+        {"_id": "nec"},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+
 async def create_indexes():
     """Create necessary indexes including vector search index"""
     db = get_database()
@@ -154,20 +185,32 @@ async def vector_search(
     return results
 
 
-async def rag_search(query_embedding: list[float], limit: int = 10) -> list[dict]:
+async def rag_search(
+    query_embedding: list[float],
+    limit: int = 10,
+    nec_version: str | None = None,
+    article: int | list[int] | None = None
+) -> list[dict]:
     """
     RAG: Semantic search for relevant NEC chunks.
 
-    Searches the nec_chunks collection for semantically similar text.
+    Searches the nec_chunks collection for semantically similar text, using
+    the backend selected by `settings.rag_backend`:
+    - "atlas": MongoDB Atlas `$vectorSearch` (one round trip per query)
+    - "local": in-process memory-mapped index built at ingest time
+      (falls back to Atlas if the index has not been built)
+    - "hnsw": in-process approximate graph index, one graph per NEC version
 
     Args:
         query_embedding: Query vector (from diagram description)
         limit: Number of results to return
+        nec_version: Only return chunks of this NEC version
+        article: Only return chunks from this article (or these articles)
 
     Returns:
         List of matching chunks with text and metadata
 
-    Note: Requires vector index "chunk_vector_index" on nec_chunks.embedding
+    Note: The Atlas backend requires vector index "chunk_vector_index" on nec_chunks.embedding
     Create in MongoDB Atlas UI:
     {
       "fields": [
@@ -180,18 +223,40 @@ async def rag_search(query_embedding: list[float], limit: int = 10) -> list[dict
       ]
     }
     """
+    if settings.rag_backend == "local":
+        index = get_vector_index()
+        if index is not None:
+            return index.search(query_embedding, limit=limit, nec_version=nec_version, article=article)
+        print("Local vector index not loaded, falling back to Atlas vector search")
+
+    if settings.rag_backend == "hnsw":
+        index = get_hnsw_index()
+        if index is not None and len(index):
+            return index.search(query_embedding, limit=limit, nec_version=nec_version, article=article)
+        print("HNSW index not loaded, falling back to Atlas vector search")
+
     db = get_database()
 
+    # Post-filter so the Atlas index does not need filter fields declared
+    post_filter = {}
+    if nec_version is not None:
+        post_filter["nec_version"] = nec_version
+    if article is not None:
+        post_filter["article"] = {"$in": article} if isinstance(article, list) else article
+    candidates = limit * 4 if post_filter else limit
+
     pipeline = [
         {
             "$vectorSearch": {
                 "index": "chunk_vector_index",
                 "path": "embedding",
                 "queryVector": query_embedding,
-                "numCandidates": limit * 10,
-                "limit": limit,
+                "numCandidates": candidates * 10,
+                "limit": candidates,
             }
         },
+        {"$match": post_filter},
+        {"$limit": limit},
         {
             "$project": {
                 "_id": 0,
@@ -0,0 +1,121 @@
+"""Rasterize multi-sheet PDF drawing sets for the vision pipeline"""
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pymupdf
+
+from app.config import settings
+
+
+class DrawingSetError(ValueError):
+    """Raised when an uploaded PDF drawing set cannot be rasterized"""
+
+
+def is_pdf(data: bytes, content_type: str | None = None, filename: str | None = None) -> bool:
+    """True if an upload is a PDF (by magic bytes, content type or extension)"""
+    if data[:5] == b"%PDF-":
+        return True
+    if content_type == "application/pdf":
+        return True
+    return bool(filename) and filename.lower().endswith(".pdf")
+
+
+def _render_page(pdf_path: str, page_number: int, dpi: int) -> bytes:
+    """Render one PDF page to PNG bytes (runs in a worker process)"""
+    with pymupdf.open(pdf_path) as doc:
+        return doc[page_number].get_pixmap(dpi=dpi).tobytes("png")
+
+
+def _page_count(pdf_path: str) -> int:
+    with pymupdf.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def _stream_page_count(pdf_bytes: bytes) -> int:
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return doc.page_count
+
+
+def _check_page_count(pages: int):
+    if pages == 0:
+        raise DrawingSetError("PDF has no pages")
+    if pages > settings.pdf_max_sheets:
+        raise DrawingSetError(f"PDF has {pages} sheets (limit {settings.pdf_max_sheets})")
+
+
+async def check_drawing_set(pdf_bytes: bytes) -> int:
+    """
+    Validate a PDF drawing set without rendering it (e.g. before queueing it)
+
+    Returns:
+        Number of sheets
+
+    Raises:
+        DrawingSetError: If the PDF cannot be opened, has no pages or has more
+            than `settings.pdf_max_sheets` pages
+    """
+    try:
+        pages = await asyncio.to_thread(_stream_page_count, bytes(pdf_bytes))
+    except Exception as e:
+        raise DrawingSetError(f"Cannot open PDF: {e}") from e
+    _check_page_count(pages)
+    return pages
+
+
+# Global render pool (created on first use)
+_render_pool: ProcessPoolExecutor | None = None
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=settings.pdf_render_workers)
+    return _render_pool
+
+
+def shutdown_render_pool():
+    """Stop the render worker processes"""
+    global _render_pool
+
+    if _render_pool is not None:
+        _render_pool.shutdown(cancel_futures=True)
+        _render_pool = None
+
+
+async def rasterize_pdf(pdf_bytes: bytes) -> list[bytes]:
+    """
+    Render every sheet of a PDF drawing set to PNG, pages in parallel
+
+    Args:
+        pdf_bytes: PDF file contents
+
+    Returns:
+        PNG bytes per sheet, in page order
+
+    Raises:
+        DrawingSetError: If the PDF cannot be opened, has no pages or has more
+            than `settings.pdf_max_sheets` pages
+    """
+    # Workers open the file by path rather than receiving the whole PDF per page
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_file:
+        tmp_file.write(pdf_bytes)
+        pdf_path = tmp_file.name
+
+    try:
+        try:
+            pages = await asyncio.to_thread(_page_count, pdf_path)
+        except Exception as e:
+            raise DrawingSetError(f"Cannot open PDF: {e}") from e
+        _check_page_count(pages)
+
+        loop = asyncio.get_running_loop()
+        pool = _get_render_pool()
+        return list(await asyncio.gather(*(
+            loop.run_in_executor(pool, _render_page, pdf_path, page, settings.pdf_render_dpi)
+            for page in range(pages)
+        )))
+    finally:
+        os.unlink(pdf_path)
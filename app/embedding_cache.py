@@ -0,0 +1,134 @@
+"""Cache of embedding vectors keyed by (embedding model, normalized text hash)"""
+import hashlib
+import sys
+from array import array
+from collections import OrderedDict
+
+from bson.binary import Binary
+from pymongo.errors import BulkWriteError
+
+from app.database import get_database
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different strings share a cache entry"""
+    return " ".join(text.split())
+
+
+def pack_vector(vector) -> Binary:
+    """Encode a vector as little-endian float32 bytes (4 bytes/dim vs 8+ for BSON doubles)"""
+    values = array("f", vector)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return Binary(values.tobytes())
+
+
+def unpack_vector(data: bytes) -> list[float]:
+    """Decode a vector written by pack_vector"""
+    values = array("f")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache.
+
+    Tier 1 is an in-process LRU; tier 2 is the `embedding_cache` collection,
+    which stores each vector as a compact float32 binary blob. The durable
+    tier is skipped when no database connection is available.
+    """
+
+    COLLECTION = "embedding_cache"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, list[float]] = OrderedDict()
+        self.memory_hits = 0
+        self.durable_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(normalize_text(text).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _collection():
+        try:
+            return get_database()[EmbeddingCache.COLLECTION]
+        except RuntimeError:
+            return None
+
+    def _remember(self, key: str, vector: list[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        """
+        Look up cached vectors
+
+        Returns:
+            One entry per text: the cached vector, or None on a miss
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        results: list[list[float] | None] = [None] * len(texts)
+
+        missing: dict[str, list[int]] = {}
+        for i, key in enumerate(keys):
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                results[i] = vector
+                self.memory_hits += 1
+            else:
+                missing.setdefault(key, []).append(i)
+
+        collection = self._collection()
+        if missing and collection is not None:
+            cursor = collection.find({"_id": {"$in": list(missing)}}, {"vector": 1})
+            async for doc in cursor:
+                vector = unpack_vector(doc["vector"])
+                self._remember(doc["_id"], vector)
+                for i in missing.pop(doc["_id"]):
+                    results[i] = vector
+                    self.durable_hits += 1
+
+        self.misses += sum(len(positions) for positions in missing.values())
+        return results
+
+    async def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        """Store vectors in both tiers"""
+        docs = {}
+        for text, vector in zip(texts, vectors):
+            key = self.make_key(model, text)
+            self._remember(key, vector)
+            docs[key] = {"_id": key, "model": model, "dim": len(vector), "vector": pack_vector(vector)}
+
+        collection = self._collection()
+        if docs and collection is not None:
+            try:
+                await collection.insert_many(list(docs.values()), ordered=False)
+            except BulkWriteError as e:
+                # Duplicate keys just mean another writer cached the same text first
+                errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+                if errors:
+                    print(f"Embedding cache write failed for {len(errors)} vectors: {errors[0].get('errmsg')}")
+
+    def stats(self) -> dict:
+        """Hit/miss counters and local tier size"""
+        lookups = self.memory_hits + self.durable_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "durable_hits": self.durable_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.durable_hits) / lookups, 3) if lookups else 0.0,
+            "local_entries": len(self._entries),
+        }
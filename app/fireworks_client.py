@@ -1,84 +1,319 @@
 """Fireworks AI client for vision, text, and embedding models"""
 import asyncio
-from fireworks.client import Fireworks
+import importlib.util
+import json
+from typing import AsyncIterator
+
+import httpx
 from app.config import settings
+from app.embedding_cache import EmbeddingCache, normalize_text
+from app.hedging import HedgePolicy, get_vision_hedger
+from app.image_prep import PreparedImage, estimate_vision_tokens
+from app.rate_limiter import Permit, backoff_delay, estimate_request_tokens, get_rate_limiter
+
+
+# Responses and transport errors worth retrying after a backoff
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
 
 
 class FireworksClient:
     """Client for interacting with Fireworks AI models"""
 
     def __init__(self):
-        """Initialize Fireworks client using Fireworks SDK"""
-        self.client = Fireworks(api_key=settings.fireworks_api_key)
+        """Initialize a pooled asyncio HTTP client for the Fireworks REST API"""
+        # HTTP/2 multiplexes concurrent calls over few connections, but needs the optional h2 package
+        http2 = settings.fireworks_http2 and importlib.util.find_spec("h2") is not None
+
+        self.client = httpx.AsyncClient(
+            base_url=settings.fireworks_base_url,
+            headers={"Authorization": f"Bearer {settings.fireworks_api_key}"},
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.fireworks_max_connections,
+                max_keepalive_connections=settings.fireworks_max_keepalive_connections,
+                keepalive_expiry=settings.fireworks_keepalive_expiry
+            ),
+            timeout=httpx.Timeout(
+                settings.fireworks_timeout,
+                connect=settings.fireworks_connect_timeout
+            )
+        )
         self.vision_model = settings.fireworks_vision_model
         self.text_model = settings.fireworks_text_model
         self.embedding_model = settings.fireworks_embedding_model
+        self.embedding_cache = (
+            EmbeddingCache(settings.embedding_cache_max_entries)
+            if settings.embedding_cache_enabled else None
+        )
+
+    async def aclose(self):
+        """Close pooled connections"""
+        await self.client.aclose()
+
+    async def _post(
+        self,
+        path: str,
+        payload: dict,
+        timeout: float | None = None,
+        image_tokens: int | None = None,
+        hedger: HedgePolicy | None = None
+    ) -> dict:
+        """
+        POST a JSON payload to the Fireworks API through the shared rate limiter
+
+        429s, overload responses (5xx) and connection failures are retried
+        with jittered exponential backoff, up to `settings.fireworks_max_retries`
+        times; each attempt is admitted by the limiter separately.
+
+        With a `hedger`, only the HTTP send of an admitted attempt is hedged:
+        time spent waiting on the limiter or backing off never starts a hedge.
+
+        Args:
+            path: API path relative to the base URL
+            payload: JSON request body
+            timeout: Per-call timeout in seconds (client default if None)
+            image_tokens: Visual tokens per image, for the TPM reservation
+            hedger: Hedge policy for the send (no hedging if None)
+
+        Returns:
+            Decoded JSON response body
+
+        Raises:
+            httpx.HTTPStatusError: If the final attempt fails with an HTTP error
+        """
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        limiter = get_rate_limiter()
+        model = payload.get("model", path)
+        estimated = estimate_request_tokens(payload, image_tokens)
+        retries = settings.fireworks_max_retries
+
+        def send():
+            return self.client.post(path, json=payload, **kwargs)
+
+        for attempt in range(retries + 1):
+            final = attempt == retries
+            async with limiter.permit(model, estimated) as permit:
+                try:
+                    response = await (hedger.run(send) if hedger is not None else send())
+                except RETRYABLE_ERRORS:
+                    permit.overloaded = True
+                    if final:
+                        raise
+                else:
+                    self._record_status(permit, response)
+                    if final or response.status_code not in RETRYABLE_STATUS:
+                        response.raise_for_status()
+                        data = response.json()
+                        permit.tokens_used = (data.get("usage") or {}).get("total_tokens")
+                        return data
+
+            limiter.retries += 1
+            await asyncio.sleep(backoff_delay(attempt, permit.retry_after))
+
+    async def _stream(
+        self,
+        path: str,
+        payload: dict,
+        timeout: float | None = None,
+        image_tokens: int | None = None
+    ) -> AsyncIterator[str]:
+        """
+        POST a streaming chat completion and yield content deltas as they arrive
+
+        Admission and retries work as in `_post`, but only until the response
+        starts; once deltas have been yielded the stream is not retried.
+
+        Args:
+            path: API path relative to the base URL
+            payload: JSON request body (`stream` is set automatically)
+            timeout: Per-read timeout in seconds (client default if None)
+            image_tokens: Visual tokens per image, for the TPM reservation
+
+        Yields:
+            Text fragments of the assistant message
+        """
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        limiter = get_rate_limiter()
+        model = payload.get("model", path)
+        estimated = estimate_request_tokens(payload, image_tokens)
+        retries = settings.fireworks_max_retries
+        request = self.client.build_request("POST", path, json={**payload, "stream": True}, **kwargs)
+
+        for attempt in range(retries + 1):
+            final = attempt == retries
+            # Stream duration depends on output length, so it is not a latency signal
+            async with limiter.permit(model, estimated, track_latency=False) as permit:
+                try:
+                    response = await self.client.send(request, stream=True)
+                except RETRYABLE_ERRORS:
+                    permit.overloaded = True
+                    if final:
+                        raise
+                else:
+                    try:
+                        self._record_status(permit, response)
+                        if final or response.status_code not in RETRYABLE_STATUS:
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                # Server-sent events: only `data:` lines carry chunks
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+
+                                choices = json.loads(data).get("choices") or []
+                                delta = choices[0].get("delta", {}).get("content") if choices else None
+                                if delta:
+                                    yield delta
+                            return
+                    finally:
+                        await response.aclose()
+
+            limiter.retries += 1
+            await asyncio.sleep(backoff_delay(attempt, permit.retry_after))
+
+    @staticmethod
+    def _record_status(permit: Permit, response: httpx.Response):
+        """Mark a permit throttled (429) or overloaded (5xx) from the response status"""
+        if response.status_code == 429:
+            permit.throttled = True
+            try:
+                permit.retry_after = float(response.headers.get("retry-after", ""))
+            except ValueError:
+                permit.retry_after = None
+        elif response.status_code in RETRYABLE_STATUS:
+            permit.overloaded = True
+
+    @staticmethod
+    def _as_prepared(image: PreparedImage | bytes) -> PreparedImage:
+        return image if isinstance(image, PreparedImage) else PreparedImage.passthrough(image)
+
+    @staticmethod
+    def _image_tokens(image: PreparedImage) -> int | None:
+        """Estimated visual tokens (None when the dimensions are unknown)"""
+        return estimate_vision_tokens(image.width, image.height) if image.width else None
+
+    @staticmethod
+    def _image_messages(image: PreparedImage, prompt: str, system_prompt: str | None) -> list[dict]:
+        messages = []
+
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+
+        messages.append({
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image.data_url
+                    }
+                }
+            ]
+        })
+        return messages
+
+    @staticmethod
+    def _completion_result(data: dict) -> dict:
+        usage = data.get("usage") or {}
+        return {
+            "content": data["choices"][0]["message"]["content"],
+            "usage": {
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0),
+                "total_tokens": usage.get("total_tokens", 0)
+            }
+        }
 
     async def analyze_image(
         self,
-        image_base64: str,
+        image: PreparedImage | bytes,
         prompt: str,
         system_prompt: str | None = None,
-        max_tokens: int = 4096
+        max_tokens: int = 4096,
+        timeout: float | None = None
     ) -> dict:
         """
         Analyze an image using vision model
 
+        With `settings.vision_hedge_enabled`, a send that is slower than the
+        recent latency percentile is hedged with a duplicate (see app.hedging);
+        the clock starts once the rate limiter has admitted the attempt.
+
         Args:
-            image_base64: Base64-encoded image
+            image: Image to analyze (raw PNG bytes or a PreparedImage)
             prompt: User prompt for analysis
             system_prompt: Optional system prompt
             max_tokens: Maximum tokens in response
+            timeout: Per-call timeout in seconds
 
         Returns:
             Dictionary with 'content' and 'usage' keys
         """
-        def _call_vision_model():
-            messages = []
-
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-
-            messages.append({
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{image_base64}"
-                        }
-                    }
-                ]
-            })
-
-            return self.client.chat.completions.create(
-                model=self.vision_model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.1
-            )
+        image = self._as_prepared(image)
+        payload = {
+            "model": self.vision_model,
+            "messages": self._image_messages(image, prompt, system_prompt),
+            "max_tokens": max_tokens,
+            "temperature": 0.1
+        }
 
-        # Run sync client in thread pool
-        response = await asyncio.to_thread(_call_vision_model)
+        data = await self._post(
+            "/chat/completions", payload,
+            timeout=timeout or settings.fireworks_vision_timeout,
+            image_tokens=self._image_tokens(image),
+            hedger=get_vision_hedger() if settings.vision_hedge_enabled else None
+        )
+        return self._completion_result(data)
 
-        return {
-            "content": response.choices[0].message.content,
-            "usage": {
-                "prompt_tokens": response.usage.prompt_tokens,
-                "completion_tokens": response.usage.completion_tokens,
-                "total_tokens": response.usage.total_tokens
-            }
-        }
+    async def stream_image(
+        self,
+        image: PreparedImage | bytes,
+        prompt: str,
+        system_prompt: str | None = None,
+        max_tokens: int = 4096,
+        timeout: float | None = None
+    ) -> AsyncIterator[str]:
+        """
+        Analyze an image using vision model, streaming the response
+
+        Args:
+            image: Image to analyze (raw PNG bytes or a PreparedImage)
+            prompt: User prompt for analysis
+            system_prompt: Optional system prompt
+            max_tokens: Maximum tokens in response
+            timeout: Per-read timeout in seconds
+
+        Yields:
+            Text fragments of the response as they are generated
+        """
+        image = self._as_prepared(image)
+        async for delta in self._stream("/chat/completions", {
+            "model": self.vision_model,
+            "messages": self._image_messages(image, prompt, system_prompt),
+            "max_tokens": max_tokens,
+            "temperature": 0.1
+        }, timeout=timeout or settings.fireworks_vision_timeout, image_tokens=self._image_tokens(image)):
+            yield delta
 
     async def chat(
         self,
         messages: list[dict],
         max_tokens: int = 2048,
-        temperature: float = 0.3
+        temperature: float = 0.3,
+        timeout: float | None = None
     ) -> dict:
         """
         Generate text completion using chat model
@@ -87,48 +322,131 @@ class FireworksClient:
             messages: List of message dicts with 'role' and 'content'
             max_tokens: Maximum tokens in response
             temperature: Sampling temperature
+            timeout: Per-call timeout in seconds
 
         Returns:
             Dictionary with 'content' and 'usage' keys
         """
-        def _call_chat():
-            return self.client.chat.completions.create(
-                model=self.text_model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+        data = await self._post("/chat/completions", {
+            "model": self.text_model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }, timeout=timeout)
 
-        response = await asyncio.to_thread(_call_chat)
+        return self._completion_result(data)
 
-        return {
-            "content": response.choices[0].message.content,
-            "usage": {
-                "prompt_tokens": response.usage.prompt_tokens,
-                "completion_tokens": response.usage.completion_tokens,
-                "total_tokens": response.usage.total_tokens
-            }
-        }
-
-    async def generate_embedding(self, text: str) -> list[float]:
+    async def generate_embedding(self, text: str, timeout: float | None = None) -> list[float]:
         """
         Generate embedding vector for text
 
         Args:
             text: Text to embed
+            timeout: Per-call timeout in seconds
 
         Returns:
             List of floats representing the embedding vector
         """
-        def _call_embedding():
-            return self.client.embeddings.create(
-                model=self.embedding_model,
-                input=text
-            )
+        embeddings = await self.generate_embeddings([text], timeout=timeout)
+        return embeddings[0]
 
-        response = await asyncio.to_thread(_call_embedding)
+    async def generate_embeddings(
+        self,
+        texts: list[str],
+        batch_size: int | None = None,
+        concurrency: int | None = None,
+        timeout: float | None = None
+    ) -> list[list[float]]:
+        """
+        Generate embedding vectors for many texts
+
+        Cached vectors are served from the embedding cache; the remaining
+        texts are packed into provider-sized batches (by count and total
+        characters) which are sent concurrently under a limit.
+
+        Args:
+            texts: Texts to embed
+            batch_size: Maximum texts per request
+            concurrency: Maximum batches in flight at once
+            timeout: Per-request timeout in seconds
+
+        Returns:
+            Embedding vectors in the same order as `texts`
+        """
+        if self.embedding_cache is not None:
+            return await self._generate_embeddings_cached(texts, batch_size, concurrency, timeout)
+        return await self._generate_embeddings(texts, batch_size, concurrency, timeout)
+
+    async def _generate_embeddings_cached(
+        self,
+        texts: list[str],
+        batch_size: int | None,
+        concurrency: int | None,
+        timeout: float | None
+    ) -> list[list[float]]:
+        """Serve what the cache has, embed the rest once each, and cache them"""
+        results = await self.embedding_cache.get_many(self.embedding_model, texts)
+
+        # Deduplicate misses (as the cache does, by normalized text) so repeats cost one embedding
+        missing: dict[str, str] = {}
+        for text, vector in zip(texts, results):
+            if vector is None:
+                missing.setdefault(normalize_text(text), text)
+
+        if missing:
+            to_embed = list(missing.values())
+            vectors = await self._generate_embeddings(to_embed, batch_size, concurrency, timeout)
+            await self.embedding_cache.put_many(self.embedding_model, to_embed, vectors)
+            fetched = dict(zip(missing, vectors))
+            results = [
+                vector if vector is not None else fetched[normalize_text(text)]
+                for text, vector in zip(texts, results)
+            ]
 
-        return response.data[0].embedding
+        return results
+
+    async def _generate_embeddings(
+        self,
+        texts: list[str],
+        batch_size: int | None,
+        concurrency: int | None,
+        timeout: float | None
+    ) -> list[list[float]]:
+        """Embed texts in concurrent provider-sized batches (no caching)"""
+        batch_size = batch_size or settings.fireworks_embedding_batch_size
+        concurrency = concurrency or settings.fireworks_embedding_concurrency
+        max_chars = settings.fireworks_embedding_batch_chars
+
+        batches: list[list[str]] = []
+        current: list[str] = []
+        current_chars = 0
+        for text in texts:
+            if current and (len(current) >= batch_size or current_chars + len(text) > max_chars):
+                batches.append(current)
+                current, current_chars = [], 0
+            current.append(text)
+            current_chars += len(text)
+        if current:
+            batches.append(current)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _run(batch: list[str]) -> list[list[float]]:
+            async with semaphore:
+                return await self._embed_batch(batch, timeout=timeout)
+
+        results = await asyncio.gather(*(_run(batch) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    async def _embed_batch(self, texts: list[str], timeout: float | None = None) -> list[list[float]]:
+        """Embed one batch in a single request, returning vectors in input order"""
+        data = await self._post("/embeddings", {
+            "model": self.embedding_model,
+            "input": texts
+        }, timeout=timeout or settings.fireworks_embedding_timeout)
+
+        items = sorted(data["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in items]
 
 
 # Global client instance
@@ -143,3 +461,12 @@ def get_fireworks_client() -> FireworksClient:
         _fireworks_client = FireworksClient()
 
     return _fireworks_client
+
+
+async def close_fireworks_client():
+    """Close the shared Fireworks client's connection pool"""
+    global _fireworks_client
+
+    if _fireworks_client:
+        await _fireworks_client.aclose()
+        _fireworks_client = None
@@ -0,0 +1,157 @@
+"""Hedged requests: duplicate a slow call and keep whichever answer arrives first"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+import numpy as np
+
+from app.config import settings
+
+
+T = TypeVar("T")
+
+# Recent latencies the hedge delay is computed from
+LATENCY_WINDOW = 200
+
+# Hedges that can be saved up while traffic is fast
+BUDGET_BURST = 5.0
+
+
+class HedgePolicy:
+    """
+    Decides when to hedge a call and keeps the books
+
+    A call still running after the configured percentile of recent latency
+    gets a duplicate; the first successful result wins and the other task is
+    cancelled. Hedging is budgeted: every call earns `budget` credits (up to
+    BUDGET_BURST) and each hedge spends one, so at most about `budget` of the
+    traffic is duplicated.
+    """
+
+    def __init__(self, percentile: float, budget: float, min_samples: int, min_delay: float):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._credits = 0.0
+
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.latency_saved = 0.0
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait before hedging (None until enough latencies are known)"""
+        if len(self._latencies) < max(1, self.min_samples):
+            return None
+        return max(self.min_delay, float(np.percentile(self._latencies, self.percentile)))
+
+    def _estimate_saved(self, elapsed: float) -> float:
+        """
+        Expected time saved by a hedge that answered after `elapsed` seconds
+
+        The cancelled primary had not answered by then either; its expected
+        latency is the mean of recent latencies above `elapsed` (none above
+        means no measurable saving).
+        """
+        slower = [latency for latency in self._latencies if latency > elapsed]
+        return sum(slower) / len(slower) - elapsed if slower else 0.0
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await `call()`, hedging it with a second `call()` if it is slow
+
+        Args:
+            call: Factory for the request coroutine (invoked once or twice)
+
+        Returns:
+            The first successful result
+
+        Raises:
+            Exception: The primary's error if every attempt failed
+        """
+        self.calls += 1
+        self._credits = min(BUDGET_BURST, self._credits + self.budget)
+        delay = self.hedge_delay()
+
+        started = time.monotonic()
+        primary = asyncio.create_task(call())
+        tasks = {primary}
+        try:
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+
+            if primary.done() or delay is None:
+                result = await primary
+                self._latencies.append(time.monotonic() - started)
+                return result
+
+            if self._credits < 1.0:
+                self.budget_denied += 1
+                result = await primary
+                self._latencies.append(time.monotonic() - started)
+                return result
+
+            self._credits -= 1.0
+            self.hedged += 1
+            hedge_started = time.monotonic()
+            hedge = asyncio.create_task(call())
+            tasks.add(hedge)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is None:
+                    continue
+
+                now = time.monotonic()
+                if winner is hedge:
+                    self.hedge_wins += 1
+                    self.latency_saved += self._estimate_saved(now - started)
+                    self._latencies.append(now - hedge_started)
+                else:
+                    self._latencies.append(now - started)
+                return winner.result()
+
+            # Both failed: surface the primary's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        """Hedging counters, for /metrics"""
+        delay = self.hedge_delay()
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "budget_denied": self.budget_denied,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            "estimated_latency_saved_ms": round(self.latency_saved * 1000, 1),
+        }
+
+
+# Global policy for vision calls (created on first use)
+_vision_hedger: HedgePolicy | None = None
+
+
+def get_vision_hedger() -> HedgePolicy:
+    """Get or create the hedge policy shared by vision calls"""
+    global _vision_hedger
+
+    if _vision_hedger is None:
+        _vision_hedger = HedgePolicy(
+            percentile=settings.vision_hedge_percentile,
+            budget=settings.vision_hedge_budget,
+            min_samples=settings.vision_hedge_min_samples,
+            min_delay=settings.vision_hedge_min_delay
+        )
+
+    return _vision_hedger
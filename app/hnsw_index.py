@@ -0,0 +1,416 @@
+"""Approximate-nearest-neighbour (HNSW) index over nec_chunks embeddings"""
+import asyncio
+import heapq
+import json
+import math
+import os
+import random
+from pathlib import Path
+
+import numpy as np
+
+from app.config import settings
+from app.quantization import decode_embedding
+
+
+class HNSWGraph:
+    """
+    Hierarchical navigable small-world graph over L2-normalized vectors.
+
+    Distance is 1 - cosine similarity. Deletions are tombstones: deleted
+    nodes still route searches but are never returned, and compact()
+    rebuilds the graph once too many accumulate.
+    """
+
+    def __init__(self, dim: int, m: int = 16, ef_construction: int = 200, seed: int = 42):
+        self.dim = dim
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.level_mult = 1 / math.log(m)
+        self._rng = random.Random(seed)
+
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.count = 0
+        self.levels: list[int] = []
+        self.neighbors: list[list[list[int]]] = []   # node -> level -> neighbor ids
+        self.payloads: list[dict] = []
+        self.deleted: set[int] = set()
+        self.ids: dict[str, int] = {}                 # chunk_id -> live node
+        self.entry_point: int | None = None
+        self.max_level = -1
+
+    def __len__(self) -> int:
+        return self.count - len(self.deleted)
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    def _append_vector(self, vector: np.ndarray) -> int:
+        if self.count == len(self.vectors):
+            grown = np.zeros((max(64, 2 * len(self.vectors)), self.dim), dtype=np.float32)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+        self.vectors[self.count] = vector
+        self.count += 1
+        return self.count - 1
+
+    def add(self, chunk_id: str, vector, payload: dict):
+        """Insert a vector (replacing any live node with the same chunk_id)"""
+        self.remove(chunk_id)
+
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return
+        vector = vector / norm
+
+        node = self._append_vector(vector)
+        level = int(-math.log(1.0 - self._rng.random()) * self.level_mult)
+        self.levels.append(level)
+        self.neighbors.append([[] for _ in range(level + 1)])
+        self.payloads.append(payload)
+        self.ids[chunk_id] = node
+
+        if self.entry_point is None:
+            self.entry_point = node
+            self.max_level = level
+            return
+
+        entry = [self.entry_point]
+        for layer in range(self.max_level, level, -1):
+            entry = [self._search_layer(vector, entry, 1, layer)[0][1]]
+
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(vector, entry, self.ef_construction, layer)
+            limit = self.m0 if layer == 0 else self.m
+            chosen = [other for _, other in candidates[:self.m]]
+            self.neighbors[node][layer] = chosen
+            for other in chosen:
+                links = self.neighbors[other][layer]
+                links.append(node)
+                if len(links) > limit:
+                    self._prune(other, layer, limit)
+            entry = [other for _, other in candidates]
+
+        if level > self.max_level:
+            self.entry_point = node
+            self.max_level = level
+
+    def _prune(self, node: int, layer: int, limit: int):
+        links = self.neighbors[node][layer]
+        distances = 1.0 - self.vectors[links] @ self.vectors[node]
+        keep = np.argsort(distances)[:limit]
+        self.neighbors[node][layer] = [links[i] for i in keep]
+
+    def remove(self, chunk_id: str) -> bool:
+        """Tombstone the live node for chunk_id"""
+        node = self.ids.pop(chunk_id, None)
+        if node is None:
+            return False
+        self.deleted.add(node)
+        return True
+
+    def compact(self) -> "HNSWGraph":
+        """Rebuild the graph from live nodes only"""
+        rebuilt = HNSWGraph(self.dim, self.m, self.ef_construction)
+        for chunk_id, node in sorted(self.ids.items(), key=lambda item: item[1]):
+            rebuilt.add(chunk_id, self.vectors[node], self.payloads[node])
+        return rebuilt
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def _search_layer(self, query: np.ndarray, entry: list[int], ef: int, layer: int) -> list[tuple[float, int]]:
+        """Best-first search of one layer; returns up to ef (distance, node) pairs, nearest first"""
+        visited = set(entry)
+        distances = 1.0 - self.vectors[entry] @ query
+        candidates = [(float(d), node) for d, node in zip(distances, entry)]
+        heapq.heapify(candidates)
+        results = [(-d, node) for d, node in candidates]   # max-heap of the ef best
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if distance > -results[0][0] and len(results) >= ef:
+                break
+
+            fresh = [other for other in self.neighbors[node][layer] if other not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+
+            # One vectorized distance computation per expanded node
+            fresh_distances = 1.0 - self.vectors[fresh] @ query
+            for other_distance, other in zip(fresh_distances.tolist(), fresh):
+                if len(results) < ef or other_distance < -results[0][0]:
+                    heapq.heappush(candidates, (other_distance, other))
+                    heapq.heappush(results, (-other_distance, other))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-d, node) for d, node in results)
+
+    def search(self, query, k: int, ef: int, article=None) -> list[tuple[float, int]]:
+        """
+        k nearest live nodes as (cosine similarity, node) pairs
+
+        With an article filter, ef is widened until k matches are found (or
+        the whole graph has been reachable), so filtered search stays a
+        graph walk rather than a scan.
+        """
+        if self.entry_point is None or len(self) == 0:
+            return []
+
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        wanted = None
+        if article is not None:
+            wanted = set(article) if isinstance(article, (list, tuple, set)) else {article}
+
+        entry = [self.entry_point]
+        for layer in range(self.max_level, 0, -1):
+            entry = [self._search_layer(query, entry, 1, layer)[0][1]]
+
+        ef = max(ef, k)
+        while True:
+            found = [
+                (1.0 - distance, node)
+                for distance, node in self._search_layer(query, entry, ef + len(self.deleted), 0)
+                if node not in self.deleted
+                and (wanted is None or self.payloads[node].get("article") in wanted)
+            ]
+            if len(found) >= k or ef >= self.count:
+                return found[:k]
+            ef *= 2
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path: Path):
+        """Write the graph as <path>.npz + <path>.json (renamed into place)"""
+        pair_offsets = [0]
+        adjacency: list[int] = []
+        for node_links in self.neighbors[:self.count]:
+            for links in node_links:
+                adjacency.extend(links)
+                pair_offsets.append(len(adjacency))
+
+        arrays_tmp = path.with_name(path.name + ".tmp.npz")
+        meta_tmp = path.with_name(path.name + ".json.tmp")
+        np.savez(
+            arrays_tmp,
+            vectors=self.vectors[:self.count],
+            levels=np.asarray(self.levels, dtype=np.int32),
+            pair_offsets=np.asarray(pair_offsets, dtype=np.int64),
+            adjacency=np.asarray(adjacency, dtype=np.int32),
+            deleted=np.asarray(sorted(self.deleted), dtype=np.int32),
+        )
+        meta_tmp.write_text(json.dumps({
+            "dim": self.dim,
+            "m": self.m,
+            "ef_construction": self.ef_construction,
+            "entry_point": self.entry_point,
+            "max_level": self.max_level,
+            "ids": self.ids,
+            "payloads": self.payloads,
+        }))
+        os.replace(arrays_tmp, path.with_name(path.name + ".npz"))
+        os.replace(meta_tmp, path.with_name(path.name + ".json"))
+
+    @classmethod
+    def load(cls, path: Path) -> "HNSWGraph":
+        meta = json.loads(path.with_name(path.name + ".json").read_text())
+        arrays = np.load(path.with_name(path.name + ".npz"))
+
+        graph = cls(meta["dim"], meta["m"], meta["ef_construction"])
+        graph.vectors = arrays["vectors"]
+        graph.count = len(graph.vectors)
+        graph.levels = arrays["levels"].tolist()
+        offsets = arrays["pair_offsets"].tolist()
+        adjacency = arrays["adjacency"].tolist()
+        pair = 0
+        for level in graph.levels:
+            node_links = []
+            for _ in range(level + 1):
+                node_links.append(adjacency[offsets[pair]:offsets[pair + 1]])
+                pair += 1
+            graph.neighbors.append(node_links)
+        graph.deleted = set(arrays["deleted"].tolist())
+        graph.payloads = meta["payloads"]
+        graph.ids = meta["ids"]
+        graph.entry_point = meta["entry_point"]
+        graph.max_level = meta["max_level"]
+        return graph
+
+
+class HNSWIndex:
+    """
+    HNSW index partitioned by nec_version.
+
+    Each NEC edition gets its own graph, so a version filter searches one
+    small graph instead of post-filtering (or scanning) the combined corpus.
+    """
+
+    def __init__(self, index_dir: str, m: int = 16, ef_construction: int = 200):
+        self.index_dir = Path(index_dir)
+        self.m = m
+        self.ef_construction = ef_construction
+        self.graphs: dict[str, HNSWGraph] = {}
+
+    def __len__(self) -> int:
+        return sum(len(graph) for graph in self.graphs.values())
+
+    def _graph_path(self, nec_version: str) -> Path:
+        return self.index_dir / f"hnsw_{nec_version}"
+
+    @classmethod
+    def load(cls, index_dir: str, m: int = 16, ef_construction: int = 200) -> "HNSWIndex":
+        """Load every persisted version graph found in index_dir"""
+        index = cls(index_dir, m, ef_construction)
+        for meta_path in sorted(index.index_dir.glob("hnsw_*.json")):
+            version = meta_path.stem[len("hnsw_"):]
+            index.graphs[version] = HNSWGraph.load(index._graph_path(version))
+        return index
+
+    def graph(self, nec_version: str, dim: int) -> HNSWGraph:
+        if nec_version not in self.graphs:
+            self.graphs[nec_version] = HNSWGraph(dim, self.m, self.ef_construction)
+        return self.graphs[nec_version]
+
+    def save(self, nec_version: str, max_deleted_fraction: float = 0.2):
+        """Persist one version graph, compacting it first if it carries too many tombstones"""
+        graph = self.graphs[nec_version]
+        if graph.count and len(graph.deleted) / graph.count > max_deleted_fraction:
+            graph = self.graphs[nec_version] = graph.compact()
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        graph.save(self._graph_path(nec_version))
+
+    def search(
+        self,
+        query_embedding: list[float],
+        limit: int = 10,
+        nec_version: str | None = None,
+        article: int | list[int] | None = None,
+        ef: int | None = None
+    ) -> list[dict]:
+        """
+        Approximate top-k cosine search
+
+        Returns:
+            Matching chunks with the same fields and score scale as the
+            Atlas `$vectorSearch` path (score = (1 + cosine) / 2)
+        """
+        ef = ef or settings.hnsw_ef_search
+        versions = [nec_version] if nec_version is not None else list(self.graphs)
+
+        hits = []
+        for version in versions:
+            graph = self.graphs.get(version)
+            if graph is None:
+                continue
+            for similarity, node in graph.search(query_embedding, limit, ef, article=article):
+                hits.append((similarity, graph.payloads[node]))
+
+        hits.sort(key=lambda hit: -hit[0])
+        return [{**payload, "score": (1.0 + similarity) / 2.0} for similarity, payload in hits[:limit]]
+
+    def recall_at_k(self, nec_version: str, k: int = 10, samples: int = 100, ef: int | None = None) -> float:
+        """Estimate recall@k against exact search, using stored vectors as queries"""
+        graph = self.graphs.get(nec_version)
+        if graph is None or len(graph) == 0:
+            return 0.0
+
+        live = np.asarray(sorted(graph.ids.values()), dtype=np.int64)
+        rng = np.random.default_rng(0)
+        queries = rng.choice(live, size=min(samples, len(live)), replace=False)
+        matrix = graph.vectors[live]
+
+        matched = 0
+        total = 0
+        for query_node in queries:
+            query = graph.vectors[query_node]
+            exact = live[np.argsort(-(matrix @ query))[:k]]
+            approx = [node for _, node in graph.search(query, k, ef or settings.hnsw_ef_search)]
+            matched += len(set(exact.tolist()) & set(approx))
+            total += len(exact)
+        return matched / total if total else 0.0
+
+
+async def update_hnsw_index(db, nec_version: str, stale_ids: set[str], index_dir: str | None = None) -> HNSWIndex:
+    """
+    Bring the persisted graph for one NEC version up to date with nec_chunks
+
+    Stale (changed or deleted) chunks are tombstoned, and only chunks not
+    already live in the graph are read from Mongo and inserted, so repeat
+    ingestions touch just the vectors that changed.
+
+    Args:
+        db: Database handle
+        nec_version: NEC version whose graph to update
+        stale_ids: chunk_ids that were rewritten or removed by this ingestion
+        index_dir: Index directory (settings default if None)
+
+    Returns:
+        The updated index
+    """
+    index = HNSWIndex.load(index_dir or settings.hnsw_index_dir, settings.hnsw_m, settings.hnsw_ef_construction)
+
+    graph = index.graphs.get(nec_version)
+    if graph is not None:
+        for chunk_id in stale_ids:
+            graph.remove(chunk_id)
+    live = list(graph.ids) if graph is not None else []
+
+    pending = []
+    cursor = db.nec_chunks.find(
+        {"nec_version": nec_version, "chunk_id": {"$nin": live}},
+        {"_id": 0, "chunk_id": 1, "article": 1, "article_title": 1, "text": 1, "nec_version": 1,
+         "embedding": 1, "embedding_f32": 1}
+    )
+    async for doc in cursor:
+        vector = decode_embedding(doc)
+        doc.pop("embedding", None)
+        doc.pop("embedding_f32", None)
+        if vector is not None:
+            pending.append((doc["chunk_id"], vector, doc))
+
+    def _insert_all():
+        for chunk_id, vector, payload in pending:
+            index.graph(nec_version, len(vector)).add(chunk_id, vector, payload)
+        if nec_version in index.graphs:
+            index.save(nec_version)
+
+    # Graph construction is CPU-bound; keep it off the event loop
+    await asyncio.to_thread(_insert_all)
+    print(f"HNSW graph {nec_version}: {len(pending)} vectors inserted, "
+          f"{len(stale_ids)} stale entries tombstoned")
+    return index
+
+
+# Global index instance
+_hnsw_index: HNSWIndex | None = None
+
+
+def load_hnsw_index(index_dir: str | None = None) -> HNSWIndex:
+    """Load the persisted HNSW graphs (an empty index if none were built)"""
+    global _hnsw_index
+
+    directory = index_dir or settings.hnsw_index_dir
+    _hnsw_index = HNSWIndex.load(directory, settings.hnsw_m, settings.hnsw_ef_construction)
+    print(f"Loaded HNSW index: {len(_hnsw_index)} vectors in {len(_hnsw_index.graphs)} version graphs")
+    return _hnsw_index
+
+
+def get_hnsw_index() -> HNSWIndex | None:
+    """Get the loaded HNSW index, if any"""
+    return _hnsw_index
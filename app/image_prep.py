@@ -0,0 +1,178 @@
+"""Normalize diagram images before they are sent to the vision model"""
+import asyncio
+import base64
+import io
+import math
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.config import settings
+
+
+# Qwen2.5-VL encodes 14px patches merged 2x2, i.e. one visual token per 28x28 pixels
+VISION_PATCH_PX = 28
+
+
+def estimate_vision_tokens(width: int, height: int) -> int:
+    """Approximate visual tokens the vision model spends on an image of this size"""
+    return math.ceil(width / VISION_PATCH_PX) * math.ceil(height / VISION_PATCH_PX)
+
+
+def difference_hash(image: Image.Image, size: int | None = None) -> bytes:
+    """
+    Difference hash (dHash) of an image, for near-duplicate detection
+
+    The image is reduced to grayscale (size+1) x size by area averaging, so
+    thin drawing lines still darken their cell, and each bit records whether
+    a cell is brighter than its right neighbour. A revision cloud or a new
+    title block date flips only a few of the size * size bits.
+
+    Args:
+        image: Decoded image
+        size: Hash side length (`settings.phash_size` if None)
+
+    Returns:
+        Packed hash bits
+    """
+    size = size or settings.phash_size
+    gray = np.asarray(image.convert("L").resize((size + 1, size), Image.BOX), dtype=np.int16)
+    return np.packbits(gray[:, 1:] > gray[:, :-1]).tobytes()
+
+
+def difference_hash_bytes(image_bytes: bytes) -> bytes | None:
+    """dHash of encoded image bytes (None if they cannot be decoded)"""
+    try:
+        return difference_hash(ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))))
+    except Exception:
+        return None
+
+
+@dataclass
+class PreparedImage:
+    """
+    Image bytes ready for the vision model, plus what normalization saved
+
+    The pipeline carries raw bytes; base64 happens once, at the transport
+    edge, the first time `data_url` is used, and is shared by every call.
+    """
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    original_width: int
+    original_height: int
+    grayscale: bool = False
+    phash: bytes | None = None
+
+    @classmethod
+    def passthrough(cls, data: bytes, mime_type: str = "image/png") -> "PreparedImage":
+        """Wrap bytes that are sent as-is"""
+        return cls(data, mime_type, 0, 0, len(data), 0, 0)
+
+    @cached_property
+    def data_url(self) -> str:
+        """`data:` URL for the chat completions API (encoded on first use)"""
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+    def stats(self) -> dict:
+        """Byte and estimated token savings, for the analysis record"""
+        tokens_before = estimate_vision_tokens(self.original_width, self.original_height)
+        tokens_after = estimate_vision_tokens(self.width, self.height)
+        return {
+            "original_bytes": self.original_bytes,
+            "bytes": len(self.data),
+            "bytes_saved": self.original_bytes - len(self.data),
+            "original_size": [self.original_width, self.original_height],
+            "size": [self.width, self.height],
+            "grayscale": self.grayscale,
+            "mime_type": self.mime_type,
+            "phash": self.phash.hex() if self.phash else None,
+            "estimated_tokens_before": tokens_before,
+            "estimated_tokens": tokens_after,
+            # Per vision call; each analysis makes two
+            "estimated_tokens_saved": tokens_before - tokens_after,
+        }
+
+
+def _is_effectively_gray(image: Image.Image, tolerance: int) -> bool:
+    """True if no pixel's color channels differ by more than `tolerance`"""
+    pixels = np.asarray(image, dtype=np.int16)
+    spread = pixels.max(axis=2) - pixels.min(axis=2)
+    return int(spread.max()) <= tolerance
+
+
+def normalize_image(image_bytes: bytes) -> PreparedImage:
+    """
+    Downscale, grayscale and re-encode an image (CPU-bound; run off the event loop)
+
+    - Images larger than `settings.image_max_edge` are resized (aspect preserved)
+    - Color images whose channels never differ by more than
+      `settings.image_grayscale_tolerance` are stored as single-channel
+    - The result is re-encoded as optimized PNG; if that is not smaller and
+      nothing was resized, the original bytes are kept
+
+    Args:
+        image_bytes: Uploaded image bytes (any format Pillow reads)
+
+    Returns:
+        PreparedImage (the original bytes unchanged if they cannot be decoded)
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except Exception as e:
+        print(f"Image normalization skipped (cannot decode image): {e}")
+        return PreparedImage.passthrough(image_bytes)
+
+    original_mime = Image.MIME.get(image.format or "", "image/png")
+    original_width, original_height = image.size
+
+    image = ImageOps.exif_transpose(image)
+
+    # Flatten transparency onto white; drawings have no meaningful alpha
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, rgba)
+
+    if image.mode not in ("L", "1"):
+        image = image.convert("RGB")
+
+    resized = max(image.size) > settings.image_max_edge
+    if resized:
+        image.thumbnail((settings.image_max_edge, settings.image_max_edge), Image.LANCZOS)
+
+    grayscale = image.mode in ("L", "1")
+    if not grayscale and _is_effectively_gray(image, settings.image_grayscale_tolerance):
+        image = image.convert("L")
+        grayscale = True
+
+    phash = difference_hash(image)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    data = buffer.getvalue()
+
+    if not resized and len(data) >= len(image_bytes):
+        return PreparedImage(
+            image_bytes, original_mime, original_width, original_height,
+            len(image_bytes), original_width, original_height, phash=phash
+        )
+
+    return PreparedImage(
+        data, "image/png", image.width, image.height,
+        len(image_bytes), original_width, original_height, grayscale, phash
+    )
+
+
+async def prepare_image(image_bytes: bytes) -> PreparedImage:
+    """Normalize an image in a worker thread (or pass it through, with its dHash, if disabled)"""
+    if not settings.image_normalize_enabled:
+        image = PreparedImage.passthrough(image_bytes)
+        image.phash = await asyncio.to_thread(difference_hash_bytes, image_bytes)
+        return image
+    return await asyncio.to_thread(normalize_image, image_bytes)
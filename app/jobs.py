@@ -0,0 +1,129 @@
+"""In-process job queue for asynchronous analyses"""
+import asyncio
+from datetime import datetime
+
+from app.compliance import ComplianceChecker
+from app.config import settings
+from app.database import get_database
+from app.fireworks_client import get_fireworks_client
+
+
+class QueueFullError(Exception):
+    """Raised when the analysis queue cannot accept more work"""
+
+
+class AnalysisJobQueue:
+    """
+    Bounded queue of pending analyses drained by a fixed pool of worker tasks.
+
+    Job state lives in the `analyses` collection, so `GET /analysis/{id}` sees
+    `queued` -> `running` -> `completed` / `error` through the usual `status` field.
+    """
+
+    def __init__(self, workers: int, max_queued: int):
+        self.worker_count = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        """Spawn the worker tasks (call from inside the running event loop)"""
+        for n in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(n)))
+        print(f"Started {self.worker_count} analysis workers (queue size {self._queue.maxsize})")
+
+    async def stop(self):
+        """Cancel the worker tasks; queued jobs are left in 'queued' state"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    async def submit(self, analysis_id: str, data: bytes, nec_version: str, is_pdf: bool = False):
+        """
+        Record a queued analysis and hand it to the worker pool
+
+        Args:
+            analysis_id: Unique analysis ID
+            data: Raw image bytes (or PDF drawing set if is_pdf)
+            nec_version: NEC version to check against
+            is_pdf: The payload is a multi-sheet PDF
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        if self._queue.full():
+            raise QueueFullError(f"Analysis queue is full ({self._queue.maxsize} jobs)")
+
+        db = get_database()
+        await db.analyses.insert_one({
+            "analysis_id": analysis_id,
+            "status": "queued",
+            "created_at": datetime.utcnow(),
+            "nec_version": nec_version
+        })
+
+        try:
+            self._queue.put_nowait((analysis_id, data, nec_version, is_pdf))
+        except asyncio.QueueFull:
+            await self._set_status(analysis_id, "error", error="Analysis queue is full")
+            raise QueueFullError(f"Analysis queue is full ({self._queue.maxsize} jobs)")
+
+    async def _set_status(self, analysis_id: str, status: str, error: str | None = None):
+        update = {"status": status}
+        if error is not None:
+            update["error"] = error
+
+        db = get_database()
+        await db.analyses.update_one({"analysis_id": analysis_id}, {"$set": update})
+
+    async def _worker(self, n: int):
+        checker = ComplianceChecker(get_fireworks_client())
+
+        while True:
+            analysis_id, data, nec_version, is_pdf = await self._queue.get()
+            try:
+                await self._set_status(analysis_id, "running")
+                # Job status must reach 'completed' before the worker moves on
+                if is_pdf:
+                    await checker.analyze_drawing_set(
+                        analysis_id=analysis_id,
+                        pdf_bytes=data,
+                        nec_version=nec_version,
+                        persist_in_background=False
+                    )
+                else:
+                    await checker.analyze_and_check(
+                        analysis_id=analysis_id,
+                        image_bytes=data,
+                        nec_version=nec_version,
+                        persist_in_background=False
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{analysis_id}] Worker {n} failed: {e}")
+                await self._set_status(analysis_id, "error", error=str(e))
+            finally:
+                self._queue.task_done()
+
+
+# Global queue instance
+_job_queue: AnalysisJobQueue | None = None
+
+
+def get_job_queue() -> AnalysisJobQueue:
+    """Get or create the analysis job queue"""
+    global _job_queue
+
+    if _job_queue is None:
+        _job_queue = AnalysisJobQueue(
+            workers=settings.analysis_workers,
+            max_queued=settings.analysis_queue_size
+        )
+
+    return _job_queue
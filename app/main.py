@@ -3,13 +3,24 @@ import uuid
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import base64
+import binascii
 
 from app.config import settings
-from app.database import connect_to_mongodb, close_mongodb_connection, get_database
-from app.fireworks_client import get_fireworks_client
-from app.compliance import ComplianceChecker
-from app.models import AnalyzeRequest, AnalysisResponse
+from app.database import bump_corpus_version, connect_to_mongodb, close_mongodb_connection, get_database
+from app.fireworks_client import get_fireworks_client, close_fireworks_client
+from app.compliance import ComplianceChecker, drain_background_writes
+from app.drawings import DrawingSetError, check_drawing_set, is_pdf, shutdown_render_pool
+from app.cache import get_result_cache, invalidate_result_cache
+from app.catalog import get_catalog, load_catalog, load_retrieval_indexes, start_catalog_refresh, stop_catalog_refresh
+from app.jobs import QueueFullError, get_job_queue
+from app.streaming import sse_event
+from app.hedging import get_vision_hedger
+from app.phash_index import load_phash_index
+from app.quantization import encode_embedding_fields
+from app.rate_limiter import get_rate_limiter
+from app.models import AnalyzeRequest, AnalysisAccepted, AnalysisResponse
 
 
 @asynccontextmanager
@@ -17,8 +28,20 @@ async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Startup
     await connect_to_mongodb()
+    await load_retrieval_indexes()
+    if settings.phash_reuse_enabled:
+        await load_phash_index()
+    await load_catalog()
+    start_catalog_refresh()
+    job_queue = get_job_queue()
+    job_queue.start()
     yield
     # Shutdown
+    await job_queue.stop()
+    await stop_catalog_refresh()
+    await drain_background_writes()
+    shutdown_render_pool()
+    await close_fireworks_client()
     await close_mongodb_connection()
 
 
@@ -40,6 +63,94 @@ app.add_middleware(
 )
 
 
+# Base64 inflates by 4/3; leave room for the JSON / multipart framing
+MAX_REQUEST_BYTES = settings.max_upload_bytes * 4 // 3 + 64 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class RequestSizeLimit:
+    """
+    ASGI middleware capping /analyze request bodies at MAX_REQUEST_BYTES
+
+    A declared Content-Length over the limit is rejected before anything is
+    read. Otherwise (including chunked bodies without a Content-Length) the
+    body is counted as the app reads it, and the request fails with 413 as
+    soon as the count passes the limit, before the rest is buffered or
+    spooled to disk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/analyze"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > MAX_REQUEST_BYTES:
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": f"Request body exceeds {MAX_REQUEST_BYTES} bytes"}
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {MAX_REQUEST_BYTES} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(RequestSizeLimit)
+
+
+async def read_upload(file: UploadFile) -> bytearray:
+    """
+    Read an uploaded file in chunks, enforcing `settings.max_upload_bytes`
+
+    Starlette spools multipart uploads to a temporary file, so this is the
+    only in-memory copy of the upload: chunks are appended to one buffer
+    that is returned as is (no join copy).
+
+    Raises:
+        HTTPException: 413 if the file is larger than the limit
+    """
+    data = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        if len(data) + len(chunk) > settings.max_upload_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File exceeds {settings.max_upload_bytes} bytes"
+            )
+        data += chunk
+    return data
+
+
+def decode_image_base64(image_base64: str) -> bytes:
+    """
+    Decode a base64 image from a JSON body once, at the API edge
+
+    Raises:
+        HTTPException: 400 if it is not valid base64, 413 if the image is too large
+    """
+    # Reject before decoding: decoded size is at most 3/4 of the text
+    if len(image_base64) * 3 // 4 > settings.max_upload_bytes + 2:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {settings.max_upload_bytes} bytes")
+    try:
+        return base64.b64decode(image_base64, validate=True)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="image_base64 is not valid base64")
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -50,7 +161,29 @@ async def root():
     }
 
 
-@app.post("/analyze", response_model=AnalysisResponse)
+async def enqueue_analysis(
+    analysis_id: str,
+    data: bytes,
+    nec_version: str,
+    is_pdf: bool = False
+) -> JSONResponse:
+    """Queue an analysis for the worker pool and answer 202 Accepted"""
+    try:
+        await get_job_queue().submit(analysis_id, data, nec_version, is_pdf=is_pdf)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    return JSONResponse(
+        status_code=202,
+        content=AnalysisAccepted(analysis_id=analysis_id).model_dump()
+    )
+
+
+@app.post(
+    "/analyze",
+    response_model=AnalysisResponse,
+    responses={202: {"model": AnalysisAccepted}}
+)
 async def analyze_diagram(request: AnalyzeRequest):
     """
     Analyze a single-line diagram for NEC compliance.
@@ -58,11 +191,19 @@ async def analyze_diagram(request: AnalyzeRequest):
     Upload a base64-encoded PNG image of an electrical single-line diagram
     and receive a compliance analysis against NEC codes.
 
+    With `async_mode`, the analysis is queued and a 202 with the `analysis_id`
+    is returned immediately; poll `GET /analysis/{analysis_id}` for the result.
+
     Returns categorized findings (passing, warnings, failing) with a compliance score.
     """
+    image_bytes = decode_image_base64(request.image_base64)
+
     # Generate unique analysis ID
     analysis_id = str(uuid.uuid4())
 
+    if request.async_mode:
+        return await enqueue_analysis(analysis_id, image_bytes, request.nec_version)
+
     try:
         # Initialize compliance checker
         fireworks = get_fireworks_client()
@@ -71,7 +212,7 @@ async def analyze_diagram(request: AnalyzeRequest):
         # Run analysis and get full result
         result = await checker.analyze_and_check(
             analysis_id=analysis_id,
-            image_base64=request.image_base64,
+            image_bytes=image_bytes,
             nec_version=request.nec_version
         )
 
@@ -81,55 +222,129 @@ async def analyze_diagram(request: AnalyzeRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/analyze-file", response_model=AnalysisResponse)
+@app.post(
+    "/analyze-file",
+    response_model=AnalysisResponse,
+    responses={202: {"model": AnalysisAccepted}}
+)
 async def analyze_diagram_file(
     file: UploadFile = File(...),
-    nec_version: str = "2023"
+    nec_version: str = "2023",
+    async_mode: bool = False
 ):
     """
-    Analyze a single-line diagram from uploaded PNG file.
+    Analyze a single-line diagram from an uploaded image or PDF drawing set.
 
     Upload a PNG image file of an electrical single-line diagram
     and receive a compliance analysis against NEC codes.
 
+    Multi-page PDFs are analyzed sheet by sheet (concurrently) and merged into
+    one result: each finding's `location.sheet` is its page number and the
+    summary counts every NEC standard once, at its worst status.
+
+    With `async_mode=true`, the analysis is queued and a 202 with the
+    `analysis_id` is returned immediately.
+
     Returns categorized findings (passing, warnings, failing) with a compliance score.
     """
-    # Validate file type
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    # Read file
+    contents = await read_upload(file)
+    pdf = is_pdf(contents, file.content_type, file.filename)
 
-    # Read file and convert to base64
-    contents = await file.read()
-    image_base64 = base64.b64encode(contents).decode("utf-8")
+    # Validate file type
+    if not pdf and not (file.content_type or "").startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image or PDF")
 
     # Generate unique analysis ID
     analysis_id = str(uuid.uuid4())
 
+    if async_mode:
+        if pdf:
+            # Reject unreadable or oversized sets now, not after they are queued
+            try:
+                await check_drawing_set(contents)
+            except DrawingSetError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        return await enqueue_analysis(analysis_id, contents, nec_version, is_pdf=pdf)
+
     try:
         # Initialize compliance checker
         fireworks = get_fireworks_client()
         checker = ComplianceChecker(fireworks)
 
         # Run analysis and get full result
-        result = await checker.analyze_and_check(
-            analysis_id=analysis_id,
-            image_base64=image_base64,
-            nec_version=nec_version
-        )
+        if pdf:
+            result = await checker.analyze_drawing_set(
+                analysis_id=analysis_id,
+                pdf_bytes=contents,
+                nec_version=nec_version
+            )
+        else:
+            result = await checker.analyze_and_check(
+                analysis_id=analysis_id,
+                image_bytes=contents,
+                nec_version=nec_version
+            )
 
         return result
+    except DrawingSetError as e:
+        # Unreadable or oversized drawing set
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error analyzing diagram: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/analyze-file/stream")
+async def analyze_diagram_file_stream(
+    file: UploadFile = File(...),
+    nec_version: str = "2023"
+):
+    """
+    Analyze an uploaded diagram, streaming progress as server-sent events.
+
+    Events, in order: `description`, `system_type`, `codes_loaded`, one
+    `finding` per compliance finding as soon as the model has generated it,
+    and finally `complete` with the same payload `/analyze-file` returns.
+    Failures are reported as an `error` event.
+    """
+    # Validate file type
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    contents = await read_upload(file)
+    analysis_id = str(uuid.uuid4())
+
+    async def events():
+        checker = ComplianceChecker(get_fireworks_client())
+        try:
+            async for event, data in checker.analyze_and_check_stream(
+                analysis_id=analysis_id,
+                image_bytes=contents,
+                nec_version=nec_version
+            ):
+                yield sse_event(event, data)
+        except Exception as e:
+            print(f"[{analysis_id}] Streaming analysis failed: {e}")
+            yield sse_event("error", {"analysis_id": analysis_id, "error": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/analysis/{analysis_id}", response_model=AnalysisResponse)
 async def get_analysis(analysis_id: str):
     """
-    Retrieve a previously completed analysis by ID.
+    Retrieve an analysis by ID.
 
     Returns the full analysis result including diagram description,
-    compliance findings, and summary statistics.
+    compliance findings, and summary statistics. Analyses submitted in
+    async mode report 'queued' or 'running' until they complete, and
+    'error' (with the `error` message) if they fail.
     """
     db = get_database()
 
@@ -155,7 +370,8 @@ async def get_analysis(analysis_id: str):
             "failing_count": 0,
             "not_applicable_count": 0,
             "compliance_score": 0.0
-        })
+        }),
+        "error": result.get("error")
     }
 
 
@@ -186,19 +402,20 @@ async def ingest_nec_pdf(file: UploadFile = File(...)):
         # Import parser and fireworks client
         from app.pdf_parser import NECPDFParser
 
-        parser = NECPDFParser()
+        parser = NECPDFParser(workers=settings.pdf_parse_workers)
         fireworks = get_fireworks_client()
         db = get_database()
 
-        sections_processed = 0
+        # Parse sections, then embed them in batches
+        sections = list(parser.parse_pdf(tmp_file_path))
+        embeddings = await fireworks.generate_embeddings([
+            f"{section.title}. {section.full_text[:1500]}" for section in sections
+        ])
 
-        # Parse and store sections
-        for section in parser.parse_pdf(tmp_file_path):
-            # Generate embedding
-            embedding_text = f"{section.title}. {section.full_text[:1500]}"
-            embedding = await fireworks.generate_embedding(embedding_text)
+        sections_processed = 0
 
-            # Store in database
+        # Store sections with their embeddings
+        for section, embedding in zip(sections, embeddings):
             await db.nec_codes.update_one(
                 {"section": section.section},
                 {
@@ -206,7 +423,7 @@ async def ingest_nec_pdf(file: UploadFile = File(...)):
                         "section": section.section,
                         "title": section.title,
                         "full_text": section.full_text,
-                        "embedding": embedding,
+                        **encode_embedding_fields(embedding),
                         "chapter": section.chapter,
                         "nec_version": "2023"
                     }
@@ -219,6 +436,11 @@ async def ingest_nec_pdf(file: UploadFile = File(...)):
         # Clean up temp file
         os.unlink(tmp_file_path)
 
+        # Cached analyses were produced against the old corpus
+        await invalidate_result_cache("2023")
+        await bump_corpus_version()
+        await load_catalog()
+
         return {
             "status": "success",
             "sections_processed": sections_processed,
@@ -248,10 +470,27 @@ async def health_check():
         "status": "healthy",
         "database": db_status,
         "nec_codes_count": nec_count,
+        "analysis_queue_depth": get_job_queue().depth,
         "fireworks_api_configured": bool(settings.fireworks_api_key)
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Cache, queue and rate limiter counters"""
+    fireworks = get_fireworks_client()
+    catalog = get_catalog()
+
+    return {
+        "result_cache": get_result_cache().stats(),
+        "nec_catalog": catalog.stats() if catalog else None,
+        "embedding_cache": fireworks.embedding_cache.stats() if fireworks.embedding_cache else None,
+        "fireworks_rate_limiter": get_rate_limiter().stats(),
+        "vision_hedging": get_vision_hedger().stats(),
+        "analysis_queue_depth": get_job_queue().depth
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
 
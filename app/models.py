@@ -28,6 +28,7 @@ class AnalyzeRequest(BaseModel):
     """Request to analyze a diagram"""
     image_base64: str
     nec_version: str = "2023"
+    async_mode: bool = False
 
 
 # =============================================================================
@@ -61,6 +62,12 @@ class ComplianceSummary(BaseModel):
     compliance_score: float = Field(..., description="Overall compliance percentage (0-100) based on applicable codes only")
 
 
+class AnalysisAccepted(BaseModel):
+    """Response for an analysis queued in async mode"""
+    analysis_id: str = Field(..., description="Poll GET /analysis/{analysis_id} for the result")
+    status: str = Field("queued", description="Initial job status")
+
+
 class AnalysisResponse(BaseModel):
     """
     Complete analysis response for frontend consumption.
@@ -69,7 +76,7 @@ class AnalysisResponse(BaseModel):
     """
     # Metadata
     analysis_id: str = Field(..., description="Unique identifier for this analysis")
-    status: str = Field(..., description="Analysis status: 'completed', 'error'")
+    status: str = Field(..., description="Analysis status: 'queued', 'running', 'completed', 'error'")
     created_at: str = Field(..., description="ISO 8601 timestamp")
     nec_version: str = Field(..., description="NEC version used for compliance check")
     system_type: str = Field("commercial", description="Detected system type (generator, solar, motor, panel, etc.)")
@@ -83,6 +90,9 @@ class AnalysisResponse(BaseModel):
     # Summary
     summary: ComplianceSummary = Field(..., description="Quick summary statistics")
 
+    # Set when status is 'error'
+    error: Optional[str] = Field(None, description="Error message for failed analyses")
+
     class Config:
         json_schema_extra = {
             "example": {
@@ -1,7 +1,10 @@
 """NEC PDF parser for extracting code sections and articles"""
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import Generator
-import pymupdf4llm
+import pymupdf
+from pymupdf4llm.helpers.pymupdf_rag import IdentifyHeaders, to_markdown
 
 
 # Map NEC article numbers to categories
@@ -97,6 +100,79 @@ class NECArticle:
         return f"NECArticle(number={self.number}, title='{self.title}', categories={self.categories})"
 
 
+def _convert_pages(pdf_path: str, pages: list[int], hdr_info: IdentifyHeaders) -> str:
+    """Convert a page range to markdown (runs in a worker process)"""
+    with pymupdf.open(pdf_path) as doc:
+        return to_markdown(doc, pages=pages, hdr_info=hdr_info)
+
+
+class _BoundarySplitter:
+    """
+    Incrementally split streamed markdown at header boundaries.
+
+    A block is complete once the *next* header has been seen, so only the
+    text from the latest header onwards is kept between feeds. Matching is
+    limited to complete lines, and each feed resumes scanning at the last
+    non-blank line already seen (not the start of the pending block), so a
+    header whose number and title straddle a page break (the patterns allow
+    whitespace, including newlines, between them) matches exactly as it
+    would in the fully concatenated text.
+    """
+
+    def __init__(self, pattern: re.Pattern):
+        self.pattern = pattern
+        self.buffer = ""
+        self.seen_header = False
+        # Header of the block starting at buffer[0], once one has been found
+        self._pending: re.Match | None = None
+        self._scan_from = 0
+
+    def _resume_point(self, end: int) -> int:
+        """Start of the last non-blank line before `end` (a header there may still get its title)"""
+        position = end
+        while position > 0 and self.buffer[position - 1].isspace():
+            position -= 1
+        return self.buffer.rfind("\n", 0, position) + 1
+
+    def _split(self, end: int) -> list[tuple[re.Match, str]]:
+        """Scan buffer[:end] for new headers; return the blocks they complete"""
+        start = self._scan_from
+        if self._pending is not None:
+            start = max(start, len(self._pending.group(0)))
+        found = list(self.pattern.finditer(self.buffer, start, end))
+        self._scan_from = self._resume_point(end)
+        if not found:
+            return []
+
+        self.seen_header = True
+        headers = ([(0, self._pending)] if self._pending is not None else []) + [
+            (match.start(), match) for match in found
+        ]
+        blocks = [
+            (match, self.buffer[position:headers[i + 1][0]])
+            for i, (position, match) in enumerate(headers[:-1])
+        ]
+        # Drop everything before the pending header (including any preamble)
+        cut, self._pending = headers[-1]
+        self.buffer = self.buffer[cut:]
+        self._scan_from = max(0, self._scan_from - cut)
+        return blocks
+
+    def feed(self, text: str) -> list[tuple[re.Match, str]]:
+        """Add text and return the (header match, block text) pairs now complete"""
+        self.buffer += text
+        return self._split(self.buffer.rfind("\n") + 1)
+
+    def close(self) -> list[tuple[re.Match, str]]:
+        """Flush the remaining blocks at end of document"""
+        blocks = self._split(len(self.buffer))
+        if self._pending is not None:
+            blocks.append((self._pending, self.buffer))
+            self._pending = None
+            self.buffer = ""
+        return blocks
+
+
 class NECPDFParser:
     """Parser for NEC PDF documents"""
 
@@ -104,21 +180,141 @@ class NECPDFParser:
     SECTION_PATTERN = re.compile(r'^(\d{3}\.\d+)\s+(.+?)$', re.MULTILINE)
     ARTICLE_PATTERN = re.compile(r'^Article\s+(\d{3})\s+(.+?)$', re.MULTILINE | re.IGNORECASE)
 
-    def __init__(self):
+    def __init__(self, stream: bool = False, pages_per_window: int = 8, workers: int = 1):
+        """
+        Args:
+            stream: Extract page windows on demand instead of converting the
+                whole PDF up front (constant memory, earliest first result)
+            pages_per_window: Pages converted per step (and per worker task)
+            workers: Processes used for markdown conversion (1 = in-process)
+        """
         self.sections = []
         self._raw_text = None
+        self.stream = stream
+        self.pages_per_window = pages_per_window
+        self.workers = workers
+
+    def _page_windows(self, pdf_path: str) -> list[list[int]]:
+        """Split the document into consecutive page ranges"""
+        with pymupdf.open(pdf_path) as doc:
+            page_count = doc.page_count
+        return [
+            list(range(start, min(start + self.pages_per_window, page_count)))
+            for start in range(0, page_count, self.pages_per_window)
+        ]
+
+    @staticmethod
+    def _header_info(pdf_path: str) -> IdentifyHeaders:
+        """
+        Markdown header levels by font size, computed over the whole document
+
+        Left to itself, each to_markdown() call ranks the font sizes of only
+        the pages it converts, so a window would get different "#" levels
+        than the same pages in a full conversion. Every conversion shares
+        this one ranking, which keeps windowed output identical to serial.
+        """
+        with pymupdf.open(pdf_path) as doc:
+            return IdentifyHeaders(doc)
+
+    def _convert_parallel(self, pdf_path: str) -> Generator[str, None, None]:
+        """
+        Convert page windows in a process pool, yielding markdown in page order.
+
+        With the document-wide header levels, each page renders the same in
+        any window, so concatenating the per-window output in order is
+        identical to a serial conversion; sections and articles crossing
+        window edges are joined back up by the boundary splitting done on
+        the concatenated stream.
+        """
+        windows = self._page_windows(pdf_path)
+        hdr_info = self._header_info(pdf_path)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            # Bounded lookahead keeps at most a few windows of markdown resident
+            pending = deque()
+            for pages in windows:
+                pending.append(pool.submit(_convert_pages, pdf_path, pages, hdr_info))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
 
     def _load_pdf(self, pdf_path: str) -> str:
         """Load and cache PDF text"""
         if self._raw_text is None:
             print(f"Parsing PDF: {pdf_path}")
             try:
-                self._raw_text = pymupdf4llm.to_markdown(pdf_path)
+                if self.workers > 1:
+                    self._raw_text = "".join(self._convert_parallel(pdf_path))
+                else:
+                    with pymupdf.open(pdf_path) as doc:
+                        self._raw_text = to_markdown(doc, hdr_info=IdentifyHeaders(doc))
             except Exception as e:
                 print(f"Error extracting PDF: {e}")
                 raise
         return self._raw_text
 
+    def _iter_markdown(self, pdf_path: str) -> Generator[str, None, None]:
+        """Convert the PDF to markdown one page window at a time"""
+        print(f"Streaming PDF: {pdf_path} ({self.pages_per_window} pages per window)")
+        if self.workers > 1:
+            yield from self._convert_parallel(pdf_path)
+            return
+
+        with pymupdf.open(pdf_path) as doc:
+            hdr_info = IdentifyHeaders(doc)
+            page_count = doc.page_count
+            for start in range(0, page_count, self.pages_per_window):
+                pages = list(range(start, min(start + self.pages_per_window, page_count)))
+                yield to_markdown(doc, pages=pages, hdr_info=hdr_info)
+
+    def stream_document(
+        self,
+        pdf_path: str,
+        chunk_size: int = 2000
+    ) -> Generator[NECSection | NECArticle, None, None]:
+        """
+        Stream sections and articles from a single page-by-page extraction pass
+
+        Each NECSection / NECArticle is yielded as soon as the following
+        header is seen, so only the current section and article are held in
+        memory. Windows share the document-wide header levels, so output
+        matches parse_sections() / parse_articles() (see
+        `scripts/ingest_nec.py --check-parse`).
+
+        Args:
+            pdf_path: Path to NEC PDF file
+            chunk_size: Maximum characters per section
+
+        Yields:
+            NECSection and NECArticle objects, interleaved in document order
+        """
+        sections = _BoundarySplitter(self.SECTION_PATTERN)
+        articles = _BoundarySplitter(self.ARTICLE_PATTERN)
+        sections_found = 0
+        articles_found = 0
+
+        def _emit(section_blocks, article_blocks):
+            nonlocal sections_found, articles_found
+            for match, block in section_blocks:
+                sections_found += 1
+                yield self._make_section(match, block, chunk_size)
+            for match, block in article_blocks:
+                articles_found += 1
+                yield self._make_article(match, block)
+
+        for text in self._iter_markdown(pdf_path):
+            # Without any section header yet, the buffer is kept for the fallback split
+            yield from _emit(sections.feed(text), articles.feed(text))
+
+        yield from _emit(sections.close(), articles.close())
+
+        if not sections.seen_header:
+            fallback = self._split_into_sections(sections.buffer, chunk_size)
+            sections_found = len(fallback)
+            yield from fallback
+
+        print(f"Streamed {sections_found} sections and {articles_found} full articles from PDF")
+
     def parse_sections(self, pdf_path: str, chunk_size: int = 2000) -> Generator[NECSection, None, None]:
         """
         Parse NEC PDF and yield individual code sections with categories
@@ -130,6 +326,12 @@ class NECPDFParser:
         Yields:
             NECSection objects with article and categories
         """
+        if self.stream:
+            for item in self.stream_document(pdf_path, chunk_size):
+                if isinstance(item, NECSection):
+                    yield item
+            return
+
         text = self._load_pdf(pdf_path)
         sections = self._split_into_sections(text, chunk_size)
 
@@ -148,6 +350,12 @@ class NECPDFParser:
         Yields:
             NECArticle objects with full content
         """
+        if self.stream:
+            for item in self.stream_document(pdf_path):
+                if isinstance(item, NECArticle):
+                    yield item
+            return
+
         text = self._load_pdf(pdf_path)
 
         # Find all article matches
@@ -160,21 +368,11 @@ class NECPDFParser:
         articles_found = 0
         for i, match in enumerate(matches):
             try:
-                article_num = int(match.group(1))
-                title = match.group(2).strip()
-
                 # Get text from this article to the next
                 start = match.start()
                 end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
 
-                article_text = text[start:end].strip()
-
-                yield NECArticle(
-                    number=article_num,
-                    title=title,
-                    full_content=article_text,
-                    chapter=article_num // 100
-                )
+                yield self._make_article(match, text[start:end])
                 articles_found += 1
 
             except (ValueError, IndexError) as e:
@@ -183,6 +381,46 @@ class NECPDFParser:
 
         print(f"Extracted {articles_found} full articles from PDF")
 
+    def _make_article(self, match: re.Match, block: str) -> NECArticle:
+        """Build an NECArticle from its header match and raw block text"""
+        article_num = int(match.group(1))
+
+        return NECArticle(
+            number=article_num,
+            title=match.group(2).strip(),
+            full_content=block.strip(),
+            chapter=article_num // 100
+        )
+
+    def _make_section(self, match: re.Match, block: str, chunk_size: int) -> NECSection:
+        """Build an NECSection from its header match and raw block text"""
+        section_num = match.group(1)
+        title = match.group(2).strip()
+
+        section_text = block.strip()
+
+        # Truncate if too long
+        if len(section_text) > chunk_size:
+            section_text = section_text[:chunk_size] + "..."
+
+        # Extract article number and get categories
+        try:
+            article = int(section_num.split('.')[0])
+        except (ValueError, IndexError):
+            article = None
+
+        chapter = article // 100 if article else None
+        categories = ARTICLE_CATEGORIES.get(article, []) if article else []
+
+        return NECSection(
+            section=section_num,
+            title=title,
+            full_text=section_text,
+            chapter=chapter,
+            article=article,
+            categories=categories
+        )
+
     def parse_pdf(self, pdf_path: str, chunk_size: int = 2000) -> Generator[NECSection, None, None]:
         """
         Legacy method - parse NEC PDF and yield structured sections
@@ -217,36 +455,11 @@ class NECPDFParser:
 
         # Process each section
         for i, match in enumerate(matches):
-            section_num = match.group(1)
-            title = match.group(2).strip()
-
             # Get text from this section to the next
             start = match.start()
             end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
 
-            section_text = text[start:end].strip()
-
-            # Truncate if too long
-            if len(section_text) > chunk_size:
-                section_text = section_text[:chunk_size] + "..."
-
-            # Extract article number and get categories
-            try:
-                article = int(section_num.split('.')[0])
-            except (ValueError, IndexError):
-                article = None
-
-            chapter = article // 100 if article else None
-            categories = ARTICLE_CATEGORIES.get(article, []) if article else []
-
-            sections.append(NECSection(
-                section=section_num,
-                title=title,
-                full_text=section_text,
-                chapter=chapter,
-                article=article,
-                categories=categories
-            ))
+            sections.append(self._make_section(match, text[start:end], chunk_size))
 
         return sections
 
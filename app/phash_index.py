@@ -0,0 +1,174 @@
+"""In-process near-duplicate lookup over perceptual hashes of analyzed drawings"""
+import asyncio
+from itertools import combinations
+
+import numpy as np
+
+from app.config import settings
+from app.database import get_database
+from app.quantization import hamming_similarity
+
+
+# Hashes are split into 16-bit substrings, one sorted table per substring
+CHUNK_BITS = 16
+
+# New hashes are scanned linearly until this many are pending, then merged into the tables
+MERGE_EVERY = 4096
+
+
+def _flip_patterns(bits: int, max_flips: int) -> np.ndarray:
+    """XOR masks with at most `max_flips` of the low `bits` bits set"""
+    masks = [0]
+    for flips in range(1, max_flips + 1):
+        for positions in combinations(range(bits), flips):
+            masks.append(sum(1 << position for position in positions))
+    return np.array(masks, dtype=np.uint16)
+
+
+class HashIndex:
+    """
+    Multi-index hashing over fixed-size binary hashes.
+
+    Each hash is cut into m 16-bit substrings, and for each substring
+    position the index keeps the substring values sorted. By the pigeonhole
+    principle, two hashes within Hamming distance r agree to within r // m
+    bits on at least one substring, so a search only probes each table for
+    the query's substring and its neighbours within r // m bits (one probe
+    when r < m). The few candidates found are then verified with an exact
+    distance over their packed rows.
+
+    Rows are stored in insertion order (newest last). Recent additions are
+    scanned linearly until MERGE_EVERY of them are pending; `merge` then
+    re-sorts the tables in a worker thread, and searches keep using the old
+    tables until the new ones are swapped in.
+    """
+
+    def __init__(self, hash_bytes: int):
+        if hash_bytes % (CHUNK_BITS // 8):
+            raise ValueError(f"Hash length must be a multiple of {CHUNK_BITS} bits")
+        self.hash_bytes = hash_bytes
+        self.chunks = hash_bytes * 8 // CHUNK_BITS
+        self.ids: list[str] = []
+        self._rows = np.zeros((1024, hash_bytes), dtype=np.uint8)
+        self._tables: list[tuple[np.ndarray, np.ndarray]] = []
+        self._indexed = 0
+        self._merging = False
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, value: bytes, analysis_id: str) -> bool:
+        """
+        Insert a hash
+
+        Returns:
+            True if MERGE_EVERY hashes are pending and no merge is running
+            (the caller should then await `merge`)
+        """
+        count = len(self.ids)
+        if count == len(self._rows):
+            self._rows = np.concatenate([self._rows, np.zeros_like(self._rows)])
+        self._rows[count] = np.frombuffer(value, dtype=np.uint8)
+        self.ids.append(analysis_id)
+        return len(self.ids) - self._indexed >= MERGE_EVERY and not self._merging
+
+    async def merge(self):
+        """Sort every row into the substring tables, off the event loop"""
+        if self._merging:
+            return
+        self._merging = True
+        try:
+            count = len(self.ids)
+            # A copy: concurrent adds may reallocate the row buffer
+            rows = self._rows[:count].copy()
+            self._tables = await asyncio.to_thread(self._build_tables, rows)
+            self._indexed = count
+        finally:
+            self._merging = False
+
+    def extend(self, values: list[bytes], analysis_ids: list[str]):
+        """Insert many hashes at once (one table rebuild)"""
+        if not values:
+            return
+        rows = np.frombuffer(b"".join(values), dtype=np.uint8).reshape(len(values), self.hash_bytes)
+        count = len(self.ids)
+        self._rows = np.concatenate([self._rows[:count], rows, np.zeros_like(rows)])
+        self.ids.extend(analysis_ids)
+        self._rebuild()
+
+    def _build_tables(self, rows: np.ndarray) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Sorted (substring, row) tables over `rows`, one per substring position"""
+        substrings = rows.view(np.uint16)
+        tables = []
+        for chunk in range(self.chunks):
+            order = np.argsort(substrings[:, chunk], kind="stable").astype(np.int32)
+            tables.append((substrings[order, chunk], order))
+        return tables
+
+    def _rebuild(self):
+        """Re-sort the substring tables over every row"""
+        count = len(self.ids)
+        self._tables = self._build_tables(self._rows[:count])
+        self._indexed = count
+
+    def search(self, value: bytes, radius: int) -> list[tuple[int, str]]:
+        """
+        All stored hashes within `radius` of `value`
+
+        Returns:
+            (distance, analysis_id) pairs, nearest first (newest first on ties)
+        """
+        query = np.frombuffer(value, dtype=np.uint8)
+        count = len(self.ids)
+        if count == 0:
+            return []
+
+        candidates = [np.arange(self._indexed, count, dtype=np.int32)]
+        if self._indexed:
+            masks = _flip_patterns(CHUNK_BITS, radius // self.chunks)
+            for chunk, (values, order) in enumerate(self._tables):
+                probes = np.unique(query.view(np.uint16)[chunk] ^ masks)
+                starts = np.searchsorted(values, probes, side="left")
+                ends = np.searchsorted(values, probes, side="right")
+                candidates.extend(order[start:end] for start, end in zip(starts, ends) if end > start)
+
+        rows = np.unique(np.concatenate(candidates))
+        if len(rows) == 0:
+            return []
+        distances = -hamming_similarity(self._rows[rows], query)
+        keep = distances <= radius
+        rows, distances = rows[keep], distances[keep]
+
+        # Nearest first; among equals the most recent analysis
+        ranked = np.lexsort((-rows, distances))
+        return [(int(distances[i]), self.ids[rows[i]]) for i in ranked]
+
+
+# Global index (built at startup from stored analyses)
+_phash_index: HashIndex | None = None
+
+
+async def load_phash_index() -> HashIndex:
+    """Build the in-process index from the `phash` of completed single-image analyses"""
+    global _phash_index
+
+    index = HashIndex(settings.phash_size * settings.phash_size // 8)
+    db = get_database()
+    cursor = db.analyses.find(
+        {"status": "completed", "phash_size": settings.phash_size},
+        {"_id": 0, "analysis_id": 1, "phash": 1}
+    ).sort("created_at", 1)
+    values, analysis_ids = [], []
+    async for doc in cursor:
+        values.append(bytes.fromhex(doc["phash"]))
+        analysis_ids.append(doc["analysis_id"])
+    index.extend(values, analysis_ids)
+
+    _phash_index = index
+    print(f"Loaded perceptual hash index: {len(index)} analyses")
+    return index
+
+
+def get_phash_index() -> HashIndex | None:
+    """Get the loaded perceptual hash index, if any"""
+    return _phash_index
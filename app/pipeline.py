@@ -0,0 +1,79 @@
+"""Minimal async stage graph: run independent stages concurrently and time each one"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+
+class StageGraph:
+    """
+    Dependency graph of async stages.
+
+    Each stage is a coroutine function that receives the results of its
+    dependencies as keyword arguments (named after the dependency). A stage
+    starts as soon as all of its dependencies have finished, so stages that
+    do not depend on each other overlap.
+
+    Example:
+        graph = StageGraph()
+        graph.add("describe", describe)
+        graph.add("codes", load_codes, after=["describe"])
+        graph.add("rag", search, after=["describe"])
+        graph.add("check", check, after=["codes", "rag"])
+        results = await graph.run()
+    """
+
+    def __init__(self):
+        self._stages: dict[str, tuple[Callable[..., Awaitable[Any]], list[str]]] = {}
+        self.timings: dict[str, dict[str, float]] = {}
+        self.total_ms = 0.0
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], after: list[str] | None = None):
+        """Register a stage; dependencies must already be registered"""
+        deps = after or []
+        missing = [dep for dep in deps if dep not in self._stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {missing}")
+        self._stages[name] = (func, deps)
+
+    async def run(self) -> dict[str, Any]:
+        """
+        Execute every stage
+
+        Returns:
+            Stage name -> result
+
+        Raises:
+            The first stage exception; stages still running are cancelled
+        """
+        started = time.perf_counter()
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def _run_stage(name: str, func, deps: list[str]):
+            inputs = {dep: await tasks[dep] for dep in deps}
+            stage_started = time.perf_counter()
+            try:
+                return await func(**inputs)
+            finally:
+                self.timings[name] = {
+                    "start_ms": round((stage_started - started) * 1000, 1),
+                    "duration_ms": round((time.perf_counter() - stage_started) * 1000, 1),
+                }
+
+        for name, (func, deps) in self._stages.items():
+            tasks[name] = asyncio.create_task(_run_stage(name, func, deps))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            self.total_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    def report(self) -> dict:
+        """Per-stage start offsets and durations plus wall-clock total (milliseconds)"""
+        return {"stages": dict(self.timings), "total_ms": self.total_ms}
@@ -0,0 +1,69 @@
+"""Compact embedding storage: int8 / binary quantization with float32 rescoring"""
+import numpy as np
+from bson.binary import Binary
+
+from app.config import settings
+
+
+# Stored embedding fields, for projections that should never pull vectors
+# (embedding_q / embedding_scale were written by earlier versions; ingestion unsets them)
+EMBEDDING_FIELDS = ("embedding", "embedding_q", "embedding_scale", "embedding_f32")
+
+# Bits set in each byte value, for Hamming distance over packed sign bits
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization
+
+    Args:
+        vectors: (n, dim) float array
+
+    Returns:
+        (codes, scales) where vectors ~= codes * scales[:, None]
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """Sign-bit quantization, packed 8 dimensions per byte"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return np.packbits(vectors > 0, axis=1)
+
+
+def hamming_similarity(bits: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """Negated Hamming distance between packed rows and a packed query (higher is closer)"""
+    return -_POPCOUNT[np.bitwise_xor(bits, query_bits)].sum(axis=1, dtype=np.int32)
+
+
+def encode_embedding_fields(vector: list[float], storage: str | None = None) -> dict:
+    """
+    Document fields for a stored embedding, per `settings.embedding_storage`
+
+    - "float": `embedding` as a BSON double array (Atlas `$vectorSearch` compatible)
+    - "int8" / "binary": `embedding_f32`, a little-endian float32 blob
+
+    The compact candidate codes are derived from the normalized vectors when
+    the local index is built, so they are not stored per chunk. Quantized
+    modes are served by the local and HNSW rag_search backends, not by Atlas.
+    """
+    storage = storage or settings.embedding_storage
+    if storage == "float":
+        return {"embedding": vector}
+    if storage not in ("int8", "binary"):
+        raise ValueError(f"Unknown embedding storage mode: {storage}")
+    return {"embedding_f32": Binary(np.asarray(vector, dtype="<f4").tobytes())}
+
+
+def decode_embedding(doc: dict) -> np.ndarray | None:
+    """Full-precision vector from a stored document, whichever storage mode wrote it"""
+    if doc.get("embedding_f32") is not None:
+        return np.frombuffer(doc["embedding_f32"], dtype="<f4").astype(np.float32)
+    if doc.get("embedding"):
+        return np.asarray(doc["embedding"], dtype=np.float32)
+    return None
@@ -0,0 +1,311 @@
+"""Client-side rate limiting and adaptive concurrency for Fireworks API calls"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from app.config import settings
+
+
+# Buckets hold this many seconds of their per-minute rate, so bursts stay short
+BURST_SECONDS = 10.0
+
+# Visual tokens assumed for an image whose dimensions are unknown
+DEFAULT_IMAGE_TOKENS = 1500
+
+# Latency samples a model needs before its baseline is trusted
+LATENCY_WARMUP = 5
+
+
+def estimate_request_tokens(payload: dict, image_tokens: int | None = None) -> int:
+    """
+    Rough token cost of a request, reserved before it is sent
+
+    Text is counted at ~4 characters per token, plus `max_tokens` for the
+    completion; the reservation is corrected from the response `usage`.
+
+    Args:
+        payload: Chat completions or embeddings request body
+        image_tokens: Visual tokens per image (DEFAULT_IMAGE_TOKENS if None)
+
+    Returns:
+        Estimated prompt + completion tokens
+    """
+    chars = 0
+    images = 0
+
+    inputs = payload.get("input")
+    if inputs is not None:
+        chars += sum(len(text) for text in ([inputs] if isinstance(inputs, str) else inputs))
+
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                images += 1
+
+    per_image = DEFAULT_IMAGE_TOKENS if image_tokens is None else image_tokens
+    return chars // 4 + images * per_image + payload.get("max_tokens", 0)
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """
+    Full-jitter exponential backoff before retry number `attempt` (0-based)
+
+    A server-provided Retry-After is honored as the minimum delay.
+    """
+    ceiling = min(settings.fireworks_retry_max_delay, settings.fireworks_retry_base_delay * 2 ** attempt)
+    delay = random.uniform(0, ceiling)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class TokenBucket:
+    """
+    Continuously refilling token bucket (requests or tokens per minute)
+
+    `take` may drive the level negative when a reservation is corrected
+    upward after the fact; later callers then wait for the debt to refill.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def clip(self, amount: float) -> float:
+        """What `acquire(amount)` actually takes: at most the bucket's capacity"""
+        return min(amount, self.capacity)
+
+    async def acquire(self, amount: float) -> float:
+        """
+        Wait until `amount` is available and take it
+
+        Waiters are served in arrival order. Amounts larger than the bucket
+        are clipped to its capacity (see `clip`) so they can still proceed.
+
+        Returns:
+            Seconds spent waiting
+        """
+        amount = self.clip(amount)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return waited
+                delay = (amount - self.level) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def take(self, amount: float):
+        """Adjust the level without waiting (negative amounts give tokens back)"""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class AIMDConcurrency:
+    """
+    Concurrency limit adjusted by additive increase / multiplicative decrease
+
+    Every request that completes normally while the limit is saturated grows
+    the limit by 1/limit (about +1 per round of requests). A 429, an overload
+    error or a latency spike multiplies it by `backoff_factor`, at most once
+    per round: only requests started after the last decrease can trigger
+    another one.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, backoff_factor: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff_factor = backoff_factor
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """Wait for a free slot; returns the time the slot was granted"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started: float, congested: bool):
+        """
+        Free a slot and adapt the limit
+
+        Args:
+            started: Value returned by the matching `acquire`
+            congested: True if the request signalled overload
+        """
+        async with self._condition:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+
+            if congested:
+                if started >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.backoff_factor)
+                    self._last_decrease = time.monotonic()
+            elif saturated:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self._condition.notify_all()
+
+
+class Permit:
+    """One admitted request; the caller reports how it went before releasing"""
+
+    def __init__(self, model: str, reserved_tokens: float, track_latency: bool):
+        self.model = model
+        # Taken from the TPM bucket at admission (the estimate, clipped to the bucket)
+        self.reserved_tokens = reserved_tokens
+        self.track_latency = track_latency
+        self.tokens_used: int | None = None
+        self.throttled = False
+        self.overloaded = False
+        self.retry_after: float | None = None
+
+
+class RateLimiter:
+    """
+    Shared admission control for every Fireworks request
+
+    A request passes the requests/minute and tokens/minute buckets, then
+    waits for an AIMD concurrency slot. The limiter learns per-model latency
+    (EWMA) so that a response much slower than usual counts as congestion,
+    and a 429 pauses all new requests for the server's Retry-After.
+    """
+
+    def __init__(self):
+        self.requests = TokenBucket(settings.fireworks_rpm_limit) if settings.fireworks_rpm_limit else None
+        self.tokens = TokenBucket(settings.fireworks_tpm_limit) if settings.fireworks_tpm_limit else None
+        self.concurrency = AIMDConcurrency(
+            settings.fireworks_initial_concurrency,
+            settings.fireworks_min_concurrency,
+            settings.fireworks_max_concurrency
+        )
+        self._latency: dict[str, tuple[float, int]] = {}
+        self._paused_until = 0.0
+
+        self.admitted = 0
+        self.throttled = 0
+        self.overloaded = 0
+        self.latency_spikes = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+
+    def pause(self, seconds: float):
+        """Hold back new requests for `seconds` (e.g. a 429's Retry-After)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _latency_spike(self, model: str, elapsed: float) -> bool:
+        """Update the model's latency EWMA; True if `elapsed` is far above it"""
+        average, samples = self._latency.get(model, (elapsed, 0))
+        spike = samples >= LATENCY_WARMUP and elapsed > average * settings.fireworks_latency_spike_factor
+        if not spike:
+            # Spikes are kept out of the baseline so it tracks normal latency
+            average = elapsed if samples == 0 else 0.8 * average + 0.2 * elapsed
+            self._latency[model] = (average, samples + 1)
+        return spike
+
+    @asynccontextmanager
+    async def permit(self, model: str, estimated_tokens: int, track_latency: bool = True) -> AsyncIterator[Permit]:
+        """
+        Admit one request
+
+        Args:
+            model: Model name (latency baselines are kept per model)
+            estimated_tokens: Tokens reserved from the TPM bucket up front
+            track_latency: Whether the request duration is a congestion signal
+                (False for streamed responses)
+
+        Yields:
+            Permit on which the caller records `tokens_used`, `throttled`,
+            `overloaded` and `retry_after`
+        """
+        waited = 0.0
+        reserved = 0.0
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+            waited += pause
+        if self.requests is not None:
+            waited += await self.requests.acquire(1)
+        if self.tokens is not None:
+            reserved = self.tokens.clip(estimated_tokens)
+            waited += await self.tokens.acquire(reserved)
+
+        wait_started = time.monotonic()
+        started = await self.concurrency.acquire()
+        waited += started - wait_started
+        self.wait_seconds += waited
+        self.admitted += 1
+
+        permit = Permit(model, reserved, track_latency)
+        failed = True
+        try:
+            yield permit
+            failed = False
+        finally:
+            elapsed = time.monotonic() - started
+            congested = permit.throttled or permit.overloaded
+            if permit.throttled:
+                self.throttled += 1
+                if permit.retry_after:
+                    self.pause(permit.retry_after)
+            elif permit.overloaded:
+                self.overloaded += 1
+            elif not failed and permit.track_latency and self._latency_spike(model, elapsed):
+                self.latency_spikes += 1
+                congested = True
+
+            if self.tokens is not None and permit.tokens_used is not None:
+                self.tokens.take(permit.tokens_used - permit.reserved_tokens)
+
+            await self.concurrency.release(started, congested)
+
+    def stats(self) -> dict:
+        """Limiter state and counters, for /metrics"""
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "rpm_available": round(self.requests.level, 1) if self.requests else None,
+            "tpm_available": round(self.tokens.level) if self.tokens else None,
+            "admitted": self.admitted,
+            "throttled": self.throttled,
+            "overloaded": self.overloaded,
+            "latency_spikes": self.latency_spikes,
+            "retries": self.retries,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "latency_ms": {model: round(average * 1000, 1) for model, (average, _) in self._latency.items()},
+        }
+
+
+# Global limiter instance (shared by every FireworksClient)
+_rate_limiter: RateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get or create the shared rate limiter"""
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+
+    return _rate_limiter
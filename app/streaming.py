@@ -0,0 +1,127 @@
+"""Helpers for streaming analyses: incremental findings parser and SSE framing"""
+import json
+
+from pydantic import ValidationError
+
+from app.models import CodeFinding
+
+
+class FindingStreamParser:
+    """
+    Incrementally extract findings from a JSON array that is still being generated.
+
+    Feed the model output as it arrives; every time an element of the
+    top-level array closes it is decoded, validated as a `CodeFinding` and
+    returned. Leading `<think>...</think>` blocks, code fences and prose
+    before the array are skipped. Elements that do not validate are dropped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start: int | None = None
+        self.emitted = 0
+        self.rejected = 0
+
+    def feed(self, fragment: str) -> list[dict]:
+        """
+        Add a fragment of model output
+
+        Returns:
+            Findings completed by this fragment (possibly empty)
+        """
+        self.text += fragment
+        findings = []
+
+        while not self._done:
+            if not self._in_array:
+                if not self._find_array_start():
+                    break
+                continue
+            if self._pos >= len(self.text):
+                break
+
+            finding = self._step(self.text[self._pos])
+            self._pos += 1
+            if finding is not None:
+                findings.append(finding)
+
+        return findings
+
+    @property
+    def complete(self) -> bool:
+        """True once the closing bracket of the findings array has been seen"""
+        return self._done
+
+    def _find_array_start(self) -> bool:
+        start = 0
+        think = self.text.find("<think>")
+        if think != -1:
+            end = self.text.find("</think>", think)
+            if end == -1:
+                return False
+            start = end + len("</think>")
+
+        bracket = self.text.find("[", max(start, self._pos))
+        while bracket != -1:
+            # Only an array of objects (or an empty array) counts, not "[" in prose
+            rest = self.text[bracket + 1:].lstrip()
+            if not rest:
+                self._pos = bracket
+                return False
+            if rest[0] in "{]":
+                self._in_array = True
+                self._pos = bracket + 1
+                return True
+            bracket = self.text.find("[", bracket + 1)
+
+        self._pos = len(self.text)
+        return False
+
+    def _step(self, char: str) -> dict | None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+            return None
+
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            if self._depth == 0 and char == "{":
+                self._object_start = self._pos
+            self._depth += 1
+        elif char in "}]":
+            if self._depth == 0:
+                # Closing bracket of the findings array itself
+                self._done = True
+                return None
+            self._depth -= 1
+            if self._depth == 0 and self._object_start is not None:
+                raw = self.text[self._object_start:self._pos + 1]
+                self._object_start = None
+                return self._decode(raw)
+        return None
+
+    def _decode(self, raw: str) -> dict | None:
+        try:
+            finding = CodeFinding.model_validate(json.loads(raw)).model_dump()
+        except (json.JSONDecodeError, ValidationError):
+            self.rejected += 1
+            print(f"Skipping malformed streamed finding: {raw[:120]}")
+            return None
+        self.emitted += 1
+        return finding
+
+
+def sse_event(event: str, data) -> str:
+    """Frame one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,311 @@
+"""In-process vector search over nec_chunks embeddings"""
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.config import settings
+from app.quantization import decode_embedding, hamming_similarity, quantize_binary, quantize_int8
+
+
+MATRIX_FILE = "nec_chunks.f32"
+CODES_FILE = "nec_chunks.q"
+SCALES_FILE = "nec_chunks.scale"
+META_FILE = "nec_chunks.json"
+
+# int8 rows converted to float32 per step of the candidate pass (the buffer stays in cache)
+SCORE_BLOCK = 256
+
+
+class LocalVectorIndex:
+    """
+    Brute-force cosine search over a memory-mapped float32 matrix.
+
+    Rows are L2-normalized and grouped by `nec_version` at build time, so a
+    version filter is a contiguous slice of the matrix (no copy) and a query
+    is a single matrix-vector product. For the NEC corpus (a few thousand
+    768-d vectors) that answers in well under a millisecond.
+
+    When built with int8 or binary quantization, candidates are ranked on
+    the compact codes and only the top `limit * rescore_factor` rows of
+    the float32 matrix are touched for exact rescoring.
+    """
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        chunks: list[dict],
+        version_ranges: dict[str, tuple[int, int]],
+        quantization: str = "float",
+        codes: np.ndarray | None = None,
+        scales: np.ndarray | None = None,
+        quantized_recall: float | None = None
+    ):
+        self.matrix = matrix
+        self.chunks = chunks
+        self.version_ranges = version_ranges
+        self.articles = np.array([chunk.get("article") or -1 for chunk in chunks], dtype=np.int32)
+        self.quantization = quantization
+        self.codes = codes
+        self.scales = scales
+        self.quantized_recall = quantized_recall
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "LocalVectorIndex":
+        """Memory-map an index written by build_vector_index()"""
+        directory = Path(index_dir)
+        meta = json.loads((directory / META_FILE).read_text())
+        count, dim = meta["count"], meta["dim"]
+
+        if count:
+            matrix = np.memmap(directory / MATRIX_FILE, dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            matrix = np.zeros((0, dim), dtype=np.float32)
+
+        version_ranges = {version: tuple(bounds) for version, bounds in meta["version_ranges"].items()}
+
+        quantization = meta.get("quantization", "float")
+        codes = scales = None
+        if quantization == "int8" and count:
+            codes = np.fromfile(directory / CODES_FILE, dtype=np.int8).reshape(count, dim)
+            scales = np.fromfile(directory / SCALES_FILE, dtype=np.float32)
+        elif quantization == "binary" and count:
+            codes = np.fromfile(directory / CODES_FILE, dtype=np.uint8).reshape(count, -1)
+
+        return cls(matrix, meta["chunks"], version_ranges, quantization, codes, scales,
+                   meta.get("quantized_recall_at_10"))
+
+    def search(
+        self,
+        query_embedding: list[float],
+        limit: int = 10,
+        nec_version: str | None = None,
+        article: int | list[int] | None = None,
+        exact: bool = False
+    ) -> list[dict]:
+        """
+        Top-k cosine search
+
+        Args:
+            query_embedding: Query vector
+            limit: Number of results to return
+            nec_version: Only search chunks of this NEC version
+            article: Only return chunks from this article (or these articles)
+            exact: Skip quantized candidate search and score every row in float32
+
+        Returns:
+            Matching chunks with the same fields and score scale as the
+            Atlas `$vectorSearch` path (score = (1 + cosine) / 2)
+        """
+        start, end = 0, len(self.chunks)
+        if nec_version is not None:
+            if nec_version not in self.version_ranges:
+                return []
+            start, end = self.version_ranges[nec_version]
+        if end <= start:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query /= norm
+
+        quantized = self.codes is not None and not exact
+        if self.quantization == "int8" and quantized:
+            scores = self._int8_scores(start, end, query)
+        elif self.quantization == "binary" and quantized:
+            scores = hamming_similarity(self.codes[start:end], quantize_binary(query)[0]).astype(np.float32)
+        else:
+            scores = self.matrix[start:end] @ query
+
+        if article is not None:
+            wanted = np.atleast_1d(np.asarray(article, dtype=np.int32))
+            scores = np.where(np.isin(self.articles[start:end], wanted), scores, -np.inf)
+
+        if quantized:
+            # Exact float32 rescoring of an oversampled candidate set
+            candidates = self._top(scores, limit * settings.vector_rescore_factor)
+            candidates = candidates[scores[candidates] > -np.inf]
+            exact_scores = np.asarray(self.matrix[start + candidates]) @ query
+            order = np.argsort(-exact_scores)[:limit]
+            rows, scores = candidates[order], exact_scores[order]
+        else:
+            rows = self._top(scores, limit)
+            scores = scores[rows]
+
+        results = []
+        for row, score in zip(rows, scores):
+            if score == -np.inf:
+                break
+            results.append({**self.chunks[start + row], "score": (1.0 + float(score)) / 2.0})
+        return results
+
+    def _int8_scores(self, start: int, end: int, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate cosine scores of rows start:end from their int8 codes
+
+        Codes are widened SCORE_BLOCK rows at a time into one reused float32
+        buffer for a BLAS matrix-vector product. Widening the whole slice at
+        once would allocate a temporary as large as the float32 matrix on
+        every query, and numpy's integer matmul has no BLAS path at all.
+        """
+        scores = np.empty(end - start, dtype=np.float32)
+        buffer = np.empty((min(SCORE_BLOCK, end - start), self.codes.shape[1]), dtype=np.float32)
+        for offset in range(0, end - start, SCORE_BLOCK):
+            block = self.codes[start + offset:min(start + offset + SCORE_BLOCK, end)]
+            rows = len(block)
+            np.copyto(buffer[:rows], block)
+            np.matmul(buffer[:rows], query, out=scores[offset:offset + rows])
+        scores *= self.scales[start:end]
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first"""
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def measure_recall(self, k: int = 10, samples: int = 100) -> float:
+        """
+        Recall@k of the quantized candidate path against full-precision search
+
+        Stored vectors are used as queries. Returns 1.0 for unquantized indexes.
+        """
+        if self.codes is None or len(self.chunks) == 0:
+            return 1.0
+
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(self.chunks), size=min(samples, len(self.chunks)), replace=False)
+        matched = 0
+        total = 0
+        for row in rows:
+            query = np.asarray(self.matrix[row])
+            exact = {chunk["chunk_id"] for chunk in self.search(query, k, exact=True)}
+            approx = {chunk["chunk_id"] for chunk in self.search(query, k)}
+            matched += len(exact & approx)
+            total += len(exact)
+        return matched / total if total else 1.0
+
+
+async def build_vector_index(db, index_dir: str | None = None) -> int:
+    """
+    Write the nec_chunks embeddings to a memory-mappable index
+
+    Files are written next to the target and renamed into place, so a
+    running server never maps a half-written matrix. With int8 or binary
+    `settings.embedding_storage`, compact candidate codes are written too
+    and the recall of the quantized path against full precision is measured
+    and recorded.
+
+    Args:
+        db: Database handle
+        index_dir: Output directory (settings default if None)
+
+    Returns:
+        Number of vectors written
+    """
+    directory = Path(index_dir or settings.vector_index_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    rows: list[tuple[str, int, str, dict, np.ndarray]] = []
+    cursor = db.nec_chunks.find(
+        {},
+        {"_id": 0, "chunk_id": 1, "article": 1, "article_title": 1, "text": 1, "nec_version": 1,
+         "embedding": 1, "embedding_f32": 1}
+    )
+    async for doc in cursor:
+        vector = decode_embedding(doc)
+        doc.pop("embedding", None)
+        doc.pop("embedding_f32", None)
+        if vector is None:
+            continue
+        rows.append((doc.get("nec_version") or "", doc.get("article") or 0, doc.get("chunk_id") or "", doc, vector))
+
+    # Group rows by version so each version is a contiguous slice
+    rows.sort(key=lambda row: row[:3])
+
+    dim = len(rows[0][4]) if rows else 768
+    matrix = np.zeros((len(rows), dim), dtype=np.float32)
+    chunks = []
+    version_ranges: dict[str, list[int]] = {}
+    for i, (version, _, _, doc, vector) in enumerate(rows):
+        matrix[i] = vector
+        chunks.append(doc)
+        bounds = version_ranges.setdefault(version, [i, i])
+        bounds[1] = i + 1
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+
+    quantization = settings.embedding_storage
+    codes = scales = None
+    if quantization == "int8":
+        codes, scales = quantize_int8(matrix)
+    elif quantization == "binary":
+        codes = quantize_binary(matrix)
+
+    quantized_recall = None
+    if codes is not None and len(rows):
+        ranges = {version: tuple(bounds) for version, bounds in version_ranges.items()}
+        quantized_recall = LocalVectorIndex(matrix, chunks, ranges, quantization, codes, scales).measure_recall()
+        print(f"Quantized ({quantization}) candidate search recall@10 vs float32: {quantized_recall:.3f}")
+
+    written = [(matrix, MATRIX_FILE)]
+    if codes is not None:
+        written.append((codes, CODES_FILE))
+    if scales is not None:
+        written.append((scales, SCALES_FILE))
+    for array, name in written:
+        array.tofile(directory / (name + ".tmp"))
+
+    meta_tmp = directory / (META_FILE + ".tmp")
+    meta_tmp.write_text(json.dumps({
+        "count": len(rows),
+        "dim": dim,
+        "model": settings.fireworks_embedding_model,
+        "built_at": datetime.utcnow().isoformat() + "Z",
+        "quantization": quantization,
+        "quantized_recall_at_10": quantized_recall,
+        "version_ranges": version_ranges,
+        "chunks": chunks,
+    }))
+    for _, name in written:
+        os.replace(directory / (name + ".tmp"), directory / name)
+    os.replace(meta_tmp, directory / META_FILE)
+
+    return len(rows)
+
+
+# Global index instance
+_vector_index: LocalVectorIndex | None = None
+
+
+def load_vector_index(index_dir: str | None = None) -> LocalVectorIndex | None:
+    """Load (or reload) the local vector index; returns None if it has not been built"""
+    global _vector_index
+
+    directory = index_dir or settings.vector_index_dir
+    try:
+        _vector_index = LocalVectorIndex.load(directory)
+        print(f"Loaded local vector index: {len(_vector_index)} vectors from {directory} "
+              f"({_vector_index.quantization} candidates"
+              + (f", recall@10 {_vector_index.quantized_recall:.3f}" if _vector_index.quantized_recall is not None else "")
+              + ")")
+    except FileNotFoundError:
+        print(f"Local vector index not found in {directory} (run ingestion with --with-rag)")
+        _vector_index = None
+
+    return _vector_index
+
+
+def get_vector_index() -> LocalVectorIndex | None:
+    """Get the loaded local vector index, if any"""
+    return _vector_index
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""CLI script to audit a directory of drawings - concurrent analyses, NDJSON output, resumable"""
+import asyncio
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.catalog import load_catalog, load_retrieval_indexes
+from app.compliance import ComplianceChecker
+from app.config import settings
+from app.database import connect_to_mongodb, close_mongodb_connection
+from app.drawings import is_pdf, shutdown_render_pool
+from app.fireworks_client import get_fireworks_client, close_fireworks_client
+from app.phash_index import load_phash_index
+
+
+DRAWING_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff", ".pdf"}
+DEFAULT_CONCURRENCY = 8
+QUEUE_SIZE = 64          # Files buffered ahead of the workers
+
+_DONE = object()         # End-of-work marker for the workers
+
+
+def find_drawings(root: Path) -> list[Path]:
+    """All drawing files under `root`, in a stable order"""
+    return sorted(
+        path for path in root.rglob("*")
+        if path.is_file() and path.suffix.lower() in DRAWING_EXTENSIONS
+    )
+
+
+def file_fingerprint(path: Path) -> str:
+    """Size + mtime, so a drawing edited since the last run is audited again"""
+    stat = path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_checkpoint(output_path: Path, retry_errors: bool) -> dict[str, str]:
+    """
+    Read the files already audited from an existing NDJSON output
+
+    The output file doubles as the checkpoint: every record is flushed as
+    soon as its analysis finishes, so an interrupted run loses at most the
+    analyses that were in flight. A torn final line is ignored.
+
+    Returns:
+        Relative path -> fingerprint of every record to skip
+    """
+    done: dict[str, str] = {}
+    if not output_path.exists():
+        return done
+
+    with output_path.open() as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if retry_errors and record.get("status") != "completed":
+                continue
+            done[record["file"]] = record.get("fingerprint")
+    return done
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile (values need not be sorted)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class AuditStats:
+    """Completion counts and per-file latency for the final report"""
+
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.completed = 0
+        self.errors = 0
+        self.latencies: list[float] = []
+        self.started = time.perf_counter()
+
+    def record(self, ok: bool, seconds: float):
+        if ok:
+            self.completed += 1
+        else:
+            self.errors += 1
+        self.latencies.append(seconds)
+
+    def progress(self) -> str:
+        done = self.completed + self.errors
+        return f"[{done}/{self.total - self.skipped}]"
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        processed = self.completed + self.errors
+        rate = processed / elapsed * 60 if elapsed > 0 else 0.0
+        return "\n".join([
+            f"  Files found:      {self.total}",
+            f"  Skipped (done):   {self.skipped}",
+            f"  Completed:        {self.completed}",
+            f"  Errors:           {self.errors}",
+            f"  Wall time:        {elapsed:.1f}s",
+            f"  Throughput:       {rate:.1f} files/min",
+            f"  Latency p50:      {percentile(self.latencies, 50):.1f}s",
+            f"  Latency p95:      {percentile(self.latencies, 95):.1f}s",
+            f"  Latency p99:      {percentile(self.latencies, 99):.1f}s",
+            f"  Latency max:      {max(self.latencies, default=0.0):.1f}s",
+        ])
+
+
+async def audit_file(checker: ComplianceChecker, root: Path, path: Path, nec_version: str) -> dict:
+    """Analyze one drawing and build its NDJSON record"""
+    relative = str(path.relative_to(root))
+    fingerprint = file_fingerprint(path)
+    analysis_id = str(uuid.uuid4())
+    started = time.perf_counter()
+
+    try:
+        data = await asyncio.to_thread(path.read_bytes)
+        if is_pdf(data, filename=path.name):
+            result = await checker.analyze_drawing_set(
+                analysis_id=analysis_id,
+                pdf_bytes=data,
+                nec_version=nec_version,
+                persist_in_background=False
+            )
+        else:
+            result = await checker.analyze_and_check(
+                analysis_id=analysis_id,
+                image_bytes=data,
+                nec_version=nec_version,
+                persist_in_background=False
+            )
+        record = {"status": "completed", "result": result}
+    except Exception as e:
+        record = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    return {
+        "file": relative,
+        "fingerprint": fingerprint,
+        "analysis_id": analysis_id,
+        "audited_at": datetime.utcnow().isoformat() + "Z",
+        "seconds": round(time.perf_counter() - started, 2),
+        **record,
+    }
+
+
+async def bulk_audit(
+    directory: str,
+    output: str,
+    nec_version: str = "2023",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retry_errors: bool = False
+):
+    """
+    Audit every drawing under a directory
+
+    Args:
+        directory: Root directory to walk (images and PDF drawing sets)
+        output: NDJSON file to append results to (also the resume checkpoint)
+        nec_version: NEC version to check against
+        concurrency: Maximum analyses in flight
+        retry_errors: Re-run files whose previous record is an error
+    """
+    root = Path(directory).resolve()
+    output_path = Path(output)
+
+    files = find_drawings(root)
+    done = load_checkpoint(output_path, retry_errors)
+    pending = [
+        path for path in files
+        if done.get(str(path.relative_to(root))) != file_fingerprint(path)
+    ]
+    stats = AuditStats(total=len(files), skipped=len(files) - len(pending))
+
+    print(f"\n{'='*60}")
+    print(f"Bulk NEC audit: {root}")
+    print(f"{'='*60}")
+    print(f"  Drawings found: {len(files)} ({stats.skipped} already audited, {len(pending)} to go)")
+    print(f"  NEC version:    {nec_version}")
+    print(f"  Concurrency:    {concurrency}")
+    print(f"  Output:         {output_path}")
+
+    if not pending:
+        print("\nNothing to do.")
+        return
+
+    await connect_to_mongodb()
+    await load_retrieval_indexes()
+    if settings.phash_reuse_enabled:
+        await load_phash_index()
+    await load_catalog()
+
+    checker = ComplianceChecker(get_fireworks_client())
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    try:
+        with output_path.open("a") as out:
+            async def _worker():
+                while True:
+                    path = await queue.get()
+                    if path is _DONE:
+                        return
+                    record = await audit_file(checker, root, path, nec_version)
+                    # One complete line per record, flushed immediately (the checkpoint)
+                    out.write(json.dumps(record, default=str) + "\n")
+                    out.flush()
+                    stats.record(record["status"] == "completed", record["seconds"])
+                    status = record["status"] if record["status"] == "completed" else record["error"]
+                    print(f"{stats.progress()} {record['file']}: {status} ({record['seconds']}s)")
+
+            async def _producer():
+                for path in pending:
+                    await queue.put(path)
+                for _ in range(concurrency):
+                    await queue.put(_DONE)
+
+            await asyncio.gather(_producer(), *(_worker() for _ in range(concurrency)))
+
+        print(f"\n{'='*60}")
+        print("Audit complete")
+        print(f"{'='*60}")
+        print(stats.report())
+        print(f"{'='*60}\n")
+
+    finally:
+        await close_fireworks_client()
+        await close_mongodb_connection()
+        shutdown_render_pool()
+
+
+def main():
+    """Main entry point"""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if len(args) < 2:
+        print("Usage:")
+        print("  python scripts/bulk_audit.py <directory> <output.ndjson> [nec_version] [options]")
+        print()
+        print("Examples:")
+        print("  python scripts/bulk_audit.py ~/archive/drawings audit.ndjson")
+        print("  python scripts/bulk_audit.py ~/archive/drawings audit.ndjson 2023 --concurrency=16")
+        print()
+        print("Options:")
+        print(f"  --concurrency=N   Analyses in flight (default {DEFAULT_CONCURRENCY})")
+        print("  --retry-errors    Re-run files whose previous result was an error")
+        print()
+        print("Re-running with the same output file resumes: files already in it")
+        print("(and unchanged since) are skipped.")
+        sys.exit(1)
+
+    directory, output = args[0], args[1]
+    nec_version = args[2] if len(args) > 2 else "2023"
+    concurrency = DEFAULT_CONCURRENCY
+    retry_errors = False
+
+    for arg in sys.argv[1:]:
+        if arg.startswith("--concurrency="):
+            concurrency = int(arg.split("=", 1)[1])
+        elif arg == "--retry-errors":
+            retry_errors = True
+
+    # Validate directory exists
+    if not Path(directory).is_dir():
+        print(f"Error: Directory not found: {directory}")
+        sys.exit(1)
+
+    asyncio.run(bulk_audit(directory, output, nec_version, concurrency, retry_errors))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,157 +1,489 @@
 #!/usr/bin/env python3
 """CLI script to ingest NEC PDF - stores sections with categories + full articles + optional RAG chunks"""
 import asyncio
+import hashlib
 import sys
+import time
 from pathlib import Path
 
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.pdf_parser import NECPDFParser, chunk_text_for_rag
-from app.database import connect_to_mongodb, close_mongodb_connection, get_database
-from app.fireworks_client import get_fireworks_client
+from app.pdf_parser import NECArticle, NECPDFParser, chunk_text_for_rag
+from app.database import bump_corpus_version, connect_to_mongodb, close_mongodb_connection, get_database
+from app.fireworks_client import get_fireworks_client, close_fireworks_client
+from app.cache import invalidate_result_cache
+from app.config import settings
+from app.vector_index import build_vector_index
+from app.bm25_index import build_bm25_index
+from app.hnsw_index import update_hnsw_index
+from app.quantization import EMBEDDING_FIELDS, encode_embedding_fields
+
+
+# Pipeline tuning
+QUEUE_SIZE = 2000        # Max items buffered between two stages (backpressure)
+WRITE_BATCH = 500        # Upserts per bulk_write
+EMBEDDING_BATCH = 64     # Chunks per embedding request
+EMBEDDING_WORKERS = 4    # Embedding requests in flight
+
+_DONE = object()         # End-of-stream marker passed between stages
+
+
+class StageStats:
+    """Item count and busy time for one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def report(self) -> str:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rate = self.items / elapsed if elapsed > 0 else 0.0
+        return (f"  {self.name:<20} {self.items:>7} items  {elapsed:7.1f}s wall  "
+                f"{self.busy:7.1f}s busy  {rate:8.1f} items/s")
+
+
+def content_hash(*parts) -> str:
+    """SHA-256 over whitespace-normalized text, used to detect unchanged documents"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(" ".join(str(part).split()).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ChangeTracker:
+    """Classifies parsed documents against the content hashes already stored"""
+
+    def __init__(self, collection, key_field: str, nec_version: str, force: bool = False):
+        self.collection = collection
+        self.key_field = key_field
+        self.nec_version = nec_version
+        self.force = force
+        self.stored: dict = {}
+        self.current: dict = {}
+        self.dirty: set = set()
+        self.orphans: list = []
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.failed = 0
+        # How each key was counted on its first classification
+        self._counted: dict = {}
+
+    async def load(self):
+        """Read the stored key -> content_hash map for this NEC version"""
+        cursor = self.collection.find(
+            {"nec_version": self.nec_version},
+            {"_id": 0, self.key_field: 1, "content_hash": 1}
+        )
+        async for doc in cursor:
+            self.stored[doc[self.key_field]] = doc.get("content_hash")
+
+    def classify(self, key, digest: str) -> bool:
+        """Record a parsed document; returns True if it has to be (re)written"""
+        if key in self.current:
+            # Duplicate key within this run: the last occurrence wins, as with the upserts
+            needs_write = self.current[key] != digest
+        else:
+            previous = self.stored.get(key)
+            needs_write = self.force or previous != digest
+            if key not in self.stored:
+                self.added += 1
+                self._counted[key] = "added"
+            elif needs_write:
+                self.changed += 1
+                self._counted[key] = "changed"
+            else:
+                self.unchanged += 1
+                self._counted[key] = "unchanged"
+
+        self.current[key] = digest
+        if needs_write:
+            self.dirty.add(key)
+        return needs_write
+
+    def discard(self, keys):
+        """
+        Undo the classification of documents whose write failed
+
+        They are no longer counted as added/changed or marked dirty, and the
+        stored content hash is left as it was, so the next run retries them.
+        Keys stay in `current`, so a previously stored version is not deleted
+        as an orphan.
+        """
+        for key in keys:
+            if key not in self.dirty:
+                continue
+            self.dirty.discard(key)
+            self.failed += 1
+            counted = self._counted.get(key)
+            if counted == "added":
+                self.added -= 1
+            elif counted == "changed":
+                self.changed -= 1
+            self._counted[key] = "failed"
+
+    async def delete_orphans(self):
+        """Delete stored documents that no longer appear in the PDF"""
+        self.orphans = [key for key in self.stored if key not in self.current]
+        if self.orphans:
+            await self.collection.delete_many({
+                self.key_field: {"$in": self.orphans},
+                "nec_version": self.nec_version
+            })
+        self.removed = len(self.orphans)
+
+    @property
+    def modified(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    def report(self) -> str:
+        return (f"  {self.collection.name:<14} added {self.added:>6}  changed {self.changed:>6}  "
+                f"unchanged {self.unchanged:>6}  removed {self.removed:>6}  failed {self.failed:>6}")
+
+
+async def parse_stage(
+    parser: NECPDFParser,
+    pdf_path: str,
+    nec_version: str,
+    trackers: dict[str, ChangeTracker],
+    sections_out: asyncio.Queue,
+    articles_out: asyncio.Queue,
+    chunks_out: asyncio.Queue | None,
+    stats: StageStats
+):
+    """
+    Parse the PDF once and feed sections, articles and RAG chunks downstream.
+
+    Documents whose content hash matches the stored one are dropped here,
+    so unchanged chunks are never re-embedded or rewritten.
+    """
+
+    async def _drain(iterator, handle):
+        while True:
+            started = time.perf_counter()
+            # Parsing is CPU-bound; keep it off the event loop
+            item = await asyncio.to_thread(next, iterator, _DONE)
+            stats.busy += time.perf_counter() - started
+            if item is _DONE:
+                return
+            await handle(item)
+            stats.items += 1
+
+    async def _section(section):
+        digest = content_hash(section.title, section.full_text)
+        if not trackers["nec_codes"].classify(section.section, digest):
+            return
+
+        await sections_out.put((section.section, UpdateOne(
+            {"section": section.section, "nec_version": nec_version},
+            {"$set": {
+                "section": section.section,
+                "title": section.title,
+                "full_text": section.full_text,
+                "article": section.article,
+                "chapter": section.chapter,
+                "categories": section.categories,
+                "nec_version": nec_version,
+                "content_hash": digest
+            }},
+            upsert=True
+        )))
+
+    async def _article(article):
+        digest = content_hash(article.title, article.full_content)
+        if trackers["nec_full_text"].classify(article.number, digest):
+            await articles_out.put((article.number, UpdateOne(
+                {"article": article.number, "nec_version": nec_version},
+                {"$set": {
+                    "article": article.number,
+                    "article_title": article.title,
+                    "full_content": article.full_content,
+                    "chapter": article.chapter,
+                    "categories": article.categories,
+                    "nec_version": nec_version,
+                    "content_hash": digest
+                }},
+                upsert=True
+            )))
+
+        if chunks_out is None:
+            return
+
+        chunks = chunk_text_for_rag(article.full_content, chunk_size=800, overlap=100)
+        for i, chunk in enumerate(chunks):
+            chunk_id = f"{article.number}_{i}"
+            # Include the embedding model and storage format so switching either
+            # rewrites every chunk
+            chunk_digest = content_hash(
+                settings.fireworks_embedding_model, settings.embedding_storage,
+                article.title, chunk['text']
+            )
+            if not trackers["nec_chunks"].classify(chunk_id, chunk_digest):
+                continue
+
+            await chunks_out.put({
+                "chunk_id": chunk_id,
+                "article": article.number,
+                "article_title": article.title,
+                "text": chunk['text'],
+                "start_pos": chunk['start_pos'],
+                "end_pos": chunk['end_pos'],
+                "nec_version": nec_version,
+                "content_hash": chunk_digest
+            })
+
+    async def _item(item):
+        if isinstance(item, NECArticle):
+            await _article(item)
+        else:
+            await _section(item)
+
+    try:
+        if parser.stream:
+            # One extraction pass; items arrive as soon as their boundaries are known
+            await _drain(parser.stream_document(pdf_path), _item)
+        else:
+            await _drain(iter(parser.parse_sections(pdf_path)), _section)
+            await _drain(iter(parser.parse_articles(pdf_path)), _article)
+    finally:
+        await sections_out.put(_DONE)
+        await articles_out.put(_DONE)
+        if chunks_out is not None:
+            for _ in range(EMBEDDING_WORKERS):
+                await chunks_out.put(_DONE)
+        stats.finish()
+
+
+async def embedding_stage(
+    fireworks,
+    chunks_in: asyncio.Queue,
+    chunks_out: asyncio.Queue,
+    stats: StageStats,
+    tracker: ChangeTracker
+):
+    """Embedding worker: pull chunk batches, embed them, pass upserts to the writer"""
+    done = False
+    while not done:
+        batch = []
+        item = await chunks_in.get()
+        while item is not _DONE:
+            batch.append(item)
+            if len(batch) >= EMBEDDING_BATCH or chunks_in.empty():
+                break
+            item = chunks_in.get_nowait()
+        done = item is _DONE
+
+        if not batch:
+            continue
+
+        started = time.perf_counter()
+        try:
+            embeddings = await fireworks.generate_embeddings(
+                [doc["text"][:2000] for doc in batch],
+                batch_size=EMBEDDING_BATCH,
+                concurrency=1
+            )
+        except Exception as e:
+            print(f"  ERROR embedding {len(batch)} chunks ({batch[0]['chunk_id']}...): {e}")
+            stats.errors += len(batch)
+            tracker.discard(doc["chunk_id"] for doc in batch)
+            continue
+        finally:
+            stats.busy += time.perf_counter() - started
+
+        for doc, embedding in zip(batch, embeddings):
+            fields = encode_embedding_fields(embedding)
+            await chunks_out.put((doc["chunk_id"], UpdateOne(
+                {"chunk_id": doc["chunk_id"], "nec_version": doc["nec_version"]},
+                {
+                    "$set": {**doc, **fields},
+                    # Drop fields left behind by a previous storage format
+                    "$unset": {field: "" for field in EMBEDDING_FIELDS if field not in fields}
+                },
+                upsert=True
+            )))
+        stats.items += len(batch)
+
+
+async def writer_stage(collection, ops_in: asyncio.Queue, stats: StageStats, tracker: ChangeTracker):
+    """
+    Flush queued (key, upsert) pairs to a collection with unordered bulk writes.
 
+    Unordered batches give no ordering guarantee, so a repeated key within
+    a batch is collapsed to its last upsert before flushing. Keys whose
+    write fails are discarded from the tracker.
+    """
 
-async def ingest_nec_pdf(pdf_path: str, nec_version: str = "2023", with_rag: bool = False):
+    async def _flush(batch: dict):
+        keys, ops = list(batch.keys()), list(batch.values())
+        started = time.perf_counter()
+        try:
+            result = await collection.bulk_write(ops, ordered=False)
+            stats.items += result.upserted_count + result.matched_count
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            stats.items += len(ops) - len(write_errors)
+            stats.errors += len(write_errors)
+            tracker.discard(keys[error["index"]] for error in write_errors)
+            print(f"  ERROR writing {len(write_errors)} documents to {collection.name}")
+        finally:
+            stats.busy += time.perf_counter() - started
+
+    ops = {}
+    while True:
+        item = await ops_in.get()
+        if item is _DONE:
+            break
+        key, op = item
+        ops[key] = op
+        # Flush on a full batch, or early when the producer is the bottleneck
+        if len(ops) >= WRITE_BATCH or (ops_in.empty() and len(ops) >= WRITE_BATCH // 10):
+            await _flush(ops)
+            ops = {}
+
+    if ops:
+        await _flush(ops)
+    stats.finish()
+
+
+async def ingest_nec_pdf(
+    pdf_path: str,
+    nec_version: str = "2023",
+    with_rag: bool = False,
+    workers: int | None = None,
+    force: bool = False,
+    hnsw: bool = False
+):
     """
     Ingest NEC PDF and store:
     1. Individual sections with article and categories (nec_codes collection)
     2. Full article text (nec_full_text collection)
     3. (Optional) RAG chunks with embeddings (nec_chunks collection)
 
+    The work runs as a staged pipeline connected by bounded queues:
+    parse -> [embed workers] -> bulk writers, so total time is bounded
+    by the slowest stage rather than the sum of all of them.
+
+    Ingestion is incremental: every document carries a content hash of its
+    normalized text, unchanged documents are skipped (and not re-embedded),
+    and documents that no longer appear in the PDF are deleted.
+
     Args:
         pdf_path: Path to NEC PDF file
         nec_version: NEC version year
         with_rag: If True, also generate embeddings for RAG chunks
+        workers: Processes for PDF-to-markdown conversion (settings default if None)
+        force: Rewrite (and re-embed) every document even if its hash is unchanged
+        hnsw: Also update the HNSW graph index (implied by RAG_BACKEND=hnsw)
     """
+    workers = workers or settings.pdf_parse_workers
+
     print(f"Starting NEC PDF ingestion: {pdf_path}")
     print(f"NEC Version: {nec_version}")
     print(f"RAG Embeddings: {'ENABLED' if with_rag else 'disabled'}")
+    print(f"PDF workers: {workers}")
     print("=" * 60)
 
     # Connect to database
     await connect_to_mongodb()
 
     try:
-        # Initialize parser
-        parser = NECPDFParser()
+        # Initialize parser (page-streaming keeps memory flat on the full code book)
+        parser = NECPDFParser(stream=True, workers=workers)
         db = get_database()
+        started = time.perf_counter()
+
+        trackers = {
+            "nec_codes": ChangeTracker(db.nec_codes, "section", nec_version, force),
+            "nec_full_text": ChangeTracker(db.nec_full_text, "article", nec_version, force),
+            "nec_chunks": ChangeTracker(db.nec_chunks, "chunk_id", nec_version, force),
+        }
+        active_trackers = [trackers["nec_codes"], trackers["nec_full_text"]]
+        if with_rag:
+            active_trackers.append(trackers["nec_chunks"])
+        for tracker in active_trackers:
+            await tracker.load()
+
+        print("\nRunning ingestion pipeline...")
+
+        sections_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        articles_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        chunks_queue = asyncio.Queue(maxsize=QUEUE_SIZE) if with_rag else None
+        embedded_queue = asyncio.Queue(maxsize=QUEUE_SIZE) if with_rag else None
+
+        parse_stats = StageStats("parse")
+        sections_stats = StageStats("write nec_codes")
+        articles_stats = StageStats("write nec_full_text")
+        embed_stats = StageStats("embed chunks")
+        chunks_stats = StageStats("write nec_chunks")
+
+        stages = [
+            parse_stage(parser, pdf_path, nec_version, trackers,
+                        sections_queue, articles_queue, chunks_queue, parse_stats),
+            writer_stage(db.nec_codes, sections_queue, sections_stats, trackers["nec_codes"]),
+            writer_stage(db.nec_full_text, articles_queue, articles_stats, trackers["nec_full_text"]),
+        ]
 
-        sections_processed = 0
-        articles_processed = 0
-        errors = 0
-
-        # Step 1: Parse and store individual sections with categories
-        print("\n[Step 1/2] Parsing individual code sections...")
-
-        for section in parser.parse_sections(pdf_path):
-            try:
-                print(f"  Section {section.section}: {section.title[:40]}... (Article {section.article})")
-
-                # Store in database (upsert) - NO EMBEDDINGS
-                await db.nec_codes.update_one(
-                    {"section": section.section, "nec_version": nec_version},
-                    {
-                        "$set": {
-                            "section": section.section,
-                            "title": section.title,
-                            "full_text": section.full_text,
-                            "article": section.article,
-                            "chapter": section.chapter,
-                            "categories": section.categories,
-                            "nec_version": nec_version
-                        }
-                    },
-                    upsert=True
-                )
-
-                sections_processed += 1
-
-                if sections_processed % 20 == 0:
-                    print(f"    [{sections_processed} sections processed]")
-
-            except Exception as e:
-                print(f"  ERROR processing section {section.section}: {e}")
-                errors += 1
-
-        # Step 2: Parse and store full articles
-        print(f"\n[Step 2/2] Parsing full articles...")
-
-        for article in parser.parse_articles(pdf_path):
-            try:
-                print(f"  Article {article.number}: {article.title[:40]}... ({len(article.full_content)} chars)")
-
-                # Store in database (upsert)
-                await db.nec_full_text.update_one(
-                    {"article": article.number, "nec_version": nec_version},
-                    {
-                        "$set": {
-                            "article": article.number,
-                            "article_title": article.title,
-                            "full_content": article.full_content,
-                            "chapter": article.chapter,
-                            "categories": article.categories,
-                            "nec_version": nec_version
-                        }
-                    },
-                    upsert=True
-                )
-
-                articles_processed += 1
-
-            except Exception as e:
-                print(f"  ERROR processing article {article.number}: {e}")
-                errors += 1
-
-        # Step 3: RAG chunks with embeddings (optional)
-        chunks_processed = 0
         if with_rag:
-            print(f"\n[Step 3/3] Generating RAG chunks with embeddings...")
             fireworks = get_fireworks_client()
 
-            # Re-parse articles for chunking
-            for article in parser.parse_articles(pdf_path):
-                try:
-                    # Chunk the article content
-                    chunks = chunk_text_for_rag(
-                        article.full_content,
-                        chunk_size=800,
-                        overlap=100
-                    )
-
-                    for i, chunk in enumerate(chunks):
-                        chunk_id = f"{article.number}_{i}"
-
-                        # Generate embedding
-                        embedding = await fireworks.generate_embedding(chunk['text'][:2000])
-
-                        # Store in database
-                        await db.nec_chunks.update_one(
-                            {"chunk_id": chunk_id, "nec_version": nec_version},
-                            {
-                                "$set": {
-                                    "chunk_id": chunk_id,
-                                    "article": article.number,
-                                    "article_title": article.title,
-                                    "text": chunk['text'],
-                                    "embedding": embedding,
-                                    "start_pos": chunk['start_pos'],
-                                    "end_pos": chunk['end_pos'],
-                                    "nec_version": nec_version
-                                }
-                            },
-                            upsert=True
-                        )
-                        chunks_processed += 1
-
-                        if chunks_processed % 50 == 0:
-                            print(f"    [{chunks_processed} chunks processed]")
-
-                except Exception as e:
-                    print(f"  ERROR chunking article {article.number}: {e}")
-                    errors += 1
-
-            print(f"    Total RAG chunks: {chunks_processed}")
+            async def _embed_all():
+                await asyncio.gather(*(
+                    embedding_stage(fireworks, chunks_queue, embedded_queue, embed_stats, trackers["nec_chunks"])
+                    for _ in range(EMBEDDING_WORKERS)
+                ))
+                embed_stats.finish()
+                await embedded_queue.put(_DONE)
+
+            stages.append(_embed_all())
+            stages.append(writer_stage(db.nec_chunks, embedded_queue, chunks_stats, trackers["nec_chunks"]))
+
+        await asyncio.gather(*stages)
+
+        sections_processed = sections_stats.items
+        articles_processed = articles_stats.items
+        chunks_processed = chunks_stats.items
+        errors = sum(s.errors for s in (sections_stats, articles_stats, embed_stats, chunks_stats))
+
+        print(f"\nStage throughput ({time.perf_counter() - started:.1f}s total):")
+        for stats in [parse_stats, sections_stats, articles_stats] + (
+                [embed_stats, chunks_stats] if with_rag else []):
+            print(stats.report())
+
+        # Only reached when parsing finished, so missing keys really are gone from the PDF
+        for tracker in active_trackers:
+            await tracker.delete_orphans()
+
+        if with_rag:
+            # Local vector search backend (RAG_BACKEND=local) maps this file at startup
+            vectors = await build_vector_index(db)
+            print(f"\nWrote local vector index: {vectors} vectors -> {settings.vector_index_dir}")
+
+        # Keyword index for hybrid retrieval (RETRIEVAL_MODE=hybrid) over sections and chunks
+        bm25 = await build_bm25_index(db)
+        print(f"Wrote BM25 index: {len(bm25)} documents, {len(bm25.vocabulary)} terms -> {settings.bm25_index_dir}")
+
+        if with_rag and (hnsw or settings.rag_backend == "hnsw"):
+            chunk_tracker = trackers["nec_chunks"]
+            index = await update_hnsw_index(
+                db, nec_version, chunk_tracker.dirty | set(chunk_tracker.orphans)
+            )
+            recall = await asyncio.to_thread(index.recall_at_k, nec_version)
+            print(f"HNSW index: {len(index)} vectors -> {settings.hnsw_index_dir} "
+                  f"(estimated recall@10 {recall:.3f} at ef={settings.hnsw_ef_search})")
 
         # Create indexes
         print("\n[Creating indexes...]")
@@ -169,15 +501,25 @@ async def ingest_nec_pdf(pdf_path: str, nec_version: str = "2023", with_rag: boo
         else:
             print("  Indexes created on article, categories, nec_version")
 
+        # Cached analyses were produced against the old corpus
+        if any(tracker.modified for tracker in active_trackers):
+            await invalidate_result_cache(nec_version)
+            # Running servers reload their in-memory NEC catalog on the next stamp check
+            corpus_version = await bump_corpus_version(db)
+            print(f"  Corpus version stamp -> {corpus_version}")
+
         # Summary
         print(f"\n{'='*60}")
         print("INGESTION COMPLETE!")
         print(f"{'='*60}")
-        print(f"  Sections processed: {sections_processed}")
-        print(f"  Full articles processed: {articles_processed}")
+        print(f"  Sections written: {sections_processed}")
+        print(f"  Full articles written: {articles_processed}")
         if with_rag:
-            print(f"  RAG chunks processed: {chunks_processed}")
+            print(f"  RAG chunks written: {chunks_processed}")
         print(f"  Errors: {errors}")
+        print(f"\nChanges by collection:")
+        for tracker in active_trackers:
+            print(tracker.report())
         print(f"\nCollections updated:")
         print(f"  - nec_codes: Individual sections with article/categories")
         print(f"  - nec_full_text: Full article text")
@@ -188,6 +530,7 @@ async def ingest_nec_pdf(pdf_path: str, nec_version: str = "2023", with_rag: boo
         print(f"{'='*60}\n")
 
     finally:
+        await close_fireworks_client()
         await close_mongodb_connection()
 
 
@@ -219,13 +562,69 @@ async def show_stats():
             print("\nSample RAG chunks:")
             async for chunk in db.nec_chunks.find().limit(3):
                 text_preview = chunk.get('text', '')[:60] + "..."
-                has_embedding = "embedding" in chunk and len(chunk.get("embedding", [])) > 0
+                has_embedding = bool(chunk.get("embedding")) or chunk.get("embedding_f32") is not None
                 print(f"  {chunk.get('chunk_id')}: {text_preview} (embedding: {has_embedding})")
 
     finally:
         await close_mongodb_connection()
 
 
+def check_parse(pdf_path: str, workers: int | None = None) -> bool:
+    """
+    Verify that windowed conversion reproduces the serial parse exactly
+
+    Compares the parallel markdown with the serial markdown, and the
+    sections and articles of the streaming parse (the ingest default) with
+    parse_sections() / parse_articles(). Content hashes are computed from
+    this text, so any difference would make change tracking depend on the
+    ingest mode.
+
+    Returns:
+        True if everything is identical
+    """
+    workers = max(2, workers or settings.pdf_parse_workers)
+    serial_parser = NECPDFParser()
+    serial = serial_parser._load_pdf(pdf_path)
+    parallel = "".join(NECPDFParser(workers=workers)._convert_parallel(pdf_path))
+
+    ok = True
+    if serial == parallel:
+        print(f"Parallel markdown ({workers} workers) matches serial: {len(serial)} chars")
+    else:
+        ok = False
+        position = next(
+            (i for i, (a, b) in enumerate(zip(serial, parallel)) if a != b),
+            min(len(serial), len(parallel))
+        )
+        print(f"MISMATCH: serial {len(serial)} chars, parallel {len(parallel)} chars, first difference at {position}:")
+        print(f"  serial:   {serial[max(0, position - 40):position + 40]!r}")
+        print(f"  parallel: {parallel[max(0, position - 40):position + 40]!r}")
+
+    expected = [
+        ("section", item.section, item.title, item.full_text) for item in serial_parser.parse_sections(pdf_path)
+    ] + [
+        ("article", item.number, item.title, item.full_content) for item in serial_parser.parse_articles(pdf_path)
+    ]
+    streamed = [
+        ("article", item.number, item.title, item.full_content) if isinstance(item, NECArticle)
+        else ("section", item.section, item.title, item.full_text)
+        for item in NECPDFParser(stream=True, workers=workers).stream_document(pdf_path)
+    ]
+    # Streaming interleaves sections and articles in document order
+    streamed = [item for item in streamed if item[0] == "section"] + [item for item in streamed if item[0] == "article"]
+
+    if streamed == expected:
+        print(f"Streaming parse matches serial: {len(expected)} sections and articles")
+    else:
+        ok = False
+        index = next((i for i, (a, b) in enumerate(zip(expected, streamed)) if a != b), min(len(expected), len(streamed)))
+        print(f"MISMATCH: serial {len(expected)} items, streamed {len(streamed)} items, first difference at item {index}:")
+        print(f"  serial:   {expected[index][:3] if index < len(expected) else None}")
+        print(f"  streamed: {streamed[index][:3] if index < len(streamed) else None}")
+
+    return ok
+
+
 def main():
     """Main entry point"""
     if len(sys.argv) < 2:
@@ -240,6 +639,10 @@ def main():
         print()
         print("Options:")
         print("  --with-rag    Generate embeddings for RAG (semantic search)")
+        print("  --workers=N   Processes for PDF-to-markdown conversion")
+        print("  --force       Rewrite and re-embed documents even if unchanged")
+        print("  --hnsw        Update the HNSW ANN index (with --with-rag)")
+        print("  --check-parse Only verify parallel / streaming PDF parsing against serial (nothing is written)")
         sys.exit(1)
 
     if sys.argv[1] == "--stats":
@@ -251,10 +654,22 @@ def main():
     # Parse arguments
     nec_version = "2023"
     with_rag = False
+    workers = None
+    force = False
+    hnsw = False
+    check = False
 
     for arg in sys.argv[2:]:
         if arg == "--with-rag":
             with_rag = True
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+        elif arg == "--force":
+            force = True
+        elif arg == "--hnsw":
+            hnsw = True
+        elif arg == "--check-parse":
+            check = True
         elif not arg.startswith("--"):
             nec_version = arg
 
@@ -263,8 +678,11 @@ def main():
         print(f"Error: File not found: {pdf_path}")
         sys.exit(1)
 
+    if check:
+        sys.exit(0 if check_parse(pdf_path, workers) else 1)
+
     # Run ingestion
-    asyncio.run(ingest_nec_pdf(pdf_path, nec_version, with_rag))
+    asyncio.run(ingest_nec_pdf(pdf_path, nec_version, with_rag, workers, force, hnsw))
 
 
 if __name__ == "__main__":